@@ -0,0 +1,236 @@
+import os
+import zlib
+from typing import Optional
+
+from prometheus_client import Counter
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bytes saved are input - output, a flushed chunk of a stream can come out larger
+# than it went in so savings are not counted directly.
+COMPRESSION_INPUT_BYTES = Counter(
+    "response_compression_input_bytes",
+    "Bytes of response bodies before compression",
+    ["encoding"],
+)
+COMPRESSION_OUTPUT_BYTES = Counter(
+    "response_compression_output_bytes",
+    "Bytes of response bodies after compression",
+    ["encoding"],
+)
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, level: int):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# Encoders by Accept-Encoding token with their default level, fast levels are
+# picked since the JSON is compressed on every request.
+ENCODERS = {"gzip": (GzipEncoder, 6)}
+if brotli:
+    ENCODERS["br"] = (BrotliEncoder, 4)
+if zstandard:
+    ENCODERS["zstd"] = (ZstdEncoder, 3)
+
+
+def acceptedEncodings(header: str) -> set[str]:
+    accepted = set()
+
+    for part in header.split(","):
+        encoding, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+
+        accepted.add(encoding.strip().lower())
+
+    return accepted
+
+
+# Compresses response bodies with the first of `encodings` the client accepts.
+#
+# Complete bodies under `minimumSize` bytes go out as they are. Streamed bodies,
+# e.g. NDJSON, are compressed chunk by chunk and flushed after every chunk so the
+# client can decode each record as soon as it arrives. Every response of a
+# compressible type varies on Accept-Encoding, compressed or not, so a cache
+# never hands a compressed body to a client that didn't ask for one or the other
+# way around.
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        encodings: Optional[list[str]] = None,
+        minimumSize: Optional[int] = None,
+        contentTypes: Optional[list[str]] = None,
+    ):
+        self.app = app
+        self.encodings = [
+            encoding
+            for encoding in encodings
+            or os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+            if encoding in ENCODERS
+        ]
+        self.minimumSize = (
+            minimumSize
+            if minimumSize is not None
+            else int(os.environ.get("COMPRESSION_MINIMUM_SIZE", 1024))
+        )
+        self.contentTypes = tuple(
+            contentTypes
+            or os.environ.get(
+                "COMPRESSION_CONTENT_TYPES",
+                "application/json,application/x-ndjson,text/",
+            ).split(",")
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = acceptedEncodings(Headers(scope=scope).get("accept-encoding", ""))
+        encoding = next((e for e in self.encodings if e in accepted), None)
+
+        await CompressedResponse(self, encoding, send).run(scope, receive)
+
+
+class CompressedResponse:
+    def __init__(
+        self, middleware: CompressionMiddleware, encoding: Optional[str], send
+    ):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def run(self, scope, receive):
+        await self.middleware.app(scope, receive, self.sendWrapper)
+
+    def compressible(self, headers: MutableHeaders) -> bool:
+        return "content-encoding" not in headers and headers.get(
+            "content-type", ""
+        ).startswith(self.middleware.contentTypes)
+
+    def record(self, size: int, compressedSize: int):
+        COMPRESSION_INPUT_BYTES.labels(self.encoding).inc(size)
+        COMPRESSION_OUTPUT_BYTES.labels(self.encoding).inc(compressedSize)
+
+    def newEncoder(self):
+        encoder, level = ENCODERS[self.encoding]
+        return encoder(level)
+
+    # The compressed body isn't byte for byte the one the ETag was computed for,
+    # it is still the same representation, so the ETag is only weakened. If-Match
+    # accepts weak ETags, see parseIfMatch.
+    def encode(self, headers: MutableHeaders):
+        headers["Content-Encoding"] = self.encoding
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    async def sendWrapper(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = MutableHeaders(raw=message["headers"])
+            compressible = self.compressible(headers)
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            self.passthrough = not compressible or self.encoding is None
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.passthrough:
+            if self.start:
+                await self.send(self.start)
+                self.start = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        moreBody = message.get("more_body", False)
+
+        if self.start is not None:
+            headers = MutableHeaders(raw=self.start["headers"])
+
+            if not moreBody:
+                if len(body) >= self.middleware.minimumSize:
+                    encoder = self.newEncoder()
+                    compressed = encoder.compress(body) + encoder.finish()
+                    self.record(len(body), len(compressed))
+                    body = compressed
+
+                    self.encode(headers)
+                    headers["Content-Length"] = str(len(body))
+
+                await self.send(self.start)
+                await self.send({**message, "body": body})
+                return
+
+            self.encoder = self.newEncoder()
+            self.encode(headers)
+            del headers["Content-Length"]
+
+            await self.send(self.start)
+            self.start = None
+
+        chunk = self.encoder.compress(body)
+        chunk += self.encoder.flush() if moreBody else self.encoder.finish()
+        self.record(len(body), len(chunk))
+
+        await self.send({**message, "body": chunk})
@@ -1,21 +1,500 @@
+import base64
+import copy
+import hashlib
+import hmac
 import os
-from typing import Annotated
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from typing import Annotated, Optional
 
+import bson
 from bson import ObjectId
-from fastapi import Depends, HTTPException, status
-from pymongo import MongoClient, ReturnDocument
+from fastapi import Depends, HTTPException, Request, status
+from prometheus_client import Counter, Gauge
+from pymongo import ASCENDING, TEXT, IndexModel, MongoClient, ReturnDocument
 from pymongo.database import Database
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+
+from api.pagination import bucketedPage, keysetPage
+from api.schemas import (
+    Milestone,
+    Priority,
+    Project,
+    Role,
+    Sprint,
+    Task,
+    TaskSort,
+    User,
+)
+from api.tokens import JWT_SECRET_KEY
+from api.versions import SCHEMA_VERSIONS, upgraded
+
+
+# CLIENT
+# Every option can be overridden from the environment, the defaults fail fast
+# when the database is unreachable instead of hanging requests for 30s.
+def clientOptions() -> dict:
+    return {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+        "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)),
+        "serverSelectionTimeoutMS": int(
+            os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+        ),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "socketTimeoutMS": int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 10000)),
+        "compressors": os.environ.get("MONGO_COMPRESSORS", "zstd,zlib"),
+        "retryWrites": os.environ.get("MONGO_RETRY_WRITES", "true") == "true",
+        "retryReads": os.environ.get("MONGO_RETRY_READS", "true") == "true",
+    }
+
+
+POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections",
+    "Open connections in the MongoDB connection pool",
+    ["address"],
+    multiprocess_mode="livesum",
+)
+POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out",
+    "Connections currently checked out of the MongoDB connection pool",
+    ["address"],
+    multiprocess_mode="livesum",
+)
+POOL_MAX_SIZE = Gauge(
+    "mongo_pool_max_size",
+    "Maximum size of the MongoDB connection pool",
+    ["address"],
+    multiprocess_mode="livesum",
+)
+POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures",
+    "Connection check outs that failed, e.g. after waiting on a full pool",
+    ["address", "reason"],
+)
+
+
+class PoolMetrics(ConnectionPoolListener):
+    # The event only carries options that differ from pymongo's defaults, so the
+    # default maxPoolSize of 100 is missing from it.
+    def pool_created(self, event):
+        POOL_MAX_SIZE.labels(address(event)).set(
+            event.options.get("maxPoolSize", clientOptions()["maxPoolSize"])
+        )
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        POOL_MAX_SIZE.labels(address(event)).set(0)
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS.labels(address(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.labels(address(event)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        POOL_CHECKOUT_FAILURES.labels(address(event), event.reason).inc()
+
+    def connection_checked_out(self, event):
+        POOL_CHECKED_OUT.labels(address(event)).inc()
+
+    def connection_checked_in(self, event):
+        POOL_CHECKED_OUT.labels(address(event)).dec()
+
+
+def address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+# connect=False defers the first connection to the first operation.
+def createClient() -> MongoClient:
+    return MongoClient(
+        os.environ.get("MONGO_URL", "localhost"),
+        27017,
+        connect=False,
+        event_listeners=[PoolMetrics()],
+        **clientOptions(),
+    )
+
+
+# The client is created on first use, so importing this module is cheap and every
+# worker builds its own pool after the fork.
+client: Optional[MongoClient] = None
+clientLock = threading.Lock()
+
+
+def getClient() -> MongoClient:
+    global client
+
+    if client is None:
+        with clientLock:
+            if client is None:
+                client = createClient()
+
+    return client
+
 
-from api.schemas import Milestone, Project, Sprint, Task, User
+def closeClient():
+    global client
 
-client = MongoClient(os.environ.get("MONGO_URL", "localhost"), 27017)
+    with clientLock:
+        if client is not None:
+            client.close()
+            client = None
+
+
+# A client inherited through fork shares its sockets with the parent, the child
+# drops it and connects on its own.
+def forgetClient():
+    global client, clientLock
+
+    client = None
+    clientLock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=forgetClient)
 
 
 def getDb():
-    return client[os.environ.get("MONGO_DB", "kraken")]
+    return getClient()[os.environ.get("MONGO_DB", "kraken")]
+
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Read-only helpers read through a named group whose read preference, staleness
+# bound and read concern can be set from the environment, e.g.
+# MONGO_VIEWS_READ_PREFERENCE=secondaryPreferred and
+# MONGO_VIEWS_MAX_STALENESS_SECONDS=90. Without overrides the client defaults
+# apply and everything is read from the primary.
+READ_GROUPS = ("views", "tasks", "search")
+
+
+@lru_cache
+def readOptions(group: str) -> dict:
+    options = {}
+    prefix = f"MONGO_{group.upper()}"
+
+    if preference := os.environ.get(f"{prefix}_READ_PREFERENCE"):
+        if preference == "primary":
+            options["read_preference"] = Primary()
+        else:
+            options["read_preference"] = READ_PREFERENCES[preference](
+                max_staleness=int(os.environ.get(f"{prefix}_MAX_STALENESS_SECONDS", -1))
+            )
+
+    if concern := os.environ.get(f"{prefix}_READ_CONCERN"):
+        options["read_concern"] = ReadConcern(concern)
+
+    return options
+
+
+def readCollection(db: Database, collection: str, group: Optional[str]):
+    if not (group and (options := readOptions(group))):
+        return db[collection]
+
+    return db.get_collection(collection, **options)
+
+
+# CAUSAL CONSISTENCY
+# Once a read group targets secondaries every request runs in a causally
+# consistent session, so its reads wait for the writes it has made. The session's
+# cluster and operation times are returned in a signed X-Causal-Time header that
+# the client sends back with its next request, whichever worker serves it, which
+# gives users read-your-writes across requests. Each worker also keeps the last
+# times per token for clients that don't send the header.
+def causalReads() -> bool:
+    return any(
+        readOptions(group).get("read_preference", Primary()) != Primary()
+        for group in READ_GROUPS
+    )
+
 
+class ClusterTimes:
+    def __init__(self, maxSize: int = 10_000):
+        self.maxSize = maxSize
+        self.times = OrderedDict()
+        self.lock = threading.Lock()
 
-DBDep = Annotated[Database, Depends(getDb)]
+    def get(self, key: str):
+        with self.lock:
+            if key in self.times:
+                self.times.move_to_end(key)
+            return self.times.get(key)
+
+    def set(self, key: str, value: tuple):
+        with self.lock:
+            self.times[key] = value
+            self.times.move_to_end(key)
+            if len(self.times) > self.maxSize:
+                self.times.popitem(last=False)
+
+
+clusterTimes = ClusterTimes()
+
+CAUSAL_TIME_HEADER = "X-Causal-Time"
+
+
+def causalTimeSignature(payload: bytes) -> str:
+    return hmac.new(JWT_SECRET_KEY.encode(), payload, hashlib.sha256).hexdigest()
+
+
+def encodeCausalTime(times: tuple) -> str:
+    payload = base64.urlsafe_b64encode(
+        bson.encode({"clusterTime": times[0], "operationTime": times[1]})
+    )
+
+    return f"{payload.decode()}.{causalTimeSignature(payload)}"
+
+
+# The times in a header this API signed, None for a missing or altered one.
+def decodeCausalTime(value: Optional[str]) -> Optional[tuple]:
+    try:
+        payload, signature = value.encode().split(b".")
+        if not hmac.compare_digest(signature.decode(), causalTimeSignature(payload)):
+            return None
+
+        times = bson.decode(base64.urlsafe_b64decode(payload))
+        return times["clusterTime"], times["operationTime"]
+    except Exception:
+        return None
+
+
+# Adds the times of the request's session to its response. getRequestDb can't,
+# a dependency's exit runs after the response headers are built.
+class CausalTimeMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+
+        async def sendWithTime(message):
+            if (
+                message["type"] == "http.response.start"
+                and (session := state.get("causalSession"))
+                and session.operation_time is not None
+            ):
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (
+                            CAUSAL_TIME_HEADER.lower().encode(),
+                            encodeCausalTime(
+                                (session.cluster_time, session.operation_time)
+                            ).encode(),
+                        ),
+                    ],
+                }
+
+            await send(message)
+
+        await self.app(scope, receive, sendWithTime)
+
+
+class SessionCollection:
+    OPERATIONS = {
+        "aggregate",
+        "bulk_write",
+        "count_documents",
+        "delete_many",
+        "delete_one",
+        "distinct",
+        "find",
+        "find_one",
+        "find_one_and_delete",
+        "find_one_and_update",
+        "insert_many",
+        "insert_one",
+        "update_many",
+        "update_one",
+    }
+
+    def __init__(self, collection, session):
+        self.collection = collection
+        self.session = session
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+
+        if name not in self.OPERATIONS:
+            return attr
+
+        return partial(attr, session=self.session)
+
+
+# Binds a session to every collection operation issued through the database.
+class SessionDatabase:
+    def __init__(self, db: Database, session):
+        self.db = db
+        self.session = session
+
+    def __getattr__(self, name):
+        return SessionCollection(getattr(self.db, name), self.session)
+
+    def __getitem__(self, name):
+        return SessionCollection(self.db[name], self.session)
+
+    def get_collection(self, name, **kwargs):
+        return SessionCollection(self.db.get_collection(name, **kwargs), self.session)
+
+
+def getRequestDb(request: Request, db: Annotated[Database, Depends(getDb)]):
+    if not (causalReads() and isinstance(db, Database)):
+        yield db
+        return
+
+    token = request.headers.get("Authorization")
+
+    with db.client.start_session(causal_consistency=True) as session:
+        if times := decodeCausalTime(request.headers.get(CAUSAL_TIME_HEADER)) or (
+            token and clusterTimes.get(token)
+        ):
+            session.advance_cluster_time(times[0])
+            session.advance_operation_time(times[1])
+
+        request.state.causalSession = session
+
+        yield SessionDatabase(db, session)
+
+        if token and session.operation_time is not None:
+            clusterTimes.set(token, (session.cluster_time, session.operation_time))
+
+
+DBDep = Annotated[Database, Depends(getRequestDb)]
+
+
+# Task queries are always scoped to a project and paged on (sort field, _id), so
+# every compound index is prefixed by projectId and suffixed by the keyset. The
+# multikey dependency indexes let deletes pull an id from only its dependents.
+INDEXES = {
+    "tasks": [
+        [("projectId", 1), ("dueDate", 1), ("_id", 1)],
+        [("projectId", 1), ("createdAt", 1), ("_id", 1)],
+        [("projectId", 1), ("priority", 1), ("_id", 1)],
+        [("projectId", 1), ("status", 1), ("dueDate", 1), ("_id", 1)],
+        [("projectId", 1), ("milestoneId", 1), ("dueDate", 1), ("_id", 1)],
+        [("projectId", 1), ("assignedTo", 1), ("dueDate", 1), ("_id", 1)],
+        [("projectId", 1), ("qaTask.assignedTo", 1), ("dueDate", 1), ("_id", 1)],
+        [("milestoneId", 1)],
+        [("dependentTasks", 1)],
+        [("dependentMilestones", 1)],
+        [("assignedTo", 1), ("dueDate", 1), ("_id", 1)],
+        [("qaTask.assignedTo", 1), ("dueDate", 1), ("_id", 1)],
+        [("sprintId", 1)],
+    ],
+    "milestones": [
+        [("projectId", 1)],
+        [("dependentTasks", 1)],
+        [("dependentMilestones", 1)],
+        [("sprintId", 1)],
+    ],
+    "sprints": [
+        [("projectId", 1)],
+    ],
+    "users": [
+        [("username", 1)],
+        [("email", 1)],
+    ],
+    "memberships": [
+        [("userId", 1), ("projectId", 1), ("role", 1)],
+        [("projectId", 1), ("role", 1), ("userId", 1)],
+    ],
+    "refreshTokens": [
+        [("userId", 1)],
+    ],
+}
+
+# A user can only hold one role per project, membership writes upsert on this key.
+UNIQUE_INDEXES = {
+    "memberships": [
+        [("projectId", 1), ("userId", 1)],
+    ],
+}
+
+
+# Documents in these collections are removed by MongoDB once their expiresAt has
+# passed.
+TTL_INDEXES = {
+    "idempotencyKeys": "expiresAt",
+    "rateLimits": "expiresAt",
+    "refreshTokens": "expiresAt",
+    "revocations": "expiresAt",
+}
+
+
+# Each searchable collection gets a single weighted text index, a name match is
+# ranked well above a description match. The milestone and task indexes end with
+# projectId, so one query per collection takes all of the caller's projects as
+# an $in and the index scan drops other projects' postings before fetching.
+# Projects are one document each and keep a plain index.
+SEARCH_SUFFIXES = {"projects": [], "milestones": ["projectId"], "tasks": ["projectId"]}
+SEARCH_WEIGHTS = {"name": 10, "description": 1}
+SEARCH_INDEX_NAMES = ("search", "projectSearch", "scopedSearch")
+
+
+def createSearchIndex(db: Database, collection: str):
+    suffix = SEARCH_SUFFIXES[collection]
+    name = "scopedSearch" if suffix else "search"
+
+    # A collection holds one text index, those of earlier layouts are replaced.
+    for existing in db[collection].index_information():
+        if existing in SEARCH_INDEX_NAMES and existing != name:
+            db[collection].drop_index(existing)
+
+    db[collection].create_index(
+        [(field, TEXT) for field in SEARCH_WEIGHTS]
+        + [(field, ASCENDING) for field in suffix],
+        weights=SEARCH_WEIGHTS,
+        name=name,
+    )
+
+
+def createIndexes(db: Database):
+    for collection, indexes in INDEXES.items():
+        db[collection].create_indexes([IndexModel(keys) for keys in indexes])
+
+    for collection, indexes in UNIQUE_INDEXES.items():
+        db[collection].create_indexes(
+            [IndexModel(keys, unique=True) for keys in indexes]
+        )
+
+    for collection, field in TTL_INDEXES.items():
+        db[collection].create_index(field, expireAfterSeconds=0)
+
+    for collection in SEARCH_SUFFIXES:
+        createSearchIndex(db, collection)
 
 
 def toObjectId(id: str) -> ObjectId:
@@ -43,11 +522,11 @@ def findUserByEmail(db: Database, email: str):
 
 
 def insertUser(db: Database, user: User):
-    return db.users.insert_one(user.model_dump(exclude={"id"}))
-
-
-def updateManyUsers(db: Database, filter: dict, update: dict):
-    return db.users.update_many(filter, update)
+    return db.users.insert_one(
+        user.model_dump(
+            exclude={"id", "ownedProjects", "joinedProjects", "refreshToken"}
+        )
+    )
 
 
 def findUserAndUpdate(db: Database, user: User, update: dict):
@@ -58,25 +537,143 @@ def findUserAndUpdate(db: Database, user: User, update: dict):
     )
 
 
-def findUserAndUpdateByEmail(db: Database, email: str, update: dict):
-    return db.users.find_one_and_update(
-        {"email": email},
-        update,
-        return_document=ReturnDocument.AFTER,
+# Only replaces the hash it was computed from, a concurrent password reset wins.
+def updateUserPassword(db: Database, id, oldHash: str, newHash: str):
+    return db.users.update_one(
+        {"_id": id, "password": oldHash}, {"$set": {"password": newHash}}
     )
 
 
-def findUserAndUpdateById(db: Database, id: str, update: dict):
-    return db.users.find_one_and_update(
-        {"_id": toObjectId(id)},
-        update,
-        return_document=ReturnDocument.AFTER,
+# MEMBERSHIP
+# Memberships are stored one document per (project, user) pair so joining, leaving
+# or deleting a project never rewrites the lists on user documents. Every change
+# increments the user's membershipsVersion instead, so each worker can keep the
+# memberships it loaded for that version and an authenticated request only reads
+# the user. Users not migrated by 003 yet still carry ownedProjects and
+# joinedProjects arrays, which are added to their memberships until it runs.
+MEMBERSHIP_PROJECTION = {"_id": 0, "projectId": 1, "role": 1}
+LEGACY_MEMBERSHIP_FIELDS = {Role.owner: "ownedProjects", Role.member: "joinedProjects"}
+
+
+class MembershipCache:
+    def __init__(self, maxSize: int):
+        self.maxSize = maxSize
+        self.memberships = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, userId: str, version: int) -> Optional[list[tuple[str, str]]]:
+        with self.lock:
+            if (entry := self.memberships.get(userId)) is None or entry[0] != version:
+                return None
+
+            self.memberships.move_to_end(userId)
+            return entry[1]
+
+    def set(self, userId: str, version: int, memberships: list[tuple[str, str]]):
+        with self.lock:
+            self.memberships[userId] = (version, memberships)
+            self.memberships.move_to_end(userId)
+            if len(self.memberships) > self.maxSize:
+                self.memberships.popitem(last=False)
+
+
+membershipCache = MembershipCache(int(os.environ.get("MEMBERSHIP_CACHE_SIZE", 10_000)))
+
+
+def findMemberships(db: Database, userId: str):
+    return db.memberships.find({"userId": userId}, MEMBERSHIP_PROJECTION)
+
+
+def loadMemberships(db: Database, user: dict) -> User:
+    userId, version = str(user["_id"]), user.get("membershipsVersion", 0)
+
+    if (memberships := membershipCache.get(userId, version)) is None:
+        memberships = [
+            (membership["projectId"], membership["role"])
+            for membership in findMemberships(db, userId)
+        ]
+        membershipCache.set(userId, version, memberships)
+
+    owned = list(user.get("ownedProjects", []))
+    joined = list(user.get("joinedProjects", []))
+    for projectId, role in memberships:
+        (owned if role == Role.owner else joined).append(projectId)
+
+    return User(
+        **{
+            **user,
+            "ownedProjects": list(dict.fromkeys(owned)),
+            "joinedProjects": list(dict.fromkeys(joined)),
+        }
+    )
+
+
+def membershipsChanged(db: Database, userIds: list[str], update: Optional[dict] = None):
+    db.users.update_many(
+        {"_id": {"$in": [toObjectId(id) for id in userIds]}},
+        {**(update or {}), "$inc": {"membershipsVersion": 1}},
+    )
+
+
+def findMemberIds(db: Database, projectId: str, role: Role) -> list[str]:
+    return [
+        membership["userId"]
+        for membership in readCollection(db, "memberships", "views").find(
+            {"projectId": projectId, "role": role.value}, {"_id": 0, "userId": 1}
+        )
+    ]
+
+
+# An existing membership keeps its role, joining a project you own is a no-op.
+def upsertMembership(db: Database, projectId: str, userId: str, role: Role):
+    result = db.memberships.update_one(
+        {"projectId": projectId, "userId": userId},
+        {"$setOnInsert": {"role": role.value}},
+        upsert=True,
+    )
+
+    if result.upserted_id is not None:
+        membershipsChanged(db, [userId])
+
+    return result
+
+
+def removeMembership(db: Database, projectId: str, userId: str, role: Role):
+    result = db.memberships.delete_one(
+        {"projectId": projectId, "userId": userId, "role": role.value}
     )
 
+    membershipsChanged(
+        db, [userId], {"$pull": {LEGACY_MEMBERSHIP_FIELDS[role]: projectId}}
+    )
+
+    return result
+
+
+def removeProjectMemberships(db: Database, projectId: str):
+    userIds = [
+        membership["userId"]
+        for membership in db.memberships.find(
+            {"projectId": projectId}, {"_id": 0, "userId": 1}
+        )
+    ]
+
+    result = db.memberships.delete_many({"projectId": projectId})
+
+    legacyFields = LEGACY_MEMBERSHIP_FIELDS.values()
+    membershipsChanged(
+        db, userIds, {"$pull": {field: projectId for field in legacyFields}}
+    )
+
+    return result
+
 
 # PROJECT
-def findProjectById(db: Database, id: str):
-    return db.projects.find_one({"_id": toObjectId(id)})
+PROJECT_SUMMARY_PROJECTION = {"name": 1, "taskCounts": 1}
+
+
+def findProjectById(db: Database, id: str, projection: Optional[dict] = None):
+    return db.projects.find_one({"_id": toObjectId(id)}, projection)
 
 
 def insertProject(db: Database, project: Project):
@@ -96,22 +693,26 @@ def findProjectAndUpdate(db: Database, projectID: str, update: dict):
 
 
 # MILESTONE
-def findMilestoneById(db: Database, id: str):
-    return db.milestones.find_one({"_id": toObjectId(id)})
+MILESTONE_SUMMARY_PROJECTION = {"name": 1, "projectId": 1, "status": 1, "taskCounts": 1}
 
 
-def findMilestones(db: Database, filter: dict):
-    return db.milestones.find(filter)
+def findMilestones(db: Database, filter: dict, group: Optional[str] = "views"):
+    return readCollection(db, "milestones", group).find(filter)
 
 
 def insertMilestone(db: Database, milestone: Milestone):
-    return db.milestones.insert_one(milestone.model_dump(exclude={"id"}))
+    return db.milestones.insert_one(
+        {
+            **milestone.model_dump(exclude={"id"}),
+            "schemaVersion": SCHEMA_VERSIONS["milestones"],
+        }
+    )
 
 
 def findMilestoneAndUpdate(db: Database, milestoneID: str, update: dict):
     return db.milestones.find_one_and_update(
         {"_id": toObjectId(milestoneID)},
-        update,
+        withVersion(update),
         return_document=ReturnDocument.AFTER,
     )
 
@@ -121,7 +722,7 @@ def removeMilestone(db: Database, milestoneID: str):
 
 
 def updateManyMilestones(db: Database, filter: dict, update: dict):
-    return db.milestones.update_many(filter, update)
+    return db.milestones.update_many(filter, withVersion(update))
 
 
 def removeMilestones(db: Database, filter: dict):
@@ -129,32 +730,89 @@ def removeMilestones(db: Database, filter: dict):
 
 
 # TASK
-def findTaskById(db: Database, id: str):
-    return db.tasks.find_one({"_id": toObjectId(id)})
+def findTasks(
+    db: Database,
+    filter: dict,
+    group: Optional[str] = "views",
+    projection: Optional[dict] = None,
+):
+    return readCollection(db, "tasks", group).find(filter, projection)
+
+
+def findTasksPage(
+    db: Database,
+    filter: dict,
+    sort: TaskSort,
+    direction: int,
+    limit: int,
+    cursor: Optional[str] = None,
+):
+    if sort == TaskSort.priority:
+        buckets = [priority.value for priority in Priority]
+        if direction != ASCENDING:
+            buckets.reverse()
+
+        return bucketedPage(
+            readCollection(db, "tasks", "tasks"),
+            filter,
+            sort.value,
+            buckets,
+            limit,
+            cursor,
+        )
+
+    return keysetPage(
+        readCollection(db, "tasks", "tasks"),
+        filter,
+        sort.value,
+        direction,
+        limit,
+        cursor,
+    )
 
 
-def findTasks(db: Database, filter: dict):
-    return db.tasks.find(filter)
+def findAssignedTasksPage(
+    db: Database,
+    username: str,
+    projects: list[str],
+    direction: int,
+    limit: int,
+    cursor: Optional[str] = None,
+):
+    filter = {
+        "$or": [{"assignedTo": username}, {"qaTask.assignedTo": username}],
+        "projectId": {"$in": projects},
+    }
+
+    return keysetPage(
+        readCollection(db, "tasks", "tasks"),
+        filter,
+        "dueDate",
+        direction,
+        limit,
+        cursor,
+    )
 
 
 def insertTask(db: Database, task: Task):
-    return db.tasks.insert_one(task.model_dump(exclude={"id"}))
+    return db.tasks.insert_one(
+        {
+            **task.model_dump(exclude={"id"}),
+            "schemaVersion": SCHEMA_VERSIONS["tasks"],
+        }
+    )
 
 
 def findTaskAndUpdate(db: Database, taskID: str, update: dict):
     return db.tasks.find_one_and_update(
         {"_id": toObjectId(taskID)},
-        update,
+        withVersion(update),
         return_document=ReturnDocument.AFTER,
     )
 
 
 def updateManyTasks(db: Database, filter: dict, update: dict):
-    return db.tasks.update_many(filter, update)
-
-
-def removeTask(db: Database, taskID: str):
-    return db.tasks.delete_one({"_id": toObjectId(taskID)})
+    return db.tasks.update_many(filter, withVersion(update))
 
 
 def removeTasks(db: Database, filter: dict):
@@ -162,22 +820,23 @@ def removeTasks(db: Database, filter: dict):
 
 
 # SPRINT
-def findSprintById(db: Database, id: str):
-    return db.sprints.find_one({"_id": toObjectId(id)})
-
-
-def findSprints(db: Database, filter: dict):
-    return db.sprints.find(filter)
+def findSprints(db: Database, filter: dict, group: Optional[str] = "views"):
+    return readCollection(db, "sprints", group).find(filter)
 
 
 def insertSprint(db: Database, sprint: Sprint):
-    return db.sprints.insert_one(sprint.model_dump(exclude={"id"}))
+    return db.sprints.insert_one(
+        {
+            **sprint.model_dump(exclude={"id"}),
+            "schemaVersion": SCHEMA_VERSIONS["sprints"],
+        }
+    )
 
 
 def findSprintAndUpdate(db: Database, sprintID: str, update: dict):
     return db.sprints.find_one_and_update(
         {"_id": toObjectId(sprintID)},
-        update,
+        withVersion(update),
         return_document=ReturnDocument.AFTER,
     )
 
@@ -188,3 +847,427 @@ def removeSprint(db: Database, sprintID: str):
 
 def removeSprints(db: Database, filter: dict):
     return db.sprints.delete_many(filter)
+
+
+# SPRINT MEMBERSHIP
+# Tasks and milestones point back at the sprint they are in through an indexed
+# sprintId, kept in step with the sprint's tasks and milestones lists, so the
+# members of a sprint are one query. A task or milestone is in one sprint at a
+# time, it has to be removed from its sprint before another can add it.
+SPRINT_MEMBER_PROJECTION = {"sprintId": 1}
+NO_SPRINT = {"$in": [None, ""]}
+
+
+# The sprintId of each of `ids` that is a task or milestone of the project, "" for
+# the ones in no sprint, in one query.
+def findSprintIds(
+    db: Database, collection: str, projectId: str, ids: list[str]
+) -> dict[str, str]:
+    return {
+        str(document["_id"]): document.get("sprintId") or ""
+        for document in db[collection].find(
+            {"_id": {"$in": [toObjectId(id) for id in ids]}, "projectId": projectId},
+            SPRINT_MEMBER_PROJECTION,
+        )
+    }
+
+
+def removeSprintMembers(db: Database, sprintId: str, collection: str, ids: list[str]):
+    db[collection].update_many(
+        {"_id": {"$in": [toObjectId(id) for id in ids]}, "sprintId": sprintId},
+        withVersion({"$unset": {"sprintId": ""}}),
+    )
+
+
+# Points ids in no sprint at this one. The update only matches ids still in no
+# sprint, so if another sprint claimed one first the ones claimed here are
+# released again and nothing changes.
+def claimSprintMembers(
+    db: Database, sprintId: str, collection: str, ids: list[str]
+) -> bool:
+    if not ids:
+        return True
+
+    oids = [toObjectId(id) for id in ids]
+
+    if (
+        db[collection]
+        .update_many(
+            {"_id": {"$in": oids}, "sprintId": NO_SPRINT},
+            withVersion({"$set": {"sprintId": sprintId}}),
+        )
+        .matched_count
+        == len(oids)
+    ):
+        return True
+
+    removeSprintMembers(db, sprintId, collection, ids)
+
+    return False
+
+
+# Clears the back-reference of members the sprint no longer lists.
+def releaseSprintMembers(db: Database, sprintId: str, collection: str, keep: list[str]):
+    db[collection].update_many(
+        {"sprintId": sprintId, "_id": {"$nin": [toObjectId(id) for id in keep]}},
+        withVersion({"$unset": {"sprintId": ""}}),
+    )
+
+
+# Takes deleted tasks or milestones off the sprints they were in.
+def pullFromSprints(db: Database, collection: str, documents: list[dict]):
+    sprintOids = {
+        toObjectId(document["sprintId"])
+        for document in documents
+        if document.get("sprintId")
+    }
+
+    if sprintOids:
+        db.sprints.update_many(
+            {"_id": {"$in": list(sprintOids)}},
+            {
+                "$pull": {
+                    collection: {
+                        "$in": [str(document["_id"]) for document in documents]
+                    }
+                },
+                "$inc": {"version": 1},
+            },
+        )
+
+
+def clearSprintMembers(db: Database, sprintId: str):
+    for collection in ("tasks", "milestones"):
+        db[collection].update_many(
+            {"sprintId": sprintId}, withVersion({"$unset": {"sprintId": ""}})
+        )
+
+
+# TASK COUNTERS
+# Milestones and projects keep a denormalised `taskCounts` sub-document that is
+# maintained with $inc whenever a task is created, moved or deleted.
+TASK_COUNTS_PROJECTION = {"projectId": 1, "milestoneId": 1, "status": 1, "priority": 1}
+
+
+# The counted fields of a task as the current schema has them, so a task still
+# stored with an older status is counted under the status it is upgraded to.
+def countedFields(task: dict) -> dict:
+    return upgraded(
+        "tasks",
+        {
+            field: enumValue(task[field])
+            for field in (*TASK_COUNTS_PROJECTION, "schemaVersion")
+            if field in task
+        },
+    )
+
+
+def taskCountsIncrement(task: dict, amount: int) -> dict:
+    task = countedFields(task)
+
+    return {
+        "taskCounts.total": amount,
+        f"taskCounts.status.{enumValue(task['status'])}": amount,
+        f"taskCounts.priority.{enumValue(task['priority'])}": amount,
+    }
+
+
+# Sums the counter deltas of tasks added (amount 1) or removed (amount -1) per
+# milestone and project they count towards.
+def taskCountsDeltas(
+    changes: list[tuple[dict, int]], collections=("milestones", "projects")
+) -> dict[tuple[str, str], dict]:
+    deltas = {}
+    for task, amount in changes:
+        for collection in collections:
+            id = task["milestoneId" if collection == "milestones" else "projectId"]
+            increments = deltas.setdefault((collection, id), {})
+            for field, value in taskCountsIncrement(task, amount).items():
+                increments[field] = increments.get(field, 0) + value
+
+    return deltas
+
+
+# One $inc per milestone and project, so a reader never sees half of a move and
+# a crash can't leave one applied without the other. Deltas that cancel out are
+# not written.
+def writeTaskCounts(db: Database, deltas: dict[tuple[str, str], dict]):
+    for (collection, id), increments in deltas.items():
+        if increments := {field: value for field, value in increments.items() if value}:
+            db[collection].update_one({"_id": toObjectId(id)}, {"$inc": increments})
+
+
+def incrementTaskCounts(db: Database, task: dict, amount: int):
+    writeTaskCounts(db, taskCountsDeltas([(task, amount)]))
+
+
+# Takes a batch of removed tasks off their project counters, one update per
+# project. A task moved to another project keeps its milestone, so a milestone's
+# tasks are not all in one project.
+def decrementTaskCounts(db: Database, tasks: list[dict]):
+    writeTaskCounts(db, taskCountsDeltas([(task, -1) for task in tasks], ("projects",)))
+
+
+def moveTaskCounts(db: Database, before: dict, after: dict):
+    writeTaskCounts(db, taskCountsDeltas([(before, -1), (after, 1)]))
+
+
+def aggregateTaskCounts(db: Database):
+    return db.tasks.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": {
+                        "projectId": "$projectId",
+                        "milestoneId": "$milestoneId",
+                        "status": "$status",
+                        "priority": "$priority",
+                    },
+                    "count": {"$sum": 1},
+                }
+            }
+        ]
+    )
+
+
+def enumValue(value):
+    return getattr(value, "value", value)
+
+
+# SEARCH
+SEARCH_PROJECTION = {"name": 1, "description": 1, "projectId": 1}
+
+
+# SEARCH_BACKEND=index ranks the caller's documents in memory instead of using
+# the $text indexes, for databases without $text support like mongomock.
+def textSearchEnabled() -> bool:
+    return os.environ.get("SEARCH_BACKEND", "text") == "text"
+
+
+TextSearchDep = Annotated[bool, Depends(textSearchEnabled)]
+
+
+def textSearch(db: Database, collection: str, query: str, filter: dict, limit: int):
+    return (
+        readCollection(db, collection, "search")
+        .find(
+            {"$text": {"$search": query}, **filter},
+            {**SEARCH_PROJECTION, "score": {"$meta": "textScore"}},
+        )
+        .sort([("score", {"$meta": "textScore"})])
+        .limit(limit)
+    )
+
+
+def findSearchable(db: Database, collection: str, filter: dict):
+    return readCollection(db, collection, "search").find(filter, SEARCH_PROJECTION)
+
+
+# OPTIMISTIC CONCURRENCY
+# Tasks, milestones and sprints carry a `version` that every update of a field
+# they are served with increments, bulk updates included. Clients send it back
+# in If-Match and the update only applies if it still matches, documents written
+# before versioning are treated as version 0. The task counters of milestones
+# aren't served with them, and schema upgrades written back on read only store
+# what upgrade-on-read already serves, so those leave it as it is.
+def parseIfMatch(ifMatch: Optional[str]) -> Optional[int]:
+    if ifMatch is None or ifMatch.strip() == "*":
+        return None
+
+    value = ifMatch.strip().removeprefix("W/").strip('"')
+    if not value.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid If-Match header"
+        )
+
+    return int(value)
+
+
+def withVersion(update: dict) -> dict:
+    return {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+
+
+def etag(document: dict) -> str:
+    return f'"{document.get("version", 0)}"'
+
+
+def versionFilter(version: Optional[int]) -> dict:
+    if version is None:
+        return {}
+
+    if version == 0:
+        return {"version": {"$in": [0, None]}}
+
+    return {"version": version}
+
+
+# Applies the update only if the document exists, belongs to one of the user's
+# projects and is still at the expected version, all in a single round trip.
+# `projects` narrows the user's projects the document may be in.
+def findAccessibleAndUpdate(
+    db: Database,
+    collection: str,
+    id: str,
+    user: User,
+    version: Optional[int],
+    update: dict,
+    returnDocument: ReturnDocument = ReturnDocument.AFTER,
+    projects: Optional[list[str]] = None,
+):
+    return db[collection].find_one_and_update(
+        {
+            "_id": toObjectId(id),
+            "projectId": {"$in": user.projects() if projects is None else projects},
+            **versionFilter(version),
+        },
+        withVersion(update),
+        return_document=returnDocument,
+    )
+
+
+# Deletes the document if it belongs to one of the user's projects and returns
+# the deleted fields in `projection`, all in a single round trip.
+def findAccessibleAndDelete(
+    db: Database, collection: str, id: str, user: User, projection: dict
+):
+    return db[collection].find_one_and_delete(
+        {"_id": toObjectId(id), "projectId": {"$in": user.projects()}},
+        projection,
+    )
+
+
+# The document a `$set` and top level `$unset` leave on top of its pre-image,
+# with the version findAccessibleAndUpdate gave it, so routes needn't read it
+# back. The set values go through BSON to come out as they are stored, e.g.
+# datetimes in naive UTC and to the millisecond.
+def updatedDocument(before: dict, update: dict) -> dict:
+    after = copy.deepcopy(before)
+
+    for path, value in bson.decode(bson.encode(update.get("$set", {}))).items():
+        *parents, field = path.split(".")
+        target = after
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[field] = value
+
+    for field in update.get("$unset", {}):
+        after.pop(field, None)
+
+    after["version"] = before.get("version", 0) + 1
+
+    return after
+
+
+# Only called once a conditional update has matched nothing, to work out why.
+def raiseUpdateFailure(
+    db: Database,
+    collection: str,
+    name: str,
+    id: str,
+    user: User,
+    version: Optional[int],
+):
+    document = findAuthorized(db, collection, name, id, user, {"version": 1})
+
+    if version is not None and document.get("version", 0) != version:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"{name} has been modified",
+        )
+
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Failed to update {name.lower()}",
+    )
+
+
+# AUTHORIZED LOOKUPS
+# Each lookup answers "does it exist and may this user touch it" with a single
+# query that projects only the fields the route needs. Only a miss pays for a
+# second query to tell a 404 from a 403.
+ID_PROJECTION = {"_id": 1}
+
+
+def raiseNotFound(name: str):
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND, detail=f"{name} not found"
+    )
+
+
+def raiseForbidden():
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="User does not have access to project",
+    )
+
+
+# Membership lives on the user, so the access check is in memory and the query
+# only confirms the project still exists.
+def findAuthorizedProject(
+    db: Database,
+    id: str,
+    user: User,
+    projection: Optional[dict] = ID_PROJECTION,
+    admin: bool = False,
+):
+    oid = toObjectId(id)
+
+    if user.isAdmin(id) if admin else user.canAccess(id):
+        if project := db.projects.find_one({"_id": oid}, projection):
+            return project
+
+        raiseNotFound("Project")
+
+    if db.projects.find_one({"_id": oid}, ID_PROJECTION):
+        raiseForbidden()
+
+    raiseNotFound("Project")
+
+
+def findAuthorized(
+    db: Database,
+    collection: str,
+    name: str,
+    id: str,
+    user: User,
+    projection: Optional[dict] = ID_PROJECTION,
+):
+    oid = toObjectId(id)
+
+    if document := db[collection].find_one(
+        {"_id": oid, "projectId": {"$in": user.projects()}}, projection
+    ):
+        return document
+
+    if db[collection].find_one({"_id": oid}, ID_PROJECTION):
+        raiseForbidden()
+
+    raiseNotFound(name)
+
+
+# Checks the project, the milestone and that one belongs to the other at once.
+def findAuthorizedMilestoneInProject(
+    db: Database, milestoneId: str, projectId: str, user: User
+):
+    oid = toObjectId(milestoneId)
+
+    if user.canAccess(projectId) and (
+        milestone := db.milestones.find_one(
+            {"_id": oid, "projectId": projectId}, ID_PROJECTION
+        )
+    ):
+        return milestone
+
+    if not db.projects.find_one({"_id": toObjectId(projectId)}, ID_PROJECTION):
+        raiseNotFound("Project")
+
+    if not (milestone := db.milestones.find_one({"_id": oid}, {"projectId": 1})):
+        raiseNotFound("Milestone")
+
+    if milestone["projectId"] != projectId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Milestone does not belong to project",
+        )
+
+    raiseForbidden()
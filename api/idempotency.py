@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from anyio import to_thread
+from prometheus_client import Counter
+from pymongo.errors import DuplicateKeyError
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from api.database import getDb
+from api.ratelimit import clientKey
+from api.tokens import JWT_SECRET_KEY, expiry
+
+IDEMPOTENT_REPLAYS = Counter(
+    "idempotent_replays",
+    "POST requests answered with the stored response of an earlier request",
+    ["source"],
+)
+
+
+# The create routes mobile clients retry on timeouts. Other POSTs, logins and
+# token refreshes among them, are never stored.
+IDEMPOTENT_PATHS = {"/projects/", "/milestones/", "/tasks/", "/sprints/"}
+
+# Taken out of stored bodies, so credentials never sit in idempotencyKeys. A
+# replayed Create Project has no token, clients refresh it on a 401.
+CREDENTIAL_FIELDS = ("token", "refreshToken", "password")
+
+
+def fingerprint(scope, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (
+        scope["method"].encode(),
+        scope["path"].encode(),
+        scope.get("query_string", b""),
+        body,
+    ):
+        digest.update(part)
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def withoutCredentials(body: bytes) -> bytes:
+    try:
+        document = json.loads(body)
+    except ValueError:
+        return body
+
+    if not isinstance(document, dict) or not any(
+        field in document for field in CREDENTIAL_FIELDS
+    ):
+        return body
+
+    for field in CREDENTIAL_FIELDS:
+        document.pop(field, None)
+
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def conflict(status: int, detail: str) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=status)
+
+
+# Completed responses this worker stored or replayed recently, so most retries are
+# answered without a query. Entries are dropped after `ttl` or past `maxSize`.
+class ResponseCache:
+    def __init__(self, maxSize: int, ttl: float):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, id: str) -> Optional[dict]:
+        with self.lock:
+            if (entry := self.responses.get(id)) is None:
+                return None
+
+            storedAt, response = entry
+            if time.monotonic() - storedAt > self.ttl:
+                del self.responses[id]
+                return None
+
+            self.responses.move_to_end(id)
+            return response
+
+    def set(self, id: str, response: dict):
+        with self.lock:
+            self.responses[id] = (time.monotonic(), response)
+            self.responses.move_to_end(id)
+            if len(self.responses) > self.maxSize:
+                self.responses.popitem(last=False)
+
+
+# Makes create POSTs carrying an Idempotency-Key safe to retry.
+#
+# The first request with a key claims it in the idempotencyKeys collection with a
+# fingerprint of the request, runs, and stores its response. A retry with the
+# same key and fingerprint gets that response back, marked Idempotent-Replayed,
+# without running the route again. Keys are scoped to the caller, a key reused
+# for a different request is a 422 and a retry while the first attempt is still
+# running a 409. Responses of 500 and above release the key so the request can
+# be retried. Claims of a request that never finished expire after `lockTime`.
+class IdempotencyMiddleware:
+    def __init__(
+        self,
+        app,
+        ttl: Optional[float] = None,
+        lockTime: Optional[float] = None,
+        cacheSize: Optional[int] = None,
+    ):
+        self.app = app
+        self.ttl = (
+            ttl
+            if ttl is not None
+            else float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+        )
+        self.lockTime = (
+            lockTime
+            if lockTime is not None
+            else float(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", 60))
+        )
+        self.cache = ResponseCache(
+            (
+                cacheSize
+                if cacheSize is not None
+                else int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 10000))
+            ),
+            self.ttl,
+        )
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in IDEMPOTENT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if not (key := Headers(scope=scope).get("idempotency-key")):
+            await self.app(scope, receive, send)
+            return
+
+        body, messages = b"", []
+        while True:
+            message = await receive()
+            messages.append(message)
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+
+        id = f"{clientKey(scope, JWT_SECRET_KEY)}:{key}"
+        requestFingerprint = fingerprint(scope, body)
+
+        if (response := self.cache.get(id)) is not None:
+            if response["fingerprint"] != requestFingerprint:
+                await self.mismatch(scope, receive, send)
+                return
+
+            IDEMPOTENT_REPLAYS.labels("memory").inc()
+            await self.replay(response, send)
+            return
+
+        db = scope["app"].dependency_overrides.get(getDb, getDb)()
+        stored = await to_thread.run_sync(self.claim, db, id, requestFingerprint)
+
+        if stored is not None:
+            if stored["fingerprint"] != requestFingerprint:
+                await self.mismatch(scope, receive, send)
+            elif "status" not in stored:
+                await conflict(
+                    409, "A request with this Idempotency-Key is in progress"
+                )(scope, receive, send)
+            else:
+                self.cache.set(id, stored)
+                IDEMPOTENT_REPLAYS.labels("database").inc()
+                await self.replay(stored, send)
+            return
+
+        async def replayBody():
+            return messages.pop(0) if messages else await receive()
+
+        start, chunks = None, []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replayBody, capture)
+        finally:
+            response = None
+            if start is not None and start["status"] < 500:
+                response = {
+                    "fingerprint": requestFingerprint,
+                    "status": start["status"],
+                    "headers": [
+                        [name.decode("latin-1"), value.decode("latin-1")]
+                        for name, value in start["headers"]
+                        if name.lower() != b"content-length"
+                    ],
+                    "body": withoutCredentials(b"".join(chunks)),
+                }
+                self.cache.set(id, response)
+
+            await to_thread.run_sync(self.complete, db, id, response)
+
+    async def mismatch(self, scope, receive, send):
+        await conflict(422, "Idempotency-Key was already used for a different request")(
+            scope, receive, send
+        )
+
+    async def replay(self, response: dict, send):
+        headers = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in response["headers"]
+        ]
+        headers += [
+            (b"content-length", str(len(response["body"])).encode()),
+            (b"idempotent-replayed", b"true"),
+        ]
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response["status"],
+                "headers": headers,
+            }
+        )
+        await send({"type": "http.response.body", "body": response["body"]})
+
+    # Returns the stored document when the key was already claimed.
+    #
+    # The TTL monitor deletes expired keys up to a minute late, so a claim or
+    # response past its expiresAt counts as gone and is taken over in place. The
+    # expiry check is part of the replace's filter, so of two requests taking
+    # over the same key only one matches.
+    def claim(self, db, id: str, requestFingerprint: str) -> Optional[dict]:
+        for _ in range(3):
+            now = expiry(0)
+            document = {
+                "_id": id,
+                "fingerprint": requestFingerprint,
+                "expiresAt": expiry(self.lockTime),
+            }
+
+            try:
+                db.idempotencyKeys.insert_one(document)
+                return None
+            except DuplicateKeyError:
+                pass
+
+            if db.idempotencyKeys.replace_one(
+                {"_id": id, "expiresAt": {"$lte": now}}, document
+            ).matched_count:
+                return None
+
+            stored = db.idempotencyKeys.find_one(
+                {"_id": id, "expiresAt": {"$gt": now}}
+            )
+            if stored is not None:
+                return stored
+
+        return {"fingerprint": requestFingerprint}
+
+    def complete(self, db, id: str, response: Optional[dict]):
+        if response is None:
+            db.idempotencyKeys.delete_one({"_id": id})
+            return
+
+        db.idempotencyKeys.update_one(
+            {"_id": id}, {"$set": {**response, "expiresAt": expiry(self.ttl)}}
+        )
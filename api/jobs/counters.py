@@ -0,0 +1,72 @@
+# This job recomputes the denormalised taskCounts on every milestone and project
+# from the tasks collection, repairing any drift in the $inc maintained counters.
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from api.database import aggregateTaskCounts, countedFields, getDb
+
+BATCH_SIZE = 1000
+
+
+def emptyCounts() -> dict:
+    return {"total": 0, "status": {}, "priority": {}}
+
+
+def addCounts(counts: dict, status: str, priority: str, amount: int):
+    counts["total"] += amount
+    counts["status"][status] = counts["status"].get(status, 0) + amount
+    counts["priority"][priority] = counts["priority"].get(priority, 0) + amount
+
+
+def writeCounts(collection, counts: dict[str, dict]):
+    batch = []
+
+    for document in collection.find({}, {"_id": 1}):
+        batch.append(
+            UpdateOne(
+                {"_id": document["_id"]},
+                {
+                    "$set": {
+                        "taskCounts": counts.get(str(document["_id"]), emptyCounts())
+                    }
+                },
+            )
+        )
+
+        if len(batch) >= BATCH_SIZE:
+            collection.bulk_write(batch, ordered=False)
+            batch = []
+
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+
+
+def repairTaskCounts(db: Database):
+    projectCounts: dict[str, dict] = {}
+    milestoneCounts: dict[str, dict] = {}
+
+    # Groups of tasks still stored with an older status are added to the one
+    # they are upgraded to.
+    for group in aggregateTaskCounts(db):
+        key = countedFields(group["_id"])
+
+        for counts, id in (
+            (projectCounts, key["projectId"]),
+            (milestoneCounts, key["milestoneId"]),
+        ):
+            addCounts(
+                counts.setdefault(id, emptyCounts()),
+                key["status"],
+                key["priority"],
+                group["count"],
+            )
+
+    writeCounts(db.projects, projectCounts)
+    writeCounts(db.milestones, milestoneCounts)
+
+
+if __name__ == "__main__":
+    repairTaskCounts(getDb())
+
+    print("Task counts repaired")
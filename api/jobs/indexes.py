@@ -0,0 +1,66 @@
+# This job creates the indexes declared in api.database.INDEXES and explains the
+# task queries issued by GET /projects/{id}/tasks, failing if any of them would
+# scan the collection or sort in memory instead of walking an index.
+
+import sys
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.database import Database
+
+from api.database import createIndexes, getDb
+
+# (filter, sort) shapes issued by the task query endpoint, see findTasksPage.
+TASK_QUERIES = [
+    ({}, [("dueDate", ASCENDING), ("_id", ASCENDING)]),
+    ({}, [("dueDate", DESCENDING), ("_id", DESCENDING)]),
+    ({}, [("createdAt", ASCENDING), ("_id", ASCENDING)]),
+    ({"priority": "High"}, [("_id", ASCENDING)]),
+    ({"status": "To Do"}, [("dueDate", ASCENDING), ("_id", ASCENDING)]),
+    ({"milestoneId": ""}, [("dueDate", ASCENDING), ("_id", ASCENDING)]),
+    ({"assignedTo": ""}, [("dueDate", ASCENDING), ("_id", ASCENDING)]),
+    ({"qaTask.assignedTo": ""}, [("dueDate", ASCENDING), ("_id", ASCENDING)]),
+]
+
+BAD_STAGES = {"COLLSCAN", "SORT"}
+
+
+def planStages(plan: dict) -> list[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += planStages(plan[key])
+
+    for child in plan.get("inputStages", []):
+        stages += planStages(child)
+
+    return stages
+
+
+def explainTaskQueries(db: Database) -> list[tuple[dict, list, list[str]]]:
+    projectId = str(ObjectId())
+    results = []
+
+    for filter, sort in TASK_QUERIES:
+        filter = {"projectId": projectId, **filter}
+        plan = db.tasks.find(filter).sort(sort).limit(51).explain()
+        results.append((filter, sort, planStages(plan["queryPlanner"]["winningPlan"])))
+
+    return results
+
+
+if __name__ == "__main__":
+    db = getDb()
+
+    createIndexes(db)
+
+    failed = False
+
+    for filter, sort, stages in explainTaskQueries(db):
+        bad = BAD_STAGES.intersection(stages)
+        failed |= bool(bad)
+
+        print("FAIL" if bad else "OK  ", filter, sort, " -> ".join(stages))
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,72 @@
+# This job repairs sprint membership. Back-references to sprints that no longer
+# exist are cleared. Ids of deleted tasks and milestones, of ones outside the
+# sprint's project and of ones another sprint holds are pulled from the sprints
+# listing them, the ones left point back at their sprint through sprintId, and
+# back-references to sprints that no longer list them are cleared.
+
+from bson import ObjectId
+from pymongo.database import Database
+
+from api.database import (
+    claimSprintMembers,
+    findSprintIds,
+    getDb,
+    releaseSprintMembers,
+    withVersion,
+)
+
+MEMBER_COLLECTIONS = ("tasks", "milestones")
+
+
+def repairSprint(db: Database, sprint: dict) -> int:
+    sprintId = str(sprint["_id"])
+    pulled = 0
+
+    for collection in MEMBER_COLLECTIONS:
+        ids = sprint.get(collection, [])
+        sprintIds = findSprintIds(
+            db,
+            collection,
+            sprint["projectId"],
+            [id for id in ids if ObjectId.is_valid(id)],
+        )
+
+        if dangling := [id for id in ids if sprintIds.get(id) not in ("", sprintId)]:
+            db.sprints.update_one(
+                {"_id": sprint["_id"]},
+                {"$pull": {collection: {"$in": dangling}}, "$inc": {"version": 1}},
+            )
+            pulled += len(dangling)
+
+        claimSprintMembers(
+            db, sprintId, collection, [id for id in ids if sprintIds.get(id) == ""]
+        )
+        releaseSprintMembers(
+            db, sprintId, collection, [id for id in ids if id not in dangling]
+        )
+
+    return pulled
+
+
+# Back-references to deleted sprints are cleared first, so the tasks and
+# milestones they held can be claimed by the sprints still listing them.
+def repairSprintMembers(db: Database) -> int:
+    sprintIds = [str(sprint["_id"]) for sprint in db.sprints.find({}, {"_id": 1})]
+    for collection in MEMBER_COLLECTIONS:
+        db[collection].update_many(
+            {"sprintId": {"$exists": True, "$nin": sprintIds + [""]}},
+            withVersion({"$unset": {"sprintId": ""}}),
+        )
+
+    return sum(
+        repairSprint(db, sprint)
+        for sprint in db.sprints.find(
+            {}, {"projectId": 1, **{collection: 1 for collection in MEMBER_COLLECTIONS}}
+        )
+    )
+
+
+if __name__ == "__main__":
+    pulled = repairSprintMembers(getDb())
+
+    print(f"Sprint members repaired, {pulled} dangling ids removed")
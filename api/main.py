@@ -1,21 +1,63 @@
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Callable
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from prometheus_client import Counter
+from prometheus_client import CONTENT_TYPE_LATEST, Counter
 from prometheus_fastapi_instrumentator import Instrumentator
 from prometheus_fastapi_instrumentator.metrics import Info, default
 
+from .compression import CompressionMiddleware
+from .database import CAUSAL_TIME_HEADER, CausalTimeMiddleware, closeClient, getDb
+from .idempotency import IdempotencyMiddleware
+from .metrics import SeriesLimit, exposition, timed
+from .ratelimit import RateLimitMiddleware
 from .routers import router
+from .versions import writeBack, writeBackLoop
 
-app = FastAPI(title="Kraken API", swagger_ui_parameters={"persistAuthorization": True})
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Indexes are created by the migrations runner and api.jobs.indexes on
+    # deploy, not by every worker that starts.
+    db = app.dependency_overrides.get(getDb, getDb)()
+
+    writeBackTask = asyncio.create_task(writeBackLoop(db))
+    metricsTask = asyncio.create_task(exposition.loop())
+    yield
+    writeBackTask.cancel()
+    metricsTask.cancel()
+
+    writeBack.flush(db)
+    closeClient()
+
+
+app = FastAPI(
+    title="Kraken API",
+    swagger_ui_parameters={"persistAuthorization": True},
+    lifespan=lifespan,
+)
+
+app.add_middleware(CausalTimeMiddleware)
+
+app.add_middleware(IdempotencyMiddleware)
+
+app.add_middleware(CompressionMiddleware)
+
+app.add_middleware(RateLimitMiddleware)
+
+# Added after the others so it wraps them, responses they answer on their own,
+# e.g. a 429 or an idempotency conflict, still carry the CORS headers. Only the
+# Prometheus middleware added by instrument() below sits outside it, it observes
+# every request, preflights included, and never answers one itself.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[CAUSAL_TIME_HEADER],
 )
 
 app.include_router(router)
@@ -24,21 +66,31 @@ app.include_router(router)
 instrumentator = Instrumentator()
 
 
+# Endpoints are counted by route template rather than by path, paths with ids
+# in them would make a series per document.
 def endpointCounter() -> Callable[[Info], None]:
-    METRIC = Counter(
-        "endpoint_counter",
-        "Counts the number of requests to an endpoint",
-        ["method", "endpoint"],
+    METRIC = SeriesLimit(
+        Counter(
+            "endpoint_counter",
+            "Counts the number of requests to an endpoint",
+            ["method", "endpoint"],
+        )
     )
 
     def _endpointCounter(info: Info) -> None:
-        req = info.request
-        METRIC.labels(method=req.method, endpoint=req.url.path).inc()
+        METRIC.labels(info.method, info.modified_handler).inc()
 
     return _endpointCounter
 
 
-instrumentator.add(endpointCounter()).add(default())
+instrumentator.add(timed("endpoint_counter", endpointCounter())).add(
+    timed("default", default())
+)
+
+
+instrumentator.instrument(app)
 
 
-instrumentator.instrument(app).expose(app, include_in_schema=False)
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    return Response(exposition.latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,171 @@
+import asyncio
+import fcntl
+import os
+import threading
+import time
+from functools import wraps
+from typing import Callable, Optional
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+OVERFLOW = "__overflow__"
+
+METRICS_OVERHEAD_SECONDS = Histogram(
+    "metrics_overhead_seconds",
+    "Time spent recording request metrics and rendering /metrics, by stage",
+    ["stage"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+METRICS_SERIES_OVERFLOW = Counter(
+    "metrics_series_overflow",
+    "Observations recorded in the overflow series of a metric at its series limit",
+    ["metric"],
+)
+
+
+# Caps the label sets a metric records in this worker at `maxSeries`, further
+# label sets are recorded under OVERFLOW for every label so a label fed from
+# request data can't grow the series, and the exposition, without bound.
+class SeriesLimit:
+    def __init__(self, metric, maxSeries: Optional[int] = None):
+        self.metric = metric
+        self.maxSeries = (
+            maxSeries
+            if maxSeries is not None
+            else int(os.environ.get("METRICS_MAX_SERIES", 1000))
+        )
+        self.series = set()
+        self.lock = threading.Lock()
+
+    def labels(self, *values: str):
+        with self.lock:
+            if values not in self.series and len(self.series) < self.maxSeries:
+                self.series.add(values)
+
+            overflow = values not in self.series
+
+        if overflow:
+            METRICS_SERIES_OVERFLOW.labels(self.metric._name).inc()
+            return self.metric.labels(*[OVERFLOW] * len(values))
+
+        return self.metric.labels(*values)
+
+
+# Records how long an instrumentation callback takes on every request.
+def timed(stage: str, callback: Callable) -> Callable:
+    @wraps(callback)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            METRICS_OVERHEAD_SECONDS.labels(stage).observe(
+                time.perf_counter() - started
+            )
+
+    return wrapper
+
+
+# Renders the exposition on a timer instead of on every scrape, so a scrape is
+# answered with the last rendering, at most `interval` seconds old. Rendering
+# stops while nothing scrapes for `idleTime` and the next scrape renders again.
+#
+# With PROMETHEUS_MULTIPROC_DIR set the metrics of every worker are merged, and
+# the rendering is shared through a file in that directory instead: a scrape
+# finding it older than `interval` renders it under a file lock, so the merged
+# registry is rendered at most once per interval whichever workers are scraped.
+class Exposition:
+    FILE = "exposition.prom"
+    LOCK = "exposition.lock"
+
+    def __init__(self, interval: Optional[float] = None, idleTime: float = 60):
+        self.interval = (
+            interval
+            if interval is not None
+            else float(os.environ.get("METRICS_RENDER_INTERVAL_SECONDS", 5))
+        )
+        self.idleTime = idleTime
+        self.content = None
+        self.renderedAt = None
+        self.requestedAt = None
+        self.lock = threading.Lock()
+
+    def generate(self, registry) -> bytes:
+        started = time.perf_counter()
+        content = generate_latest(registry)
+        METRICS_OVERHEAD_SECONDS.labels("render").observe(
+            time.perf_counter() - started
+        )
+
+        return content
+
+    def render(self) -> bytes:
+        with self.lock:
+            content = self.generate(REGISTRY)
+            self.content, self.renderedAt = content, time.monotonic()
+
+        return content
+
+    def latest(self) -> bytes:
+        if directory := os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            return self.shared(directory)
+
+        self.requestedAt = now = time.monotonic()
+
+        if self.content is None or now - self.renderedAt > self.interval * 2:
+            return self.render()
+
+        return self.content
+
+    def fresh(self, path: str) -> Optional[bytes]:
+        try:
+            if time.time() - os.path.getmtime(path) <= self.interval:
+                with open(path, "rb") as file:
+                    return file.read()
+        except FileNotFoundError:
+            pass
+
+        return None
+
+    def shared(self, directory: str) -> bytes:
+        path = os.path.join(directory, self.FILE)
+        if (content := self.fresh(path)) is not None:
+            return content
+
+        with open(os.path.join(directory, self.LOCK), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # Another worker may have rendered it while this one waited.
+            if (content := self.fresh(path)) is not None:
+                return content
+
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            content = self.generate(registry)
+
+            temporary = f"{path}.{os.getpid()}"
+            with open(temporary, "wb") as file:
+                file.write(content)
+            os.replace(temporary, path)
+
+        return content
+
+    async def loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+
+            if (
+                self.requestedAt is not None
+                and time.monotonic() - self.requestedAt < self.idleTime
+            ):
+                await asyncio.to_thread(self.render)
+
+
+exposition = Exposition()
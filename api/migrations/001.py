@@ -1,14 +1,27 @@
-# This migration backfills createdAt field to Milestones
+# This migration backfills createdAt on Milestones from the creation time in their
+# ObjectId, it also repairs milestones stamped with the time the old script ran.
 
-from api.database import getDb
-from api.schemas import now
+from pymongo import UpdateOne
 
-if __name__ == "__main__":
-    db = getDb()
+from api.database import ID_PROJECTION
+from api.migrations.runner import Step
 
-    db.milestones.update_many(
-        {},
-        {"$set": {"createdAt": now()}},
-    )
 
-    print("Migration completed")
+def createdAt(milestones: list[dict]) -> list:
+    return [
+        UpdateOne(
+            {"_id": milestone["_id"]},
+            {
+                "$set": {
+                    "createdAt": milestone["_id"]
+                    .generation_time.astimezone()
+                    .replace(tzinfo=None)
+                },
+                "$inc": {"version": 1},
+            },
+        )
+        for milestone in milestones
+    ]
+
+
+STEPS = [Step("milestones", {}, createdAt, ID_PROJECTION)]
@@ -1,24 +1,25 @@
 # This migration changes all the Status Todo into To Do in the database.
 
-from api.database import getDb
+from api.database import ID_PROJECTION
+from api.migrations.runner import Step, updateEach
 
-if __name__ == "__main__":
-    db = getDb()
-
-    # if the status is Todo, change it to To Do
-    db.tasks.update_many(
+STEPS = [
+    Step(
+        "tasks",
         {"status": "Todo"},
-        {"$set": {"status": "To Do"}},
-    )
-
-    db.tasks.update_many(
+        updateEach({"$set": {"status": "To Do"}}),
+        ID_PROJECTION,
+    ),
+    Step(
+        "tasks",
         {"qaTask.status": "Todo"},
-        {"$set": {"qaTask.status": "To Do"}},
-    )
-
-    db.milestones.update_many(
+        updateEach({"$set": {"qaTask.status": "To Do"}}),
+        ID_PROJECTION,
+    ),
+    Step(
+        "milestones",
         {"status": "Todo"},
-        {"$set": {"status": "To Do"}},
-    )
-
-    print("Migration completed")
+        updateEach({"$set": {"status": "To Do"}}),
+        ID_PROJECTION,
+    ),
+]
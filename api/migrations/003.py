@@ -0,0 +1,61 @@
+# This migration moves project membership from the ownedProjects/joinedProjects
+# arrays on users into the memberships collection. Until a user's arrays are
+# removed they are read along with the memberships, removing them bumps the
+# user's membershipsVersion so workers reload the memberships.
+
+from pymongo import UpdateOne
+
+from api.database import ID_PROJECTION
+from api.migrations.runner import Step, updateEach
+from api.schemas import Role
+
+HAS_ARRAYS = {
+    "$or": [
+        {"ownedProjects": {"$exists": True}},
+        {"joinedProjects": {"$exists": True}},
+    ]
+}
+
+
+def memberships(users: list[dict]) -> list:
+    operations = []
+
+    for user in users:
+        # Owners keep the owner role even if they also joined their own project.
+        for role, field in (
+            (Role.owner, "ownedProjects"),
+            (Role.member, "joinedProjects"),
+        ):
+            for projectId in user.get(field, []):
+                operations.append(
+                    UpdateOne(
+                        {"projectId": projectId, "userId": str(user["_id"])},
+                        {"$setOnInsert": {"role": role.value}},
+                        upsert=True,
+                    )
+                )
+
+    return operations
+
+
+STEPS = [
+    Step(
+        "users",
+        HAS_ARRAYS,
+        memberships,
+        {"ownedProjects": 1, "joinedProjects": 1},
+        target="memberships",
+        ordered=True,
+    ),
+    Step(
+        "users",
+        HAS_ARRAYS,
+        updateEach(
+            {
+                "$unset": {"ownedProjects": "", "joinedProjects": ""},
+                "$inc": {"membershipsVersion": 1},
+            }
+        ),
+        ID_PROJECTION,
+    ),
+]
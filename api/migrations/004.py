@@ -0,0 +1,85 @@
+# This migration backfills the sprintId back-reference on the tasks and milestones
+# listed by every sprint. Only ids in the sprint's own project are claimed, and an
+# id listed by several sprints goes to the first of them in _id order and is
+# pulled from the others.
+
+from bson import ObjectId
+from pymongo import UpdateMany
+
+from api.database import NO_SPRINT
+from api.migrations.runner import Step
+
+
+def sprintIds(collection: str):
+    def migrate(sprints: list[dict]) -> list:
+        return [
+            UpdateMany(
+                {
+                    "_id": {
+                        "$in": [
+                            ObjectId(id)
+                            for id in sprint[collection]
+                            if ObjectId.is_valid(id)
+                        ]
+                    },
+                    "projectId": sprint.get("projectId"),
+                    "sprintId": NO_SPRINT,
+                },
+                {"$set": {"sprintId": str(sprint["_id"])}},
+            )
+            for sprint in sprints
+            if sprint.get(collection)
+        ]
+
+    return migrate
+
+
+# Takes every claimed id off the other sprints of its project listing it.
+def pullFromOtherSprints(collection: str):
+    def migrate(documents: list[dict]) -> list:
+        return [
+            UpdateMany(
+                {
+                    "projectId": document.get("projectId"),
+                    "_id": {"$ne": ObjectId(document["sprintId"])},
+                    collection: str(document["_id"]),
+                },
+                {"$pull": {collection: str(document["_id"])}, "$inc": {"version": 1}},
+            )
+            for document in documents
+            if ObjectId.is_valid(document["sprintId"])
+        ]
+
+    return migrate
+
+
+STEPS = [
+    Step(
+        "sprints",
+        {},
+        sprintIds("tasks"),
+        {"projectId": 1, "tasks": 1},
+        target="tasks",
+    ),
+    Step(
+        "sprints",
+        {},
+        sprintIds("milestones"),
+        {"projectId": 1, "milestones": 1},
+        target="milestones",
+    ),
+    Step(
+        "tasks",
+        {"sprintId": {"$nin": [None, ""]}},
+        pullFromOtherSprints("tasks"),
+        {"projectId": 1, "sprintId": 1},
+        target="sprints",
+    ),
+    Step(
+        "milestones",
+        {"sprintId": {"$nin": [None, ""]}},
+        pullFromOtherSprints("milestones"),
+        {"projectId": 1, "sprintId": 1},
+        target="sprints",
+    ),
+]
@@ -0,0 +1,204 @@
+# Applies the numbered migrations in this package in order, recording each one in
+# the migrations collection once it has run.
+#
+# A migration module defines STEPS, each a scan over one collection in _id order.
+# Every batch of matching documents is turned into bulk writes by the step, then
+# the last _id of the batch is checkpointed, so an interrupted run resumes after
+# the last finished batch. A batch can be written twice if the runner stops
+# between its writes and its checkpoint, so steps must be idempotent. Batches are
+# throttled to --rate documents per second to keep the load on the primary and
+# the replication lag down. The indexes in api.database are created before any
+# migration runs.
+#
+#   python -m api.migrations.runner --batch-size 1000 --rate 5000 [--dry-run]
+
+import argparse
+import importlib
+import pkgutil
+import time
+from typing import Callable, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.database import Database
+
+import api.migrations
+from api.database import createIndexes, getDb
+from api.schemas import now
+
+REPORT_INTERVAL = 10
+
+
+class Step:
+    def __init__(
+        self,
+        collection: str,
+        filter: dict,
+        migrate: Callable[[list[dict]], list],
+        projection: Optional[dict] = None,
+        target: Optional[str] = None,
+        ordered: bool = False,
+    ):
+        self.collection = collection
+        self.filter = filter
+        self.migrate = migrate
+        self.projection = projection
+        self.target = target or collection
+        self.ordered = ordered
+
+
+# A migrate function applying the same update to every document of a batch.
+def updateEach(update: dict) -> Callable[[list[dict]], list]:
+    def migrate(documents: list[dict]) -> list:
+        return [UpdateOne({"_id": document["_id"]}, update) for document in documents]
+
+    return migrate
+
+
+class Throttle:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    def wait(self, count: int):
+        self.count += count
+        if self.rate <= 0:
+            return
+
+        ahead = self.count / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def findMigrations() -> list[str]:
+    return sorted(
+        module.name
+        for module in pkgutil.iter_modules(api.migrations.__path__)
+        if module.name.isdigit()
+    )
+
+
+def report(version: str, step: Step, documents: int, writes: int, started: float):
+    elapsed = time.monotonic() - started
+    print(
+        f"{version} {step.collection}: {documents} documents, {writes} writes "
+        f"in {elapsed:.1f}s ({documents / max(elapsed, 1e-9):.0f} documents/s)"
+    )
+
+
+def runStep(
+    db: Database,
+    version: str,
+    index: int,
+    step: Step,
+    lastId,
+    batchSize: int,
+    throttle: Throttle,
+    dryRun: bool,
+):
+    documents = writes = 0
+    started = reported = time.monotonic()
+
+    while True:
+        filter = dict(step.filter)
+        if lastId is not None:
+            filter["_id"] = {"$gt": lastId}
+
+        batch = list(
+            db[step.collection]
+            .find(filter, step.projection)
+            .sort("_id", ASCENDING)
+            .limit(batchSize)
+        )
+        if not batch:
+            break
+
+        operations = step.migrate(batch)
+        lastId = batch[-1]["_id"]
+        documents += len(batch)
+        writes += len(operations)
+
+        if not dryRun:
+            if operations:
+                db[step.target].bulk_write(operations, ordered=step.ordered)
+
+            db.migrations.update_one(
+                {"_id": version},
+                {
+                    "$set": {"checkpoint": {"step": index, "lastId": lastId}},
+                    "$inc": {"documents": len(batch), "writes": len(operations)},
+                },
+            )
+
+        throttle.wait(len(batch))
+
+        if time.monotonic() - reported >= REPORT_INTERVAL:
+            report(version, step, documents, writes, started)
+            reported = time.monotonic()
+
+    report(version, step, documents, writes, started)
+
+
+# Returns whether the migration ran, applied migrations are skipped.
+def runMigration(
+    db: Database,
+    version: str,
+    batchSize: int = 1000,
+    rate: float = 0,
+    dryRun: bool = False,
+) -> bool:
+    record = db.migrations.find_one({"_id": version}) or {}
+    if record.get("appliedAt"):
+        return False
+
+    module = importlib.import_module(f"api.migrations.{version}")
+    checkpoint = record.get("checkpoint", {"step": 0, "lastId": None})
+    throttle = Throttle(rate)
+
+    if not dryRun:
+        db.migrations.update_one(
+            {"_id": version}, {"$setOnInsert": {"startedAt": now()}}, upsert=True
+        )
+
+    for index, step in enumerate(module.STEPS):
+        if index < checkpoint["step"]:
+            continue
+
+        lastId = checkpoint["lastId"] if index == checkpoint["step"] else None
+        runStep(db, version, index, step, lastId, batchSize, throttle, dryRun)
+
+    if not dryRun:
+        db.migrations.update_one(
+            {"_id": version},
+            {"$set": {"appliedAt": now()}, "$unset": {"checkpoint": ""}},
+        )
+
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="documents per second")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--to", help="last version to apply")
+    args = parser.parse_args()
+
+    db = getDb()
+
+    # Workers don't create indexes on startup, a deploy gets them from here.
+    if not args.dry_run:
+        createIndexes(db)
+
+    for version in findMigrations():
+        if args.to and version > args.to:
+            break
+
+        if not runMigration(db, version, args.batch_size, args.rate, args.dry_run):
+            print(f"{version} already applied")
+
+    print("Dry run completed" if args.dry_run else "Migrations completed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import base64
+import datetime
+from typing import Optional
+
+from bson import ObjectId, json_util
+from fastapi import HTTPException, status
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+
+"""
+Keyset pagination helpers.
+
+Pages are ordered by (field, _id) and the cursor handed back to the client is
+the position of the last document on the page, so fetching the next page is an
+index seek rather than a skip over every previous page.
+"""
+
+
+def encodeCursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+# Types a keyset field's values can take, missing fields sort as None.
+DATETIME_VALUES = (datetime.datetime, type(None))
+
+
+# The values end up in query filters, so anything but a sort value of the
+# expected type and an ObjectId is rejected rather than passed on, e.g. an
+# operator document.
+def decodeCursor(cursor: str, valueTypes: tuple) -> list:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        values = None
+
+    if (
+        not isinstance(values, list)
+        or len(values) != 2
+        or not isinstance(values[0], valueTypes)
+        or not isinstance(values[1], ObjectId)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+    return values
+
+
+def afterFilter(field: str, direction: int, value, id) -> dict:
+    op = "$gt" if direction == ASCENDING else "$lt"
+
+    return {"$or": [{field: {op: value}}, {field: value, "_id": {op: id}}]}
+
+
+def keysetPage(
+    collection: Collection,
+    filter: dict,
+    field: str,
+    direction: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    valueTypes: tuple = DATETIME_VALUES,
+) -> tuple[list[dict], Optional[str]]:
+    if cursor:
+        after = afterFilter(field, direction, *decodeCursor(cursor, valueTypes))
+        filter = {"$and": [filter, after]}
+
+    documents = list(
+        collection.find(filter)
+        .sort([(field, direction), ("_id", direction)])
+        .limit(limit + 1)
+    )
+
+    if len(documents) <= limit:
+        return documents, None
+
+    last = documents[limit - 1]
+
+    return documents[:limit], encodeCursor([last.get(field), last["_id"]])
+
+
+# Pages through a field with a small, known set of values (e.g. priority) in the
+# given order, one indexed (field, _id) range per value.
+def bucketedPage(
+    collection: Collection,
+    filter: dict,
+    field: str,
+    buckets: list,
+    limit: int,
+    cursor: Optional[str] = None,
+) -> tuple[list[dict], Optional[str]]:
+    start, lastId = decodeCursor(cursor, (str,)) if cursor else (buckets[0], None)
+
+    if start not in buckets:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+    documents = []
+
+    for bucket in buckets[buckets.index(start) :]:
+        bucketFilter = {"$and": [filter, {field: bucket}]}
+
+        if bucket == start and lastId is not None:
+            bucketFilter["$and"].append({"_id": {"$gt": lastId}})
+
+        documents += (
+            collection.find(bucketFilter)
+            .sort("_id", ASCENDING)
+            .limit(limit + 1 - len(documents))
+        )
+
+        if len(documents) > limit:
+            last = documents[limit - 1]
+
+            return documents[:limit], encodeCursor([last[field], last["_id"]])
+
+    return documents, None
@@ -0,0 +1,68 @@
+import os
+import secrets
+from functools import lru_cache
+from typing import Optional
+
+from prometheus_client import Counter, Histogram
+
+# Passwords are hashed with the first of PASSWORD_SCHEMES, e.g. "argon2,bcrypt"
+# once argon2-cffi is installed, at BCRYPT_ROUNDS for bcrypt. Hashes made with
+# another scheme or cost still verify and are replaced on the user's next login,
+# so changing either only takes a deploy.
+PASSWORD_SCHEMES = os.environ.get("PASSWORD_SCHEMES", "bcrypt").split(",")
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds",
+    "Time spent hashing and verifying passwords, to tune the hash cost",
+    ["operation"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+PASSWORD_REHASHES = Counter(
+    "password_rehashes",
+    "Password hashes replaced on login after the scheme or cost changed",
+)
+
+
+# passlib is imported on first use, keeping it off the import path of every
+# worker that is spun up.
+@lru_cache(maxsize=None)
+def passwordContext(schemes: tuple, rounds: int):
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=list(schemes),
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def context():
+    return passwordContext(tuple(PASSWORD_SCHEMES), BCRYPT_ROUNDS)
+
+
+# A hash of a random password at the current cost, verified against when there
+# is no user so unknown usernames take as long to reject as wrong passwords.
+@lru_cache(maxsize=None)
+def dummyHash(schemes: tuple, rounds: int) -> str:
+    return passwordContext(schemes, rounds).hash(secrets.token_urlsafe())
+
+
+def hashPassword(password: str) -> str:
+    with PASSWORD_HASH_SECONDS.labels("hash").time():
+        return context().hash(password)
+
+
+# Returns whether the password matches and, when the hash is outdated, a new one.
+def verifyPassword(password: str, hash: str) -> tuple[bool, Optional[str]]:
+    with PASSWORD_HASH_SECONDS.labels("verify").time():
+        return context().verify_and_update(password, hash)
+
+
+def dummyVerify(password: str):
+    hash = dummyHash(tuple(PASSWORD_SCHEMES), BCRYPT_ROUNDS)
+
+    with PASSWORD_HASH_SECONDS.labels("dummy").time():
+        context().verify(password, hash)
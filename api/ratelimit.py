@@ -0,0 +1,228 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from anyio import to_thread
+from fastapi.routing import APIRoute
+from jose import JWTError, jwt
+from prometheus_client import Counter
+from pymongo import ReturnDocument
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from api.tokens import JWT_SECRET_KEY, expiry
+
+RATE_LIMITED_REQUESTS = Counter(
+    "rate_limited_requests",
+    "Requests rejected with a 429, by route and by which limit they hit",
+    ["route", "reason"],
+)
+
+# Tokens a request takes from its bucket, routes left out cost 1. Login and
+# register pay for bcrypt, getProject loads the whole project.
+COSTS = {
+    "POST /users/login": 5,
+    "POST /users/register": 5,
+    "GET /projects/{id}": 5,
+}
+
+
+# Token buckets kept in the worker, each worker limits on its own. The least
+# recently used buckets are dropped past maxKeys, a dropped bucket starts full.
+class MemoryBackend:
+    blocking = False
+
+    def __init__(self, maxKeys: int = 100_000):
+        self.maxKeys = maxKeys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Returns 0 when the tokens were taken, otherwise the seconds until they can be.
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        now = time.monotonic()
+
+        with self.lock:
+            tokens, updatedAt = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updatedAt) * rate)
+
+            wait = 0 if tokens >= cost else (cost - tokens) / rate
+            if not wait:
+                tokens -= cost
+
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.maxKeys:
+                self.buckets.popitem(last=False)
+
+        return wait
+
+
+# Token buckets shared by every worker in a rateLimits collection. Each request
+# refills and takes from its bucket in one atomic pipeline update, buckets expire
+# through their TTL index once they would be full again.
+class MongoBackend:
+    blocking = True
+
+    def __init__(self, getDb: Callable):
+        self.getDb = getDb
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        collection = self.getDb().rateLimits
+
+        now = time.time()
+        expiresAt = expiry(burst / rate)
+
+        elapsed = {"$subtract": [now, {"$ifNull": ["$updatedAt", now]}]}
+        refilled = {
+            "$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]
+        }
+        taken = {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}
+
+        bucket = collection.find_one_and_update(
+            {"_id": key},
+            [
+                {
+                    "$set": {
+                        "tokens": {"$min": [burst, refilled]},
+                        "updatedAt": now,
+                        "expiresAt": expiresAt,
+                    }
+                },
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": taken}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        return 0 if bucket["allowed"] else (cost - bucket["tokens"]) / rate
+
+
+def defaultBackend():
+    if os.environ.get("RATE_LIMIT_BACKEND", "memory") == "mongo":
+        from api.database import getDb
+
+        return MongoBackend(getDb)
+
+    return MemoryBackend()
+
+
+def routeName(scope) -> Optional[str]:
+    for route in scope["app"].router.routes:
+        if not isinstance(route, APIRoute) or not route.include_in_schema:
+            continue
+
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path_format}"
+
+    return None
+
+
+# The user id comes from the token's signature alone, the user is not looked up.
+# Requests without a valid token are limited by client address.
+def clientKey(scope, secretKey: str) -> str:
+    authorization = Headers(scope=scope).get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+
+    if scheme.lower() == "bearer" and token:
+        try:
+            return f"user:{jwt.decode(token, secretKey, algorithms=['HS256'])['sub']}"
+        except (JWTError, KeyError):
+            pass
+
+    client = scope.get("client")
+    return f"address:{client[0] if client else 'unknown'}"
+
+
+def tooManyRequests(wait: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Too many requests"},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+
+# Rejects requests with a 429 once a client runs out of tokens for a route, or
+# has `concurrency` requests in flight on this worker. Only API routes are
+# limited, the docs and /metrics are not.
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        costs: Optional[dict] = None,
+        backend=None,
+        secretKey: Optional[str] = None,
+    ):
+        self.app = app
+        self.rate = (
+            rate if rate is not None else float(os.environ.get("RATE_LIMIT_RATE", 0))
+        )
+        self.burst = (
+            burst
+            if burst is not None
+            else float(os.environ.get("RATE_LIMIT_BURST", self.rate * 5))
+        )
+        self.concurrency = (
+            concurrency
+            if concurrency is not None
+            else int(os.environ.get("RATE_LIMIT_CONCURRENCY", 0))
+        )
+        self.costs = {
+            **COSTS,
+            **(costs or json.loads(os.environ.get("RATE_LIMIT_COSTS", "{}"))),
+        }
+        self.backend = backend or defaultBackend()
+        self.secretKey = secretKey or JWT_SECRET_KEY
+        self.inFlight = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.rate or self.concurrency):
+            await self.app(scope, receive, send)
+            return
+
+        if (route := routeName(scope)) is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = clientKey(scope, self.secretKey)
+
+        if self.rate:
+            bucket = f"{key}:{route}"
+            cost = min(self.costs.get(route, 1), self.burst)
+
+            if self.backend.blocking:
+                wait = await to_thread.run_sync(
+                    self.backend.take, bucket, cost, self.rate, self.burst
+                )
+            else:
+                wait = self.backend.take(bucket, cost, self.rate, self.burst)
+
+            if wait:
+                RATE_LIMITED_REQUESTS.labels(route, "rate").inc()
+                await tooManyRequests(wait)(scope, receive, send)
+                return
+
+        if not self.concurrency:
+            await self.app(scope, receive, send)
+            return
+
+        if self.inFlight.get(key, 0) >= self.concurrency:
+            RATE_LIMITED_REQUESTS.labels(route, "concurrency").inc()
+            await tooManyRequests(1)(scope, receive, send)
+            return
+
+        self.inFlight[key] = self.inFlight.get(key, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.inFlight[key] -= 1
+            if not self.inFlight[key]:
+                del self.inFlight[key]
@@ -1,19 +1,35 @@
-from fastapi import APIRouter, HTTPException, status
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
 
 from api.database import (
+    MILESTONE_SUMMARY_PROJECTION,
+    SPRINT_MEMBER_PROJECTION,
+    TASK_COUNTS_PROJECTION,
     DBDep,
-    findMilestoneAndUpdate,
-    findMilestoneById,
-    findProjectById,
+    decrementTaskCounts,
+    etag,
+    findAccessibleAndUpdate,
+    findAuthorized,
+    findAuthorizedProject,
     findTasks,
     insertMilestone,
+    parseIfMatch,
+    pullFromSprints,
+    raiseUpdateFailure,
     removeMilestone,
+    removeTasks,
     updateManyMilestones,
     updateManyTasks,
 )
-from api.routers.tasks import deleteTask
 from api.routers.users import UserDep
-from api.schemas import CreateableMilestone, Milestone, UpdateableMilestone
+from api.schemas import (
+    CreateableMilestone,
+    Milestone,
+    MilestoneSummary,
+    UpdateableMilestone,
+)
+from api.versions import upgrade
 
 router = APIRouter()
 
@@ -23,17 +39,7 @@ router = APIRouter()
 def createMilestone(
     createableMilestone: CreateableMilestone, db: DBDep, user: UserDep
 ) -> Milestone:
-    if not findProjectById(db, createableMilestone.projectId):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-    if not user.canAccess(createableMilestone.projectId):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    findAuthorizedProject(db, createableMilestone.projectId, user)
 
     milestone = Milestone(**createableMilestone.model_dump())
     if not (result := insertMilestone(db, milestone)).acknowledged:
@@ -49,66 +55,58 @@ def createMilestone(
 
 # FR23
 @router.get("/{id}", name="Get Milestone")
-def getMilestone(id: str, db: DBDep, user: UserDep) -> Milestone:
-    if not (milestone := findMilestoneById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Milestone not found",
-        )
+def getMilestone(id: str, db: DBDep, user: UserDep, response: Response) -> Milestone:
+    milestone = findAuthorized(db, "milestones", "Milestone", id, user, None)
 
-    if not user.canAccess(milestone["projectId"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    response.headers["ETag"] = etag(milestone)
+
+    return Milestone(**upgrade("milestones", milestone))
 
-    return Milestone(**milestone)
+
+@router.get("/{id}/summary", name="Get Milestone Summary")
+def getMilestoneSummary(id: str, db: DBDep, user: UserDep) -> MilestoneSummary:
+    milestone = findAuthorized(
+        db, "milestones", "Milestone", id, user, MILESTONE_SUMMARY_PROJECTION
+    )
+
+    return MilestoneSummary(**milestone)
 
 
 # FR15
 @router.patch("/{id}", name="Update Milestone")
 def updateMilestone(
-    id: str, updateableMilestone: UpdateableMilestone, db: DBDep, user: UserDep
+    id: str,
+    updateableMilestone: UpdateableMilestone,
+    db: DBDep,
+    user: UserDep,
+    response: Response,
+    ifMatch: Annotated[Optional[str], Header(alias="If-Match")] = None,
 ) -> Milestone:
-    if not (milestone := findMilestoneById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Milestone not found",
-        )
-
-    if not user.canAccess(milestone["projectId"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    version = parseIfMatch(ifMatch)
 
     if not (
-        result := findMilestoneAndUpdate(
-            db, id, {"$set": updateableMilestone.model_dump(exclude_none=True)}
+        result := findAccessibleAndUpdate(
+            db,
+            "milestones",
+            id,
+            user,
+            version,
+            {"$set": updateableMilestone.model_dump(exclude_none=True)},
         )
     ):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update milestone",
-        )
+        raiseUpdateFailure(db, "milestones", "Milestone", id, user, version)
+
+    response.headers["ETag"] = etag(result)
 
-    return Milestone(**result)
+    return Milestone(**upgrade("milestones", result))
 
 
 # FR16
 @router.delete("/{id}", name="Delete Milestone")
 def deleteMilestone(id: str, db: DBDep, user: UserDep):
-    if not (milestone := findMilestoneById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Milestone not found",
-        )
-
-    if not user.canAccess(milestone["projectId"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    milestone = findAuthorized(
+        db, "milestones", "Milestone", id, user, SPRINT_MEMBER_PROJECTION
+    )
 
     if not removeMilestone(db, id).deleted_count:
         raise HTTPException(
@@ -116,24 +114,46 @@ def deleteMilestone(id: str, db: DBDep, user: UserDep):
             detail="Failed to delete milestone",
         )
 
-    for task in findTasks(db, {"milestoneId": id}):
-        deleteTask(str(task["_id"]), db, user)
-
-    if not updateManyMilestones(
-        db,
-        {},
-        {"$pull": {"dependentMilestones": id}},
-    ).acknowledged:
+    # The milestone's tasks go in one delete, then one update per collection pulls
+    # both them and the milestone from whatever depends on them.
+    tasks = list(
+        findTasks(
+            db,
+            {"milestoneId": id},
+            None,
+            {**TASK_COUNTS_PROJECTION, **SPRINT_MEMBER_PROJECTION},
+        )
+    )
+    taskIds = [str(task["_id"]) for task in tasks]
+
+    # By _id, a task created since the find is left rather than deleted uncounted.
+    if tasks:
+        removeTasks(db, {"_id": {"$in": [task["_id"] for task in tasks]}})
+        decrementTaskCounts(db, tasks)
+
+    pullFromSprints(db, "milestones", [milestone])
+    pullFromSprints(db, "tasks", tasks)
+
+    filter = {
+        "$or": [
+            {"dependentMilestones": id},
+            {"dependentTasks": {"$in": taskIds}},
+        ]
+    }
+    update = {
+        "$pull": {
+            "dependentMilestones": id,
+            "dependentTasks": {"$in": taskIds},
+        }
+    }
+
+    if not updateManyMilestones(db, filter, update).acknowledged:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to remove task from milestone",
         )
 
-    if not updateManyTasks(
-        db,
-        {},
-        {"$pull": {"dependentMilestones": id}},
-    ).acknowledged:
+    if not updateManyTasks(db, filter, update).acknowledged:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to remove task from dependent tasks",
@@ -1,36 +1,58 @@
-from fastapi import APIRouter, HTTPException, status
+import datetime
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, HTTPException, Query, status
+from pymongo import ASCENDING, DESCENDING
 
 from api.database import (
+    ID_PROJECTION,
+    PROJECT_SUMMARY_PROJECTION,
     DBDep,
+    findAuthorizedProject,
+    findMemberIds,
     findMilestones,
     findProjectAndUpdate,
     findProjectById,
     findSprints,
     findTasks,
-    findUserAndUpdate,
-    findUserAndUpdateByEmail,
-    findUserAndUpdateById,
+    findTasksPage,
+    findUserByEmail,
+    findUserById,
     insertProject,
+    readCollection,
+    removeMembership,
     removeMilestones,
     removeProject,
+    removeProjectMemberships,
     removeSprints,
     removeTasks,
     toObjectId,
     updateManyTasks,
-    updateManyUsers,
+    upsertMembership,
 )
 from api.routers.sprints import sprintToSprintView
 from api.routers.users import UserDep
 from api.schemas import (
+    UNASSIGNED,
     CreateableProject,
+    CreatedProject,
     Milestone,
+    Priority,
     Project,
+    ProjectSummary,
     ProjectView,
+    Role,
+    SortOrder,
+    Status,
     Task,
+    TaskPage,
+    TaskSort,
     UpdateableProject,
     User,
     UserView,
 )
+from api.tokens import renewedToken, revokeTokens, withAccessToken
+from api.versions import upgrade
 
 router = APIRouter()
 
@@ -41,8 +63,8 @@ def createProject(
     createableProject: CreateableProject,
     db: DBDep,
     user: UserDep,
-) -> Project:
-    project = Project(**createableProject.model_dump())
+) -> CreatedProject:
+    project = CreatedProject(**createableProject.model_dump())
     if not (result := insertProject(db, project)).acknowledged:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -51,16 +73,20 @@ def createProject(
 
     project.id = str(result.inserted_id)
 
-    if not findUserAndUpdate(
-        db,
-        user,
-        {"$push": {"ownedProjects": project.id}},
-    ):
+    if not upsertMembership(db, project.id, user.id, Role.owner).acknowledged:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update user",
         )
 
+    revokeTokens(db, user.id)
+
+    project.token = renewedToken(
+        User(
+            **{**user.model_dump(), "ownedProjects": user.ownedProjects + [project.id]}
+        )
+    )
+
     return project
 
 
@@ -69,8 +95,8 @@ def createProject(
 def getProjects(db: DBDep, user: UserDep) -> list[Project]:
     return [
         Project(**project)
-        for project in db.projects.find(
-            {"_id": {"$in": [toObjectId(id) for id in user.projects()]}}
+        for project in readCollection(db, "projects", "views").find(
+            {"_id": {"$in": user.projectOids()}}
         )
     ]
 
@@ -78,44 +104,102 @@ def getProjects(db: DBDep, user: UserDep) -> list[Project]:
 # FR23
 @router.get("/{id}", name="Get Project")
 def getProject(id: str, db: DBDep, user: UserDep) -> ProjectView:
-    if not (project := findProjectById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-    if not user.canAccess(id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    project = findAuthorizedProject(db, id, user, None)
 
     project = ProjectView(**project)
     project.milestones = [
-        Milestone(**milestone) for milestone in findMilestones(db, {"projectId": id})
+        Milestone(**upgrade("milestones", milestone))
+        for milestone in findMilestones(db, {"projectId": id})
+    ]
+    project.tasks = [
+        Task(**upgrade("tasks", task)) for task in findTasks(db, {"projectId": id})
     ]
-    project.tasks = [Task(**task) for task in findTasks(db, {"projectId": id})]
+
+    # The sprint views reuse the tasks and milestones loaded above, grouped by
+    # their sprintId, instead of fetching each member again.
+    sprintTasks, sprintMilestones = {}, {}
+    for members, documents in (
+        (sprintTasks, project.tasks),
+        (sprintMilestones, project.milestones),
+    ):
+        for document in documents:
+            members.setdefault(document.sprintId, []).append(document)
+
     project.sprints = [
-        sprintToSprintView(db, sprint) for sprint in findSprints(db, {"projectId": id})
+        sprintToSprintView(
+            sprint,
+            sprintTasks.get(str(sprint["_id"]), []),
+            sprintMilestones.get(str(sprint["_id"]), []),
+        )
+        for sprint in findSprints(db, {"projectId": id})
     ]
 
     return project
 
 
+@router.get("/{id}/summary", name="Get Project Summary")
+def getProjectSummary(id: str, db: DBDep, user: UserDep) -> ProjectSummary:
+    project = findAuthorizedProject(db, id, user, PROJECT_SUMMARY_PROJECTION)
+
+    return ProjectSummary(**project)
+
+
+@router.get("/{id}/tasks", name="Get Project Tasks")
+def getProjectTasks(
+    id: str,
+    db: DBDep,
+    user: UserDep,
+    taskStatus: Annotated[Optional[Status], Query(alias="status")] = None,
+    priority: Optional[Priority] = None,
+    assignedTo: Optional[str] = None,
+    qaAssignedTo: Annotated[Optional[str], Query(alias="qaTask.assignedTo")] = None,
+    milestoneId: Optional[str] = None,
+    dueAfter: Optional[datetime.datetime] = None,
+    dueBefore: Optional[datetime.datetime] = None,
+    sort: TaskSort = TaskSort.dueDate,
+    order: SortOrder = SortOrder.asc,
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    cursor: Optional[str] = None,
+) -> TaskPage:
+    findAuthorizedProject(db, id, user)
+
+    filter = {"projectId": id}
+
+    for field, value in (
+        ("status", taskStatus and taskStatus.value),
+        ("priority", priority and priority.value),
+        ("assignedTo", assignedTo),
+        ("qaTask.assignedTo", qaAssignedTo),
+        ("milestoneId", milestoneId),
+    ):
+        if value is not None:
+            filter[field] = value
+
+    if dueAfter or dueBefore:
+        filter["dueDate"] = {}
+        if dueAfter:
+            filter["dueDate"]["$gte"] = dueAfter
+        if dueBefore:
+            filter["dueDate"]["$lt"] = dueBefore
+
+    tasks, nextCursor = findTasksPage(
+        db,
+        filter,
+        sort,
+        ASCENDING if order == SortOrder.asc else DESCENDING,
+        limit,
+        cursor,
+    )
+
+    return TaskPage(
+        tasks=[Task(**upgrade("tasks", task)) for task in tasks], nextCursor=nextCursor
+    )
+
+
 # FR5
 @router.delete("/{id}", name="Delete Project")
 def deleteProject(id: str, db: DBDep, user: UserDep):
-    if not (findProjectById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-    if not user.isAdmin(id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    findAuthorizedProject(db, id, user, admin=True)
 
     if not removeProject(db, id).acknowledged:
         raise HTTPException(
@@ -141,21 +225,7 @@ def deleteProject(id: str, db: DBDep, user: UserDep):
             detail="Failed to delete sprints",
         )
 
-    if not findUserAndUpdate(
-        db,
-        user,
-        {"$pull": {"ownedProjects": id}},
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update user",
-        )
-
-    if not updateManyUsers(
-        db,
-        {},
-        {"$pull": {"joinedProjects": id}},
-    ).acknowledged:
+    if not removeProjectMemberships(db, id).acknowledged:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update users",
@@ -171,25 +241,18 @@ def deleteProject(id: str, db: DBDep, user: UserDep):
 def updateProject(
     id: str, updateableProject: UpdateableProject, db: DBDep, user: UserDep
 ) -> Project:
-    if not findProjectById(db, id):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-    if not user.isAdmin(id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
-
     if not (
-        result := findProjectAndUpdate(
-            db,
-            id,
-            {"$set": updateableProject.model_dump(exclude_none=True)},
+        user.isAdmin(id)
+        and (
+            result := findProjectAndUpdate(
+                db,
+                id,
+                {"$set": updateableProject.model_dump(exclude_none=True)},
+            )
         )
     ):
+        findAuthorizedProject(db, id, user, admin=True)
+
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update project",
@@ -201,43 +264,38 @@ def updateProject(
 # FR8
 @router.post("/{id}/join", name="Join Project")
 def joinProject(id: str, db: DBDep, user: UserDep) -> User:
-    if not findProjectById(db, id):
+    if not findProjectById(db, id, ID_PROJECTION):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found",
         )
 
-    if not (
-        updatedUser := findUserAndUpdate(
-            db,
-            user,
-            {"$push": {"joinedProjects": id}},
-        )
-    ):
+    if user.canAccess(id):
+        return user
+
+    if not upsertMembership(db, id, user.id, Role.member).acknowledged:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to join project",
         )
 
-    return User(**updatedUser)
+    revokeTokens(db, user.id)
+
+    return withAccessToken(
+        User(**{**user.model_dump(), "joinedProjects": user.joinedProjects + [id]})
+    )
 
 
 # FR9
 @router.delete("/{id}/leave", name="Leave Project")
 def leaveProject(id: str, db: DBDep, user: UserDep) -> User:
-    if not findProjectById(db, id):
+    if not findProjectById(db, id, ID_PROJECTION):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found",
         )
 
-    if not (
-        updatedUser := findUserAndUpdate(
-            db,
-            user,
-            {"$pull": {"joinedProjects": id}},
-        )
-    ):
+    if not removeMembership(db, id, user.id, Role.member).acknowledged:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to leave project",
@@ -247,7 +305,7 @@ def leaveProject(id: str, db: DBDep, user: UserDep) -> User:
         updateManyTasks(
             db,
             {"projectId": id, "assignedTo": user.username},
-            {"$set": {"assignedTo": "Unassigned"}},
+            {"$set": {"assignedTo": UNASSIGNED}},
         ).acknowledged
     ):
         raise HTTPException(
@@ -259,7 +317,7 @@ def leaveProject(id: str, db: DBDep, user: UserDep) -> User:
         updateManyTasks(
             db,
             {"projectId": id, "qaTask.assignedTo": user.username},
-            {"$set": {"qaTask.assignedTo": "Unassigned"}},
+            {"$set": {"qaTask.assignedTo": UNASSIGNED}},
         ).acknowledged
     ):
         raise HTTPException(
@@ -267,71 +325,58 @@ def leaveProject(id: str, db: DBDep, user: UserDep) -> User:
             detail="Failed to leave project",
         )
 
-    return User(**updatedUser)
+    revokeTokens(db, user.id)
+
+    return withAccessToken(
+        User(
+            **{
+                **user.model_dump(),
+                "joinedProjects": [p for p in user.joinedProjects if p != id],
+            }
+        )
+    )
 
 
 # FR10
 @router.post("/{id}/users", name="Add User to Project")
 def addProjectUser(id: str, email: str, user: UserDep, db: DBDep) -> UserView:
-    if not findProjectById(db, id):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-    if not user.isAdmin(id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    findAuthorizedProject(db, id, user, admin=True)
 
-    if not (
-        updatedUser := findUserAndUpdateByEmail(
-            db,
-            email,
-            {"$push": {"joinedProjects": id}},
-        )
+    if (
+        not (addedUser := findUserByEmail(db, email))
+        or not upsertMembership(db, id, str(addedUser["_id"]), Role.member).acknowledged
     ):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to add user to project",
         )
 
-    return UserView(**updatedUser)
+    revokeTokens(db, str(addedUser["_id"]))
+
+    return UserView(**addedUser)
 
 
 # FR11
 @router.delete("/{id}/users", name="Remove User from Project")
 def removeProjectUser(id: str, userID: str, user: UserDep, db: DBDep) -> UserView:
-    if not findProjectById(db, id):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-    if not user.isAdmin(id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    findAuthorizedProject(db, id, user, admin=True)
 
-    if not (
-        updatedUser := findUserAndUpdateById(
-            db,
-            userID,
-            {"$pull": {"joinedProjects": id}},
-        )
+    if (
+        not (removedUser := findUserById(db, userID))
+        or not removeMembership(db, id, userID, Role.member).acknowledged
     ):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to remove user from project",
         )
 
+    revokeTokens(db, userID)
+
     if not (
         updateManyTasks(
             db,
-            {"projectId": id, "assignedTo": updatedUser["username"]},
-            {"$set": {"assignedTo": "Unassigned"}},
+            {"projectId": id, "assignedTo": removedUser["username"]},
+            {"$set": {"assignedTo": UNASSIGNED}},
         ).acknowledged
     ):
         raise HTTPException(
@@ -342,8 +387,8 @@ def removeProjectUser(id: str, userID: str, user: UserDep, db: DBDep) -> UserVie
     if not (
         updateManyTasks(
             db,
-            {"projectId": id, "qaTask.assignedTo": updatedUser["username"]},
-            {"$set": {"qaTask.assignedTo": "Unassigned"}},
+            {"projectId": id, "qaTask.assignedTo": removedUser["username"]},
+            {"$set": {"qaTask.assignedTo": UNASSIGNED}},
         ).acknowledged
     ):
         raise HTTPException(
@@ -351,22 +396,19 @@ def removeProjectUser(id: str, userID: str, user: UserDep, db: DBDep) -> UserVie
             detail="Failed to remove user from project",
         )
 
-    return UserView(**updatedUser)
+    return UserView(**removedUser)
 
 
 # FR12
 @router.get("/{id}/users", name="Get Project Users")
 def getProjectUsers(id: str, db: DBDep, user: UserDep) -> list[UserView]:
-    if not findProjectById(db, id):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
+    findAuthorizedProject(db, id, user)
 
-    if not user.canAccess(id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    memberOids = [toObjectId(userId) for userId in findMemberIds(db, id, Role.member)]
 
-    return [UserView(**user) for user in db.users.find({"joinedProjects": id})]
+    return [
+        UserView(**user)
+        for user in readCollection(db, "users", "views").find(
+            {"_id": {"$in": memberOids}}
+        )
+    ]
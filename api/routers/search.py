@@ -0,0 +1,112 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated
+
+from fastapi import APIRouter, Query
+from pymongo.database import Database
+
+from api.database import (
+    DBDep,
+    TextSearchDep,
+    findSearchable,
+    textSearch,
+)
+from api.routers.users import UserDep
+from api.schemas import SearchPage, SearchResult, SearchType, User
+from api.search import InvertedIndex, highlight
+
+router = APIRouter()
+
+TYPES = {
+    "projects": SearchType.project,
+    "milestones": SearchType.milestone,
+    "tasks": SearchType.task,
+}
+
+# Each collection is searched for the top start + limit results, so how deep a
+# search can page is capped. The query per collection runs in parallel on a
+# worker-wide thread pool.
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", 200))
+searchExecutor = ThreadPoolExecutor(len(TYPES), thread_name_prefix="search")
+
+
+def searchScopes(user: User) -> dict[str, dict]:
+    return {
+        "projects": {"_id": {"$in": user.projectOids()}},
+        "milestones": {"projectId": {"$in": user.projects()}},
+        "tasks": {"projectId": {"$in": user.projects()}},
+    }
+
+
+# Used when text search is disabled, ranks the caller's documents with an
+# inverted index built for this request.
+def fallbackSearch(db: Database, q: str, scopes: dict[str, dict], limit: int):
+    index = InvertedIndex()
+    documents = {}
+
+    for collection, filter in scopes.items():
+        for document in findSearchable(db, collection, filter):
+            key = (collection, document["_id"])
+            documents[key] = document
+            index.add(key, document)
+
+    return [(key[0], documents[key], score) for key, score in index.search(q)[:limit]]
+
+
+def rankedDocuments(db: Database, q: str, user: User, limit: int, useTextSearch: bool):
+    if not useTextSearch:
+        return fallbackSearch(db, q, searchScopes(user), limit)
+
+    def run(scope: tuple[str, dict]) -> list[tuple[str, dict, float]]:
+        collection, filter = scope
+        return [
+            (collection, document, document["score"])
+            for document in textSearch(db, collection, q, filter, limit)
+        ]
+
+    # A session can only be used by one thread at a time, so requests running in
+    # a causally consistent session search the collections one after another.
+    fanOut = searchExecutor.map if isinstance(db, Database) else map
+
+    results = [
+        result
+        for results in fanOut(run, searchScopes(user).items())
+        for result in results
+    ]
+
+    return sorted(results, key=lambda result: result[2], reverse=True)[:limit]
+
+
+@router.get("", name="Search")
+def search(
+    q: Annotated[str, Query(min_length=1)],
+    db: DBDep,
+    user: UserDep,
+    useTextSearch: TextSearchDep,
+    page: Annotated[int, Query(ge=1)] = 1,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+) -> SearchPage:
+    start = (page - 1) * limit
+    end = min(start + limit, SEARCH_MAX_RESULTS)
+    results = (
+        rankedDocuments(db, q, user, end + 1, useTextSearch) if start < end else []
+    )
+
+    return SearchPage(
+        results=[
+            SearchResult(
+                type=TYPES[collection],
+                id=document["_id"],
+                projectId=document.get("projectId", str(document["_id"])),
+                name=document["name"],
+                description=document["description"],
+                score=score,
+                highlights={
+                    field: highlight(document[field], q)
+                    for field in ("name", "description")
+                },
+            )
+            for collection, document, score in results[start:end]
+        ],
+        nextPage=page + 1 if end < min(len(results), SEARCH_MAX_RESULTS) else None,
+    )
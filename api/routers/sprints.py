@@ -1,24 +1,36 @@
-from fastapi import APIRouter, HTTPException, status
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
 
 from api.database import (
     DBDep,
-    findMilestoneById,
-    findProjectById,
-    findSprintAndUpdate,
-    findSprintById,
-    findTaskById,
+    claimSprintMembers,
+    clearSprintMembers,
+    etag,
+    findAccessibleAndUpdate,
+    findAuthorized,
+    findAuthorizedProject,
+    findMilestones,
+    findSprintIds,
+    findTasks,
     insertSprint,
+    parseIfMatch,
+    raiseUpdateFailure,
+    releaseSprintMembers,
     removeSprint,
+    removeSprintMembers,
 )
 from api.routers.users import UserDep
 from api.schemas import (
     CreateableSprint,
     Milestone,
     Sprint,
+    SprintMembers,
     SprintView,
     Task,
     UpdateableSprint,
 )
+from api.versions import upgrade
 
 router = APIRouter()
 
@@ -28,17 +40,7 @@ router = APIRouter()
 def createSprint(
     createableSprint: CreateableSprint, db: DBDep, user: UserDep
 ) -> Sprint:
-    if not findProjectById(db, createableSprint.projectId):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-    if not user.canAccess(createableSprint.projectId):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    findAuthorizedProject(db, createableSprint.projectId, user)
 
     sprint = Sprint(**createableSprint.model_dump())
     if not (result := insertSprint(db, sprint)).acknowledged:
@@ -52,93 +54,236 @@ def createSprint(
     return sprint
 
 
-def sprintToSprintView(db: DBDep, sprint: dict) -> SprintView:
-    tasks = [findTaskById(db, task) for task in sprint.pop("tasks")]
-    milestones = [
-        findMilestoneById(db, milestone) for milestone in sprint.pop("milestones")
-    ]
-
-    sprintView = SprintView(**sprint)
+# The members come from their sprintId, the sprint's own lists are left out.
+def sprintToSprintView(
+    sprint: dict, tasks: list[Task], milestones: list[Milestone]
+) -> SprintView:
+    sprintView = SprintView(
+        **{
+            key: value
+            for key, value in upgrade("sprints", sprint).items()
+            if key not in ("tasks", "milestones")
+        }
+    )
 
-    sprintView.tasks = [Task(**task) for task in tasks if task]
-    sprintView.milestones = [
-        Milestone(**milestone) for milestone in milestones if milestone
-    ]
+    sprintView.tasks = tasks
+    sprintView.milestones = milestones
 
     return sprintView
 
 
 # FR28
 @router.get("/{id}", name="Get Sprint")
-def getSprint(id: str, db: DBDep, user: UserDep) -> SprintView:
-    if not (sprint := findSprintById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Sprint not found",
-        )
+def getSprint(id: str, db: DBDep, user: UserDep, response: Response) -> SprintView:
+    sprint = findAuthorized(db, "sprints", "Sprint", id, user, None)
 
-    if not user.canAccess(sprint["projectId"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    response.headers["ETag"] = etag(sprint)
+
+    # Members are also matched on the sprint's project, so a back-reference left
+    # on a task moved elsewhere never shows it here.
+    members = {"sprintId": id, "projectId": sprint["projectId"]}
 
-    return sprintToSprintView(db, sprint)
+    return sprintToSprintView(
+        sprint,
+        [Task(**upgrade("tasks", task)) for task in findTasks(db, members)],
+        [
+            Milestone(**upgrade("milestones", milestone))
+            for milestone in findMilestones(db, members)
+        ],
+    )
 
 
 # FR27
 @router.patch("/{id}", name="Update Sprint")
 def updateSprint(
-    id: str, updateableSprint: UpdateableSprint, db: DBDep, user: UserDep
+    id: str,
+    updateableSprint: UpdateableSprint,
+    db: DBDep,
+    user: UserDep,
+    response: Response,
+    ifMatch: Annotated[Optional[str], Header(alias="If-Match")] = None,
 ) -> Sprint:
-    if not (sprint := findSprintById(db, id)):
+    version = parseIfMatch(ifMatch)
+    members = {
+        collection: ids
+        for collection in ("tasks", "milestones")
+        if (ids := getattr(updateableSprint, collection)) is not None
+    }
+
+    # New members are claimed before the sprint is written and released again
+    # if the update fails.
+    claimed = {}
+    try:
+        if members:
+            sprint = findAuthorized(db, "sprints", "Sprint", id, user, {"projectId": 1})
+
+            for collection, ids in members.items():
+                claimed[collection] = claimMembers(
+                    db, sprint, collection, collection.capitalize(), ids
+                )
+
+        if not (
+            result := findAccessibleAndUpdate(
+                db,
+                "sprints",
+                id,
+                user,
+                version,
+                {"$set": updateableSprint.model_dump(exclude_none=True)},
+            )
+        ):
+            raiseUpdateFailure(db, "sprints", "Sprint", id, user, version)
+    except HTTPException:
+        for collection, ids in claimed.items():
+            removeSprintMembers(db, id, collection, ids)
+        raise
+
+    for collection, ids in members.items():
+        releaseSprintMembers(db, id, collection, ids)
+
+    response.headers["ETag"] = etag(result)
+
+    return Sprint(**upgrade("sprints", result))
+
+
+# FR26
+@router.delete("/{id}", name="Delete Sprint")
+def deleteSprint(id: str, db: DBDep, user: UserDep):
+    findAuthorized(db, "sprints", "Sprint", id, user)
+
+    if not removeSprint(db, id).deleted_count:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Sprint not found",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete sprint",
         )
 
-    if not user.canAccess(sprint["projectId"]):
+    clearSprintMembers(db, id)
+
+    return {"message": "Sprint deleted successfully"}
+
+
+# Of `ids`, the tasks or milestones of the sprint's project that are in no sprint
+# yet. Ids outside the project are a 400 and, as a task or milestone is in one
+# sprint at a time, ids in another sprint a 409.
+def freeMembers(
+    db: DBDep, sprint: dict, collection: str, name: str, ids: list[str]
+) -> list[str]:
+    ids = list(dict.fromkeys(ids))
+    sprintIds = findSprintIds(db, collection, sprint["projectId"], ids)
+
+    if missing := [id for id in ids if id not in sprintIds]:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{name} not found in the sprint's project: {', '.join(missing)}",
         )
 
-    if not (
-        result := findSprintAndUpdate(
-            db,
-            id,
-            {
-                "$set": updateableSprint.model_dump(exclude_none=True),
-            },
-        )
-    ):
+    if taken := [id for id in ids if sprintIds[id] not in ("", str(sprint["_id"]))]:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update sprint",
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{name} already in another sprint: {', '.join(taken)}",
         )
 
-    return Sprint(**result)
+    return [id for id in ids if not sprintIds[id]]
 
 
-# FR26
-@router.delete("/{id}", name="Delete Sprint")
-def deleteSprint(id: str, db: DBDep, user: UserDep):
-    if not (sprint := findSprintById(db, id)):
+# Returns the ids claimed for the sprint. A concurrent request claiming one of
+# them for another sprint first makes this a 409 without claiming any.
+def claimMembers(
+    db: DBDep, sprint: dict, collection: str, name: str, ids: list[str]
+) -> list[str]:
+    free = freeMembers(db, sprint, collection, name, ids)
+
+    if not claimSprintMembers(db, str(sprint["_id"]), collection, free):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Sprint not found",
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{name} already in another sprint",
         )
 
-    if not user.canAccess(sprint["projectId"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
+    return free
+
+
+# Adding or removing some members updates the sprint's lists in place with
+# $addToSet and $pull instead of rewriting them, so concurrent edits don't undo
+# each other. Added ids are claimed first, so two requests adding the same task
+# to different sprints can't both list it.
+def addMembers(
+    db: DBDep, user: UserDep, id: str, collection: str, name: str, ids: list[str]
+) -> dict:
+    ids = list(dict.fromkeys(ids))
+    sprint = findAuthorized(db, "sprints", "Sprint", id, user, {"projectId": 1})
+    claimed = claimMembers(db, sprint, collection, name, ids)
+
+    if not (
+        result := findAccessibleAndUpdate(
+            db,
+            "sprints",
+            id,
+            user,
+            None,
+            {"$addToSet": {collection: {"$each": ids}}},
         )
+    ):
+        removeSprintMembers(db, id, collection, claimed)
+        raiseUpdateFailure(db, "sprints", "Sprint", id, user, None)
 
-    if not removeSprint(db, id).deleted_count:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to delete sprint",
+    return result
+
+
+def removeMembers(
+    db: DBDep, user: UserDep, id: str, collection: str, ids: list[str]
+) -> dict:
+    if not (
+        result := findAccessibleAndUpdate(
+            db,
+            "sprints",
+            id,
+            user,
+            None,
+            {"$pull": {collection: {"$in": ids}}},
         )
+    ):
+        raiseUpdateFailure(db, "sprints", "Sprint", id, user, None)
 
-    return {"message": "Sprint deleted successfully"}
+    removeSprintMembers(db, id, collection, ids)
+
+    return result
+
+
+def sprintResponse(result: dict, response: Response) -> Sprint:
+    response.headers["ETag"] = etag(result)
+
+    return Sprint(**upgrade("sprints", result))
+
+
+@router.post("/{id}/tasks", name="Add Sprint Tasks")
+def addSprintTasks(
+    id: str, members: SprintMembers, db: DBDep, user: UserDep, response: Response
+) -> Sprint:
+    return sprintResponse(
+        addMembers(db, user, id, "tasks", "Tasks", members.ids), response
+    )
+
+
+@router.delete("/{id}/tasks", name="Remove Sprint Tasks")
+def removeSprintTasks(
+    id: str, members: SprintMembers, db: DBDep, user: UserDep, response: Response
+) -> Sprint:
+    return sprintResponse(removeMembers(db, user, id, "tasks", members.ids), response)
+
+
+@router.post("/{id}/milestones", name="Add Sprint Milestones")
+def addSprintMilestones(
+    id: str, members: SprintMembers, db: DBDep, user: UserDep, response: Response
+) -> Sprint:
+    return sprintResponse(
+        addMembers(db, user, id, "milestones", "Milestones", members.ids), response
+    )
+
+
+@router.delete("/{id}/milestones", name="Remove Sprint Milestones")
+def removeSprintMilestones(
+    id: str, members: SprintMembers, db: DBDep, user: UserDep, response: Response
+) -> Sprint:
+    return sprintResponse(
+        removeMembers(db, user, id, "milestones", members.ids), response
+    )
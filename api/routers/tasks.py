@@ -1,18 +1,32 @@
-from fastapi import APIRouter, HTTPException, status
+from functools import partial
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
+from pymongo import ReturnDocument
 
 from api.database import (
+    SPRINT_MEMBER_PROJECTION,
+    TASK_COUNTS_PROJECTION,
     DBDep,
-    findMilestoneById,
-    findProjectById,
-    findTaskAndUpdate,
-    findTaskById,
+    etag,
+    findAccessibleAndDelete,
+    findAccessibleAndUpdate,
+    findAuthorized,
+    findAuthorizedMilestoneInProject,
+    findAuthorizedProject,
+    incrementTaskCounts,
     insertTask,
-    removeTask,
+    moveTaskCounts,
+    parseIfMatch,
+    pullFromSprints,
+    raiseUpdateFailure,
     updateManyMilestones,
     updateManyTasks,
+    updatedDocument,
 )
 from api.routers.users import UserDep
 from api.schemas import CreateableTask, Task, UpdateableTask
+from api.versions import upgrade
 
 router = APIRouter()
 
@@ -20,29 +34,9 @@ router = APIRouter()
 # FR17/18
 @router.post("/", name="Create Task")
 def createTask(createableTask: CreateableTask, db: DBDep, user: UserDep) -> Task:
-    if not findProjectById(db, createableTask.projectId):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-    if not (milestone := findMilestoneById(db, createableTask.milestoneId)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Milestone not found",
-        )
-
-    if milestone["projectId"] != createableTask.projectId:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Milestone does not belong to project",
-        )
-
-    if not user.canAccess(createableTask.projectId):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    findAuthorizedMilestoneInProject(
+        db, createableTask.milestoneId, createableTask.projectId, user
+    )
 
     task = Task(**createableTask.model_dump())
     if not (result := insertTask(db, task)).acknowledged:
@@ -53,97 +47,114 @@ def createTask(createableTask: CreateableTask, db: DBDep, user: UserDep) -> Task
 
     task.id = str(result.inserted_id)
 
+    incrementTaskCounts(db, task.model_dump(), 1)
+
     return task
 
 
 # FR23
 @router.get("/{id}", name="Get Task")
-def getTask(id: str, db: DBDep, user: UserDep) -> Task:
-    if not (task := findTaskById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Task not found",
-        )
+def getTask(id: str, db: DBDep, user: UserDep, response: Response) -> Task:
+    task = findAuthorized(db, "tasks", "Task", id, user, None)
 
-    if not user.canAccess(task["projectId"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
+    response.headers["ETag"] = etag(task)
 
-    return Task(**task)
+    return Task(**upgrade("tasks", task))
 
 
 # FR20
 @router.patch("/{id}", name="Update Task")
 def updateTask(
-    id: str, updateableTask: UpdateableTask, db: DBDep, user: UserDep
+    id: str,
+    updateableTask: UpdateableTask,
+    db: DBDep,
+    user: UserDep,
+    response: Response,
+    ifMatch: Annotated[Optional[str], Header(alias="If-Match")] = None,
 ) -> Task:
-    if updateableTask.projectId and not findProjectById(db, updateableTask.projectId):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
+    if updateableTask.projectId and updateableTask.milestoneId:
+        findAuthorizedMilestoneInProject(
+            db, updateableTask.milestoneId, updateableTask.projectId, user
         )
+    elif updateableTask.projectId:
+        findAuthorizedProject(db, updateableTask.projectId, user)
+    elif updateableTask.milestoneId:
+        findAuthorized(db, "milestones", "Milestone", updateableTask.milestoneId, user)
 
-    if updateableTask.milestoneId and not findMilestoneById(
-        db, updateableTask.milestoneId
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Milestone not found",
-        )
-
-    if not (task := findTaskById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Task not found",
-        )
-
-    if not user.canAccess(task["projectId"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
-        )
-
-    setFields = {**updateableTask.model_dump(exclude_none=True)}
+    version = parseIfMatch(ifMatch)
+    updates = updateableTask.model_dump(exclude_none=True)
+    setFields = {**updates}
 
     if qaTask := setFields.pop("qaTask", None):
         for k, v in qaTask.items():
             setFields[f"qaTask.{k}"] = v
 
-    if not (result := findTaskAndUpdate(db, id, {"$set": setFields})):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update task",
-        )
-
-    return Task(**result)
+    # The pre-image is what the counters need to move the task, and the task
+    # returned is built from it instead of read back. Values that didn't change
+    # cancel out, so only a changed project, milestone, status or priority
+    # writes to the counters, one $inc per milestone and project.
+    update = partial(
+        findAccessibleAndUpdate,
+        db,
+        "tasks",
+        id,
+        user,
+        version,
+        returnDocument=ReturnDocument.BEFORE,
+    )
+
+    # A sprint only holds tasks of its own project, so a task moved to another
+    # project leaves its sprint in the same update. The plain update only matches
+    # a task already in that project, only a miss tries it as a move.
+    change = {"$set": setFields}
+    if projectId := updates.get("projectId"):
+        if not (before := update(change, projects=[projectId])):
+            change = {"$set": setFields, "$unset": {"sprintId": ""}}
+            if before := update(
+                change, projects=[p for p in user.projects() if p != projectId]
+            ):
+                pullFromSprints(db, "tasks", [before])
+    else:
+        before = update(change)
+
+    if not before:
+        raiseUpdateFailure(db, "tasks", "Task", id, user, version)
+
+    task = updatedDocument(before, change)
+    moveTaskCounts(db, before, task)
+
+    response.headers["ETag"] = etag(task)
+
+    return Task(**upgrade("tasks", task))
 
 
 # FR21
 @router.delete("/{id}", name="Delete Task")
 def deleteTask(id: str, db: DBDep, user: UserDep):
-    if not (task := findTaskById(db, id)):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Task not found",
-        )
-
-    if not user.canAccess(task["projectId"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have access to project",
+    # The counters are decremented from the deleted document itself, so a
+    # concurrent status change can't make them drift.
+    if not (
+        task := findAccessibleAndDelete(
+            db,
+            "tasks",
+            id,
+            user,
+            {**TASK_COUNTS_PROJECTION, **SPRINT_MEMBER_PROJECTION},
         )
+    ):
+        findAuthorized(db, "tasks", "Task", id, user)
 
-    if not removeTask(db, id).deleted_count:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete task",
         )
 
+    incrementTaskCounts(db, task, -1)
+    pullFromSprints(db, "tasks", [task])
+
     if not updateManyMilestones(
         db,
-        {},
+        {"dependentTasks": id},
         {"$pull": {"dependentTasks": id}},
     ).acknowledged:
         raise HTTPException(
@@ -153,7 +164,7 @@ def deleteTask(id: str, db: DBDep, user: UserDep):
 
     if not updateManyTasks(
         db,
-        {},
+        {"dependentTasks": id},
         {"$pull": {"dependentTasks": id}},
     ).acknowledged:
         raise HTTPException(
@@ -1,32 +1,60 @@
-import os
-from typing import Annotated
+import json
+from typing import Annotated, Optional
+from urllib.parse import parse_qsl
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt
-from passlib.hash import bcrypt
+from pymongo import ASCENDING, DESCENDING
 
 from api.database import (
     DBDep,
+    findAssignedTasksPage,
     findUserAndUpdate,
     findUserByEmail,
     findUserById,
     findUserByUsername,
     insertUser,
+    loadMemberships,
+    updateUserPassword,
 )
-from api.schemas import CreatableUser, User
+from api.passwords import (
+    PASSWORD_REHASHES,
+    dummyVerify,
+    hashPassword,
+    verifyPassword,
+)
+from api.schemas import (
+    UNASSIGNED,
+    CreatableUser,
+    Credentials,
+    RefreshToken,
+    SortOrder,
+    Task,
+    TaskPage,
+    User,
+)
+from api.tokens import (
+    JWT_SECRET_KEY,
+    issueTokens,
+    revokeTokens,
+    signIn,
+    useRefreshToken,
+    userFromAccessToken,
+)
+from api.versions import upgrade
 
 router = APIRouter()
 
-JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "kraken")
-
 
 # FR1
 @router.post(
     "/register", status_code=status.HTTP_201_CREATED, response_model_by_alias=False
 )
 def register(createableUser: CreatableUser, db: DBDep) -> User:
-    if findUserByUsername(db, createableUser.username):
+    if createableUser.username == UNASSIGNED or findUserByUsername(
+        db, createableUser.username
+    ):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists"
         )
@@ -60,21 +88,88 @@ def register(createableUser: CreatableUser, db: DBDep) -> User:
             detail="Failed to create user",
         )
 
-    return User(**userWithToken)
+    return signIn(db, User(**userWithToken))
+
+
+# Credentials come from a JSON or form encoded body, which keeps passwords out of
+# access logs, or from the query parameters older clients send.
+async def loginCredentials(
+    request: Request, username: Optional[str] = None, password: Optional[str] = None
+) -> Credentials:
+    fields = {"username": username, "password": password}
+
+    if username is None or password is None:
+        contentType = request.headers.get("content-type", "")
+        body = await request.body()
+
+        try:
+            if contentType.startswith("application/json"):
+                fields = json.loads(body)
+            elif contentType.startswith("application/x-www-form-urlencoded"):
+                fields = dict(parse_qsl(body.decode()))
+
+            return Credentials(**fields)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Username and password are required",
+            )
+
+    return Credentials(**fields)
+
+
+CREDENTIALS_BODY = {
+    "requestBody": {
+        "content": {
+            contentType: {"schema": Credentials.model_json_schema()}
+            for contentType in ("application/json", "application/x-www-form-urlencoded")
+        }
+    }
+}
 
 
 # FR2
-@router.post("/login", response_model_by_alias=False)
-def login(username: str, password: str, db: DBDep) -> User:
-    if not (user := findUserByUsername(db, username)) or not verifyPassword(
-        password, user["password"]
-    ):
+@router.post("/login", response_model_by_alias=False, openapi_extra=CREDENTIALS_BODY)
+def login(
+    credentials: Annotated[Credentials, Depends(loginCredentials)], db: DBDep
+) -> User:
+    user = findUserByUsername(db, credentials.username)
+
+    # Unknown usernames still pay for a hash, so they can't be told apart by time.
+    if not user:
+        dummyVerify(credentials.password)
+        verified, newHash = False, None
+    else:
+        verified, newHash = verifyPassword(credentials.password, user["password"])
+
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password",
         )
 
-    return User(**user)
+    if (
+        newHash
+        and updateUserPassword(
+            db, user["_id"], user["password"], newHash
+        ).modified_count
+    ):
+        PASSWORD_REHASHES.inc()
+        user["password"] = newHash
+
+    return signIn(db, loadMemberships(db, user))
+
+
+@router.post("/refresh", response_model_by_alias=False, name="Refresh Token")
+def refresh(body: RefreshToken, db: DBDep) -> User:
+    if not (userId := useRefreshToken(db, body.refreshToken)) or not (
+        user := findUserById(db, userId)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
+        )
+
+    return issueTokens(db, loadMemberships(db, user))
 
 
 # FR2
@@ -89,12 +184,15 @@ def getCurrentUser(
         token = credentials.credentials
 
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+        if payload.get("typ") == "access":
+            return userFromAccessToken(db, token, payload)
+
         if not (user := findUserById(db, payload["sub"])) or user["token"] != token:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
             )
 
-        return User(**user)
+        return loadMemberships(db, user)
     except HTTPException as e:
         raise e
     except Exception:
@@ -112,6 +210,28 @@ def me(user: UserDep) -> User:
     return user
 
 
+@router.get("/me/tasks", name="Get My Tasks")
+def getMyTasks(
+    db: DBDep,
+    user: UserDep,
+    order: SortOrder = SortOrder.asc,
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    cursor: Optional[str] = None,
+) -> TaskPage:
+    tasks, nextCursor = findAssignedTasksPage(
+        db,
+        user.username,
+        user.projects(),
+        ASCENDING if order == SortOrder.asc else DESCENDING,
+        limit,
+        cursor,
+    )
+
+    return TaskPage(
+        tasks=[Task(**upgrade("tasks", task)) for task in tasks], nextCursor=nextCursor
+    )
+
+
 # FR3
 @router.patch("/password/reset", response_model_by_alias=False, name="Reset Password")
 def resetPassword(
@@ -129,19 +249,20 @@ def resetPassword(
             detail="Failed to update password",
         )
 
-    return User(**updatedUser)
+    revokeTokens(db, user.id, refreshTokens=True)
 
-
-# FR3
-def hashPassword(password: str):
-    return bcrypt.hash(password)
+    return signIn(
+        db,
+        User(
+            **{
+                **updatedUser,
+                "ownedProjects": user.ownedProjects,
+                "joinedProjects": user.joinedProjects,
+            }
+        ),
+    )
 
 
 # FR3
 def createToken(id: str):
     return jwt.encode({"sub": id}, JWT_SECRET_KEY, algorithm="HS256")
-
-
-# FR3
-def verifyPassword(plainPassword: str, hashedPassword: str):
-    return bcrypt.verify(plainPassword, hashedPassword)
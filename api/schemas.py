@@ -1,9 +1,17 @@
 import datetime
 from enum import Enum
+from functools import cached_property
 from typing import Annotated, Optional
 
 from bson import ObjectId
-from pydantic import AliasChoices, BaseModel, BeforeValidator, Field
+from pydantic import (
+    AliasChoices,
+    BaseModel,
+    BeforeValidator,
+    Field,
+    field_validator,
+    model_serializer,
+)
 
 """
 This custom type does some helpful things:
@@ -36,6 +44,11 @@ class Priority(str, Enum):
     high = "High"
 
 
+class Role(str, Enum):
+    owner = "owner"
+    member = "member"
+
+
 # USER
 class UserView(BaseModel):
     id: MongoID
@@ -49,23 +62,81 @@ class CreatableUser(BaseModel):
     email: str
 
 
+class Credentials(BaseModel):
+    username: str
+    password: str
+
+
+class RefreshToken(BaseModel):
+    refreshToken: str
+
+
 class User(CreatableUser):
     id: MongoID = None
     ownedProjects: list[str] = []
     joinedProjects: list[str] = []
     token: Optional[str] = None
+    refreshToken: Optional[str] = None
+
+    # Only login, register and refresh hand out refresh tokens, in stateless mode.
+    @model_serializer(mode="wrap")
+    def dropRefreshToken(self, handler):
+        data = handler(self)
+        if data.get("refreshToken") is None:
+            data.pop("refreshToken", None)
+
+        return data
 
     def oid(self) -> ObjectId:
         return ObjectId(self.id)
 
+    # Membership views are built once per User, i.e. once per authenticated
+    # request, instead of concatenating and scanning the lists on every check.
+    @cached_property
+    def projectList(self) -> list[str]:
+        return list(dict.fromkeys(self.ownedProjects + self.joinedProjects))
+
+    @cached_property
+    def projectSet(self) -> frozenset[str]:
+        return frozenset(self.projectList)
+
+    @cached_property
+    def ownedProjectSet(self) -> frozenset[str]:
+        return frozenset(self.ownedProjects)
+
+    @cached_property
+    def projectOidList(self) -> list[ObjectId]:
+        return [ObjectId(id) for id in self.projectList]
+
     def canAccess(self, id: str) -> bool:
-        return id in self.ownedProjects + self.joinedProjects
+        return id in self.projectSet
 
     def isAdmin(self, id: str) -> bool:
-        return id in self.ownedProjects
+        return id in self.ownedProjectSet
 
     def projects(self) -> list[str]:
-        return self.ownedProjects + self.joinedProjects
+        return self.projectList
+
+    def projectOids(self) -> list[ObjectId]:
+        return self.projectOidList
+
+
+# Denormalised counters kept on project and milestone documents, missing keys are
+# tasks that have never been in that status/priority so they default to 0.
+class TaskCounts(BaseModel):
+    total: int = 0
+    status: dict[Status, int] = Field({}, validate_default=True)
+    priority: dict[Priority, int] = Field({}, validate_default=True)
+
+    @field_validator("status")
+    @classmethod
+    def fillStatus(cls, counts: dict) -> dict:
+        return {s: counts.get(s, 0) for s in Status}
+
+    @field_validator("priority")
+    @classmethod
+    def fillPriority(cls, counts: dict) -> dict:
+        return {p: counts.get(p, 0) for p in Priority}
 
 
 class CreateableProject(BaseModel):
@@ -83,6 +154,26 @@ class Project(CreateableProject):
     createdAt: datetime.datetime = now()
 
 
+# The creator owns the project from now on, in stateless mode its access token
+# is revoked and the new one is returned with the project.
+class CreatedProject(Project):
+    token: Optional[str] = None
+
+    @model_serializer(mode="wrap")
+    def dropToken(self, handler):
+        data = handler(self)
+        if data.get("token") is None:
+            data.pop("token", None)
+
+        return data
+
+
+class ProjectSummary(BaseModel):
+    id: MongoID
+    name: str
+    taskCounts: TaskCounts = Field(default_factory=TaskCounts)
+
+
 class CreateableMilestone(BaseModel):
     name: str
     description: str
@@ -105,7 +196,21 @@ class Milestone(CreateableMilestone):
     id: MongoID = None
     status: Status = Status.todo
     tasks: list[str] = []
+    sprintId: str = ""
     createdAt: datetime.datetime = Field(default_factory=now)
+    version: int = 0
+
+
+class MilestoneSummary(BaseModel):
+    id: MongoID
+    name: str
+    projectId: str
+    status: Status = Status.todo
+    taskCounts: TaskCounts = Field(default_factory=TaskCounts)
+
+
+# Stored as the assignee of unassigned tasks, no user can register with it.
+UNASSIGNED = "Unassigned"
 
 
 class BaseCreateableTask(BaseModel):
@@ -114,7 +219,7 @@ class BaseCreateableTask(BaseModel):
     dueDate: datetime.datetime
     priority: Priority = Priority.medium
     status: Status = Status.todo
-    assignedTo: str = "Unassigned"
+    assignedTo: str = UNASSIGNED
 
 
 class CreateableTask(BaseCreateableTask):
@@ -145,7 +250,25 @@ class UpdateableTask(BaseUpdateableTask):
 class Task(CreateableTask):
     id: MongoID = None
     qaTask: BaseCreateableTask
+    sprintId: str = ""
     createdAt: datetime.datetime = Field(default_factory=now)
+    version: int = 0
+
+
+class TaskSort(str, Enum):
+    dueDate = "dueDate"
+    createdAt = "createdAt"
+    priority = "priority"
+
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class TaskPage(BaseModel):
+    tasks: list[Task] = []
+    nextCursor: Optional[str] = None
 
 
 class CreateableSprint(BaseModel):
@@ -165,10 +288,45 @@ class UpdateableSprint(BaseModel):
     milestones: Optional[list[str]] = None
 
 
+# Ids of tasks or milestones added to or removed from a sprint in one request.
+class SprintMembers(BaseModel):
+    ids: list[str] = Field(min_length=1, max_length=1000)
+
+    @field_validator("ids")
+    @classmethod
+    def validIds(cls, ids: list[str]) -> list[str]:
+        if invalid := [id for id in ids if not ObjectId.is_valid(id)]:
+            raise ValueError(f"Invalid ObjectId: {', '.join(invalid)}")
+
+        return ids
+
+
 class Sprint(CreateableSprint):
     id: MongoID = None
     tasks: list[str] = []
     milestones: list[str] = []
+    version: int = 0
+
+
+class SearchType(str, Enum):
+    project = "project"
+    milestone = "milestone"
+    task = "task"
+
+
+class SearchResult(BaseModel):
+    type: SearchType
+    id: MongoID
+    projectId: str
+    name: str
+    description: str
+    score: float
+    highlights: dict[str, str] = {}
+
+
+class SearchPage(BaseModel):
+    results: list[SearchResult] = []
+    nextPage: Optional[int] = None
 
 
 class SprintView(Sprint):
@@ -0,0 +1,79 @@
+import html
+import math
+import re
+from collections import Counter, defaultdict
+
+from api.database import SEARCH_WEIGHTS
+
+"""
+A small in-memory inverted index used when the database cannot run $text queries
+(mongomock in the tests). It mirrors the Mongo text index closely enough for the
+search endpoint: case-insensitive word tokens, per-field weights and a tf-idf
+style relevance score.
+"""
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.lower())
+
+
+def matches(token: str, term: str) -> bool:
+    # Prefix matching stands in for Mongo's stemming, so "task" finds "tasks".
+    return token.startswith(term)
+
+
+class InvertedIndex:
+    def __init__(self, weights: dict[str, int] = SEARCH_WEIGHTS):
+        self.weights = weights
+        self.postings: dict[str, dict[object, float]] = defaultdict(dict)
+        self.size = 0
+
+    def add(self, key, document: dict):
+        self.size += 1
+
+        for field, weight in self.weights.items():
+            for token, count in Counter(tokenize(document.get(field) or "")).items():
+                self.postings[token][key] = self.postings[token].get(key, 0) + (
+                    weight * count
+                )
+
+    def search(self, query: str) -> list[tuple[object, float]]:
+        scores: dict[object, float] = defaultdict(float)
+
+        for term in set(tokenize(query)):
+            postings: dict[object, float] = defaultdict(float)
+
+            for token, documents in self.postings.items():
+                if matches(token, term):
+                    for key, weight in documents.items():
+                        postings[key] += weight
+
+            if not postings:
+                continue
+
+            idf = math.log(1 + self.size / len(postings))
+            for key, weight in postings.items():
+                scores[key] += weight * idf
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+# Wraps matched words in <mark> tags, escaping the rest of the text so it is safe
+# to render as HTML.
+def highlight(text: str, query: str, tag: str = "mark") -> str:
+    terms = set(tokenize(query))
+    parts = []
+    end = 0
+
+    for match in TOKEN.finditer(text):
+        word = match.group(0)
+        if any(matches(word.lower(), term) for term in terms):
+            parts.append(html.escape(text[end : match.start()]))
+            parts.append(f"<{tag}>{html.escape(word)}</{tag}>")
+            end = match.end()
+
+    parts.append(html.escape(text[end:]))
+
+    return "".join(parts)
@@ -0,0 +1,84 @@
+# Production entrypoint, run with `python -m api.server`.
+#
+# Gunicorn manages a pool of uvicorn workers running on uvloop and httptools. The
+# app is not preloaded, every worker imports api.main after the fork so each one
+# creates its own MongoClient and prometheus metrics. Sending SIGHUP to the master
+# gracefully replaces the workers, which also picks up new code.
+
+import glob
+import multiprocessing
+import os
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+# Every worker writes its metrics to files in this directory and /metrics merges
+# them, it has to be set before prometheus_client is imported by any process.
+def prepareMultiprocDir() -> str:
+    path = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        os.path.join(tempfile.gettempdir(), "kraken-prometheus"),
+    )
+    os.makedirs(path, exist_ok=True)
+
+    # Files left by a previous run would be merged into the new counters.
+    for file in glob.glob(os.path.join(path, "*.db")):
+        os.remove(file)
+
+    return path
+
+
+def childExit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def options() -> dict:
+    options = {
+        "bind": f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '80')}",
+        "workers": int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count())),
+        "worker_class": "api.server.Worker",
+        "preload_app": False,
+        "timeout": int(os.environ.get("WORKER_TIMEOUT", 30)),
+        "graceful_timeout": int(os.environ.get("GRACEFUL_TIMEOUT", 30)),
+        "keepalive": int(os.environ.get("KEEPALIVE", 5)),
+        "child_exit": childExit,
+    }
+
+    if os.environ.get("SSL_KEYFILE") and os.environ.get("SSL_CERTFILE"):
+        options["keyfile"] = os.environ["SSL_KEYFILE"]
+        options["certfile"] = os.environ["SSL_CERTFILE"]
+
+    return options
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    # Called in each worker after the fork since the app is not preloaded.
+    def load(self):
+        from api.main import app
+
+        return app
+
+
+def main():
+    prepareMultiprocDir()
+    Server(options()).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import json
+import os
+import time
+
+from api.tests.util import CountingTestBase
+
+# Every route is run against a project of each size. What a route issues to the
+# database must not grow with the data around it, mongomock scans collections so
+# its timings are only recorded, set BENCHMARK_OUTPUT to write them out as JSON.
+SIZES = (1, 10, 50)
+DUE_DATE = "2022-01-01T00:00:00"
+QA_TASK = {"name": "qa", "description": "qa", "dueDate": DUE_DATE}
+
+
+class TestComplexity(CountingTestBase):
+    timings = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if output := os.environ.get("BENCHMARK_OUTPUT"):
+            with open(output, "w") as file:
+                json.dump(cls.timings, file, indent=2, sort_keys=True)
+
+    # A project with `size` tasks in one milestone, plus a task and a milestone
+    # depending on the first of them, among `size` users who are not members.
+    def seed(self, size: int) -> dict:
+        self.tearDown()
+
+        self.mockDb.users.insert_many(
+            [
+                {"username": f"other{i}", "email": f"other{i}@other.com"}
+                for i in range(size)
+            ]
+        )
+
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", DUE_DATE
+        ).json()
+        tasks = [
+            self.createTask(
+                user, project["id"], milestone["id"], "test", "test", DUE_DATE, QA_TASK
+            ).json()
+            for _ in range(size)
+        ]
+        dependentTask = self.createTask(
+            user,
+            project["id"],
+            milestone["id"],
+            "test",
+            "test",
+            DUE_DATE,
+            QA_TASK,
+            {"dependentTasks": [tasks[0]["id"]]},
+        ).json()
+        dependentMilestone = self.createMilestone(
+            user,
+            project["id"],
+            "test",
+            "test",
+            DUE_DATE,
+            {"dependentMilestones": [milestone["id"]]},
+        ).json()
+
+        return {
+            "user": user,
+            "project": project,
+            "milestone": milestone,
+            "tasks": tasks,
+            "dependentTask": dependentTask,
+            "dependentMilestone": dependentMilestone,
+        }
+
+    # Runs the request built by `build` once per size and returns the operations
+    # and written document counts by size.
+    def measure(self, route: str, build) -> dict:
+        results = {}
+
+        for size in SIZES:
+            seeded = self.seed(size)
+            method, path, kwargs = build(seeded)
+
+            self.counter.clear()
+            started = time.perf_counter()
+            response = self.client.request(method, path, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+
+            self.assertLess(response.status_code, 300, response.text)
+            self.timings.setdefault(route, {})[size] = elapsed
+            results[size] = (list(self.counter.ops), self.counter.written)
+
+        return results
+
+    def assertConstantOps(self, results: dict):
+        for size in SIZES:
+            self.assertEqual(results[size][0], results[SIZES[0]][0], f"size {size}")
+
+    def assertConstantWrites(self, results: dict):
+        for size in SIZES:
+            self.assertEqual(results[size][1], results[SIZES[0]][1], f"size {size}")
+
+    def headers(self, seeded: dict) -> dict:
+        return {"headers": self.userToHeader(seeded["user"])}
+
+    def testRegister(self):
+        body = {"username": "new", "password": "new", "email": "new@new.com"}
+
+        results = self.measure(
+            "POST /users/register",
+            lambda seeded: ("POST", "/users/register", {"json": body}),
+        )
+
+        self.assertConstantOps(results)
+
+    def testLogin(self):
+        body = {"username": "test", "password": "test"}
+
+        results = self.measure(
+            "POST /users/login",
+            lambda seeded: ("POST", "/users/login", {"json": body}),
+        )
+
+        self.assertConstantOps(results)
+
+    def testCreateTask(self):
+        def build(seeded):
+            body = {
+                "projectId": seeded["project"]["id"],
+                "milestoneId": seeded["milestone"]["id"],
+                "name": "new",
+                "description": "new",
+                "dueDate": DUE_DATE,
+                "qaTask": QA_TASK,
+            }
+            return "POST", "/tasks/", {"json": body, **self.headers(seeded)}
+
+        results = self.measure("POST /tasks/", build)
+
+        self.assertConstantOps(results)
+        self.assertConstantWrites(results)
+
+    def testGetTask(self):
+        results = self.measure(
+            "GET /tasks/{id}",
+            lambda seeded: (
+                "GET",
+                f"/tasks/{seeded['tasks'][0]['id']}",
+                self.headers(seeded),
+            ),
+        )
+
+        self.assertConstantOps(results)
+
+    def testUpdateTask(self):
+        def build(seeded):
+            path = f"/tasks/{seeded['tasks'][0]['id']}"
+            body = {"status": "Completed"}
+            return "PATCH", path, {"json": body, **self.headers(seeded)}
+
+        results = self.measure("PATCH /tasks/{id}", build)
+
+        self.assertConstantOps(results)
+        self.assertConstantWrites(results)
+
+    def testDeleteTask(self):
+        results = self.measure(
+            "DELETE /tasks/{id}",
+            lambda seeded: (
+                "DELETE",
+                f"/tasks/{seeded['tasks'][0]['id']}",
+                self.headers(seeded),
+            ),
+        )
+
+        self.assertConstantOps(results)
+        self.assertConstantWrites(results)
+
+    def testGetProject(self):
+        results = self.measure(
+            "GET /projects/{id}",
+            lambda seeded: (
+                "GET",
+                f"/projects/{seeded['project']['id']}",
+                self.headers(seeded),
+            ),
+        )
+
+        self.assertConstantOps(results)
+
+    def testGetProjectTasks(self):
+        results = self.measure(
+            "GET /projects/{id}/tasks",
+            lambda seeded: (
+                "GET",
+                f"/projects/{seeded['project']['id']}/tasks",
+                {"params": {"limit": 5}, **self.headers(seeded)},
+            ),
+        )
+
+        self.assertConstantOps(results)
+
+    def testGetMilestone(self):
+        results = self.measure(
+            "GET /milestones/{id}",
+            lambda seeded: (
+                "GET",
+                f"/milestones/{seeded['milestone']['id']}",
+                self.headers(seeded),
+            ),
+        )
+
+        self.assertConstantOps(results)
+
+    # The tasks of the milestone go with it, in the same number of operations
+    # whatever their count.
+    def testDeleteMilestone(self):
+        results = self.measure(
+            "DELETE /milestones/{id}",
+            lambda seeded: (
+                "DELETE",
+                f"/milestones/{seeded['milestone']['id']}",
+                self.headers(seeded),
+            ),
+        )
+
+        self.assertConstantOps(results)
+
+        # The milestone, its tasks with the dependent one, the project counters and
+        # the dependent milestone.
+        for size, (_, written) in results.items():
+            self.assertEqual(written, 1 + (size + 1) + 1 + 1, f"size {size}")
@@ -0,0 +1,137 @@
+import asyncio
+import gzip
+import json
+import unittest
+import zlib
+
+import zstandard
+from prometheus_client import REGISTRY
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from api.compression import CompressionMiddleware, acceptedEncodings
+
+BIG = {"tasks": [{"name": f"task {i}", "status": "To Do"} for i in range(200)]}
+
+
+def request(app, acceptEncoding: str = "gzip"):
+    messages = []
+    received = []
+
+    # The request body comes once, further reads wait for a disconnect that never
+    # happens, like a client that stays connected.
+    async def receive():
+        if received:
+            await asyncio.Event().wait()
+        received.append(True)
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", acceptEncoding.encode())],
+    }
+    asyncio.run(app(scope, receive, send))
+
+    return dict(messages[0]["headers"]), [m["body"] for m in messages[1:]]
+
+
+class TestCompression(unittest.TestCase):
+    def testAcceptedEncodings(self):
+        self.assertEqual(
+            acceptedEncodings("gzip;q=0.5, br;q=0, ZSTD , deflate;q=x"),
+            {"gzip", "zstd"},
+        )
+
+    def testCompressesLargeJson(self):
+        def sample(name):
+            value = REGISTRY.get_sample_value(
+                f"response_compression_{name}_bytes_total", {"encoding": "gzip"}
+            )
+            return value or 0
+
+        inputBefore, outputBefore = sample("input"), sample("output")
+        app = CompressionMiddleware(JSONResponse(BIG), ["gzip"], 1024)
+
+        headers, bodies = request(app)
+
+        self.assertEqual(headers[b"content-encoding"], b"gzip")
+        self.assertEqual(headers[b"vary"], b"Accept-Encoding")
+        self.assertEqual(int(headers[b"content-length"]), len(bodies[0]))
+        self.assertEqual(json.loads(gzip.decompress(bodies[0])), BIG)
+        self.assertEqual(sample("output") - outputBefore, len(bodies[0]))
+        self.assertGreater(sample("input") - inputBefore, len(bodies[0]))
+
+    def testPrefersServerOrder(self):
+        app = CompressionMiddleware(JSONResponse(BIG), ["zstd", "gzip"], 1024)
+
+        headers, bodies = request(app, "gzip, zstd")
+
+        self.assertEqual(headers[b"content-encoding"], b"zstd")
+        self.assertEqual(
+            json.loads(
+                zstandard.ZstdDecompressor().decompressobj().decompress(bodies[0])
+            ),
+            BIG,
+        )
+
+    def testSkipsSmallBodies(self):
+        app = CompressionMiddleware(JSONResponse({"a": 1}), ["gzip"], 1024)
+
+        headers, bodies = request(app)
+
+        self.assertNotIn(b"content-encoding", headers)
+        self.assertEqual(headers[b"vary"], b"Accept-Encoding")
+        self.assertEqual(bodies, [b'{"a":1}'])
+
+    def testSkipsUnlistedContentTypes(self):
+        app = CompressionMiddleware(
+            Response(b"x" * 4096, media_type="image/png"), ["gzip"], 1024
+        )
+
+        headers, bodies = request(app)
+
+        self.assertNotIn(b"content-encoding", headers)
+        self.assertNotIn(b"vary", headers)
+        self.assertEqual(bodies, [b"x" * 4096])
+
+    def testSkipsUnacceptedEncodings(self):
+        app = CompressionMiddleware(JSONResponse(BIG), ["gzip"], 1024)
+
+        headers, _ = request(app, "identity")
+
+        self.assertNotIn(b"content-encoding", headers)
+        self.assertEqual(headers[b"vary"], b"Accept-Encoding")
+
+    def testWeakensETag(self):
+        def app():
+            return CompressionMiddleware(
+                JSONResponse(BIG, headers={"ETag": '"3"'}), ["gzip"], 1024
+            )
+
+        headers, _ = request(app())
+        self.assertEqual(headers[b"etag"], b'W/"3"')
+
+        headers, _ = request(app(), "identity")
+        self.assertEqual(headers[b"etag"], b'"3"')
+
+    def testStreamsNdjson(self):
+        lines = [json.dumps({"line": i}).encode() + b"\n" for i in range(3)]
+        app = CompressionMiddleware(
+            StreamingResponse(iter(lines), media_type="application/x-ndjson"),
+            ["gzip"],
+            1024,
+        )
+
+        headers, bodies = request(app)
+
+        self.assertEqual(headers[b"content-encoding"], b"gzip")
+        self.assertNotIn(b"content-length", headers)
+
+        # Every chunk is flushed, so each line decodes without the ones after it.
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for line, body in zip(lines, bodies):
+            self.assertEqual(decompressor.decompress(body), line)
@@ -1,8 +1,37 @@
+import asyncio
+import os
 import unittest
+from unittest.mock import MagicMock, Mock, patch
 
+from bson import Timestamp
 from fastapi import HTTPException
+from mongomock import MongoClient
+from prometheus_client import REGISTRY
+from pymongo import TEXT, ReadPreference
+from pymongo.database import Database
 
-from api.database import getDb, toObjectId
+from api import database
+from api.database import (
+    CAUSAL_TIME_HEADER,
+    INDEXES,
+    UNIQUE_INDEXES,
+    CausalTimeMiddleware,
+    ClusterTimes,
+    PoolMetrics,
+    SessionDatabase,
+    clientOptions,
+    closeClient,
+    clusterTimes,
+    createClient,
+    createIndexes,
+    forgetClient,
+    getClient,
+    getDb,
+    getRequestDb,
+    readCollection,
+    readOptions,
+    toObjectId,
+)
 
 
 class TestDatabase(unittest.TestCase):
@@ -10,6 +39,21 @@ class TestDatabase(unittest.TestCase):
         db = getDb()
         self.assertIsNotNone(db)
 
+    def testClientIsLazy(self):
+        closeClient()
+        self.assertIsNone(database.client)
+
+        client = getClient()
+        self.assertIs(getClient(), client)
+
+        forgetClient()
+        self.assertIsNone(database.client)
+        self.assertIsNot(getClient(), client)
+
+        client.close()
+        closeClient()
+        self.assertIsNone(database.client)
+
     def testToObjectId(self):
         oid = toObjectId("5f6e7d5f7e3f5e7d5f7e3f5e")
         self.assertIsNotNone(oid)
@@ -17,3 +61,206 @@ class TestDatabase(unittest.TestCase):
     def testToObjectIdBad(self):
         with self.assertRaises(HTTPException):
             toObjectId("123")
+
+    def testCreateIndexes(self):
+        db = MongoClient().db
+
+        createIndexes(db)
+        createIndexes(db)
+
+        for collection, indexes in INDEXES.items():
+            keys = [
+                list(index["key"])
+                for index in db[collection].index_information().values()
+            ]
+
+            for index in indexes:
+                self.assertIn(index, keys)
+
+        for collection, indexes in UNIQUE_INDEXES.items():
+            keys = [
+                list(index["key"])
+                for index in db[collection].index_information().values()
+                if index.get("unique")
+            ]
+
+            for index in indexes:
+                self.assertIn(index, keys)
+
+    def testCreateIndexesReplacesSearchIndex(self):
+        db = MongoClient().db
+        for collection in ("projects", "tasks"):
+            db[collection].create_index(
+                [("name", TEXT), ("description", TEXT)], name="search"
+            )
+        db.milestones.create_index(
+            [("projectId", 1), ("name", TEXT), ("description", TEXT)],
+            name="projectSearch",
+        )
+
+        createIndexes(db)
+
+        self.assertIn("search", db.projects.index_information())
+        for collection in ("milestones", "tasks"):
+            indexes = db[collection].index_information()
+            self.assertNotIn("search", indexes)
+            self.assertNotIn("projectSearch", indexes)
+            self.assertEqual(
+                indexes["scopedSearch"]["key"],
+                [("name", "text"), ("description", "text"), ("projectId", 1)],
+            )
+
+    def testClientOptions(self):
+        with patch.dict(
+            os.environ, {"MONGO_MAX_POOL_SIZE": "7", "MONGO_RETRY_WRITES": "false"}
+        ):
+            options = clientOptions()
+            client = createClient()
+
+        self.assertEqual(options["maxPoolSize"], 7)
+        self.assertFalse(options["retryWrites"])
+        self.assertEqual(client.options.pool_options.max_pool_size, 7)
+        self.assertFalse(client.options.retry_writes)
+        client.close()
+
+    def testPoolMetrics(self):
+        listener = PoolMetrics()
+        event = Mock(address=("db", 27017), options={"maxPoolSize": 5})
+
+        def sample(name):
+            return REGISTRY.get_sample_value(name, {"address": "db:27017"})
+
+        listener.pool_created(event)
+        listener.connection_created(event)
+        listener.connection_created(event)
+        listener.connection_checked_out(event)
+        listener.connection_closed(event)
+
+        self.assertEqual(sample("mongo_pool_max_size"), 5)
+        self.assertEqual(sample("mongo_pool_connections"), 1)
+        self.assertEqual(sample("mongo_pool_checked_out"), 1)
+
+        listener.connection_checked_in(event)
+
+        self.assertEqual(sample("mongo_pool_checked_out"), 0)
+
+        listener.pool_created(Mock(address=("db", 27017), options={}))
+
+        self.assertEqual(sample("mongo_pool_max_size"), 100)
+
+    def testReadCollection(self):
+        db = MongoClient().db
+
+        readOptions.cache_clear()
+        with patch.dict(
+            os.environ, {"MONGO_TEST_READ_PREFERENCE": "secondaryPreferred"}
+        ):
+            collection = readCollection(db, "tasks", "test")
+        readOptions.cache_clear()
+
+        self.assertEqual(collection.read_preference, ReadPreference.SECONDARY_PREFERRED)
+        self.assertEqual(readCollection(db, "tasks", "other"), db.tasks)
+
+    def testReadOptionsMaxStaleness(self):
+        readOptions.cache_clear()
+        with patch.dict(
+            os.environ,
+            {
+                "MONGO_TEST_READ_PREFERENCE": "nearest",
+                "MONGO_TEST_MAX_STALENESS_SECONDS": "90",
+                "MONGO_TEST_READ_CONCERN": "majority",
+            },
+        ):
+            options = readOptions("test")
+        readOptions.cache_clear()
+
+        self.assertEqual(options["read_preference"].mongos_mode, "nearest")
+        self.assertEqual(options["read_preference"].max_staleness, 90)
+        self.assertEqual(options["read_concern"].level, "majority")
+
+    def testSessionDatabase(self):
+        session, mockDb = Mock(), MagicMock()
+        db = SessionDatabase(mockDb, session)
+
+        db.tasks.insert_one({"name": "test"})
+        db["tasks"].find({})
+        db.get_collection("tasks").count_documents({})
+
+        mockDb.tasks.insert_one.assert_called_once_with(
+            {"name": "test"}, session=session
+        )
+        mockDb["tasks"].find.assert_called_once_with({}, session=session)
+        mockDb.get_collection("tasks").count_documents.assert_called_once_with(
+            {}, session=session
+        )
+        self.assertEqual(db.tasks.name, mockDb.tasks.name)
+
+    def testGetRequestDbWithoutReplicas(self):
+        db = MongoClient().db
+
+        self.assertIs(next(getRequestDb(Mock(), db)), db)
+
+    def testCausalTimeAcrossWorkers(self):
+        times = ({"clusterTime": Timestamp(2, 1)}, Timestamp(2, 1))
+
+        writeDb = MagicMock(spec=Database)
+        writeSession = writeDb.client.start_session.return_value.__enter__.return_value
+        writeSession.cluster_time, writeSession.operation_time = times
+
+        readDb = MagicMock(spec=Database)
+        readSession = readDb.client.start_session.return_value.__enter__.return_value
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        # The write and the read are served by workers with their own times.
+        with patch("api.database.causalReads", return_value=True):
+            with patch("api.database.clusterTimes", ClusterTimes()):
+                request = Mock(headers={"Authorization": "Bearer causal"})
+                scope = {"type": "http"}
+
+                async def app(scope, receive, send):
+                    requestDb = getRequestDb(request, writeDb)
+                    next(requestDb)
+                    scope["state"]["causalSession"] = request.state.causalSession
+                    next(requestDb, None)
+                    await send({"type": "http.response.start", "headers": []})
+
+                asyncio.run(CausalTimeMiddleware(app)(scope, None, send))
+
+            header = dict(sent[0]["headers"])[CAUSAL_TIME_HEADER.lower().encode()]
+
+            with patch("api.database.clusterTimes", ClusterTimes()):
+                for value in (header.decode()[:-1] + "0", header.decode()):
+                    request = Mock(
+                        headers={
+                            "Authorization": "Bearer causal",
+                            CAUSAL_TIME_HEADER: value,
+                        }
+                    )
+                    next(getRequestDb(request, readDb))
+
+        readSession.advance_cluster_time.assert_called_once_with(times[0])
+        readSession.advance_operation_time.assert_called_once_with(times[1])
+
+    def testGetRequestDbCausal(self):
+        db = MagicMock(spec=Database)
+        session = db.client.start_session.return_value.__enter__.return_value
+        session.cluster_time, session.operation_time = "clusterTime", "operationTime"
+        request = Mock(headers={"Authorization": "Bearer causal"})
+
+        with patch("api.database.causalReads", return_value=True):
+            requestDb = getRequestDb(request, db)
+            self.assertIs(next(requestDb).session, session)
+            next(requestDb, None)
+
+            self.assertEqual(
+                clusterTimes.get("Bearer causal"), ("clusterTime", "operationTime")
+            )
+
+            next(getRequestDb(request, db))
+
+        session.advance_cluster_time.assert_called_once_with("clusterTime")
+        session.advance_operation_time.assert_called_once_with("operationTime")
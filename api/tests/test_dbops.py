@@ -0,0 +1,324 @@
+from bson import ObjectId
+
+from api.tests.util import CountingTestBase
+
+# Every authenticated request starts with the user lookup in getCurrentUser, the
+# memberships are cached until they change.
+AUTH = [("users", "find_one")]
+
+
+class TestDbOps(CountingTestBase):
+    def setUp(self):
+        self.user = self.createUser("test")
+        self.project = self.createProject(self.user, "test", "test").json()
+        self.milestone = self.createMilestone(
+            self.user, self.project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        self.task = self.createTask(
+            self.user,
+            self.project["id"],
+            self.milestone["id"],
+            "test",
+            "test",
+            "2022-01-01T00:00:00",
+            {"name": "qa", "description": "qa", "dueDate": "2022-01-01T00:00:00"},
+        ).json()
+        self.sprint = self.createSprint(
+            self.user,
+            self.project["id"],
+            "test",
+            "test",
+            "2022-01-01T00:00:00",
+            "2022-01-01T00:00:00",
+        ).json()
+
+        self.counter.ops.clear()
+
+    def request(self, method, path, **kwargs):
+        self.counter.ops.clear()
+
+        response = self.client.request(
+            method, path, headers=self.userToHeader(self.user), **kwargs
+        )
+
+        self.assertLess(response.status_code, 300, response.text)
+
+        return self.counter.ops
+
+    def testCreateMilestone(self):
+        ops = self.request(
+            "POST",
+            "/milestones/",
+            json={
+                "projectId": self.project["id"],
+                "name": "test",
+                "description": "test",
+                "dueDate": "2022-01-01T00:00:00",
+            },
+        )
+
+        self.assertEqual(
+            ops, [*AUTH, ("projects", "find_one"), ("milestones", "insert_one")]
+        )
+
+    def testCreateTask(self):
+        ops = self.request(
+            "POST",
+            "/tasks/",
+            json={
+                "projectId": self.project["id"],
+                "milestoneId": self.milestone["id"],
+                "name": "test",
+                "description": "test",
+                "dueDate": "2022-01-01T00:00:00",
+                "qaTask": {
+                    "name": "qa",
+                    "description": "qa",
+                    "dueDate": "2022-01-01T00:00:00",
+                },
+            },
+        )
+
+        self.assertEqual(
+            ops,
+            [
+                *AUTH,
+                ("milestones", "find_one"),
+                ("tasks", "insert_one"),
+                ("milestones", "update_one"),
+                ("projects", "update_one"),
+            ],
+        )
+
+    def testGetTask(self):
+        ops = self.request("GET", f"/tasks/{self.task['id']}")
+
+        self.assertEqual(ops, [*AUTH, ("tasks", "find_one")])
+
+    def testUpdateTask(self):
+        ops = self.request("PATCH", f"/tasks/{self.task['id']}", json={"name": "x"})
+
+        self.assertEqual(ops, [*AUTH, ("tasks", "find_one_and_update")])
+
+    def testUpdateTaskMilestone(self):
+        milestone = self.createMilestone(
+            self.user, self.project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+
+        ops = self.request(
+            "PATCH",
+            f"/tasks/{self.task['id']}",
+            json={"projectId": self.project["id"], "milestoneId": milestone["id"]},
+        )
+
+        self.assertEqual(
+            ops,
+            [
+                *AUTH,
+                ("milestones", "find_one"),
+                ("tasks", "find_one_and_update"),
+                ("milestones", "update_one"),
+                ("milestones", "update_one"),
+            ],
+        )
+
+    def testUpdateTaskStatus(self):
+        ops = self.request(
+            "PATCH", f"/tasks/{self.task['id']}", json={"status": "Completed"}
+        )
+
+        self.assertEqual(
+            ops,
+            [
+                *AUTH,
+                ("tasks", "find_one_and_update"),
+                ("milestones", "update_one"),
+                ("projects", "update_one"),
+            ],
+        )
+
+    def testUpdateTaskUnchangedCountedFields(self):
+        ops = self.request(
+            "PATCH",
+            f"/tasks/{self.task['id']}",
+            json={
+                "projectId": self.project["id"],
+                "milestoneId": self.milestone["id"],
+                "status": self.task["status"],
+            },
+        )
+
+        self.assertEqual(
+            ops, [*AUTH, ("milestones", "find_one"), ("tasks", "find_one_and_update")]
+        )
+
+    def testUpdateMilestone(self):
+        ops = self.request(
+            "PATCH", f"/milestones/{self.milestone['id']}", json={"name": "x"}
+        )
+
+        self.assertEqual(ops, [*AUTH, ("milestones", "find_one_and_update")])
+
+    def testUpdateSprint(self):
+        ops = self.request("PATCH", f"/sprints/{self.sprint['id']}", json={"name": "x"})
+
+        self.assertEqual(ops, [*AUTH, ("sprints", "find_one_and_update")])
+
+    def testUpdateProject(self):
+        ops = self.request(
+            "PATCH", f"/projects/{self.project['id']}", json={"name": "x"}
+        )
+
+        self.assertEqual(ops, [*AUTH, ("projects", "find_one_and_update")])
+
+    def testGetProjectSummary(self):
+        ops = self.request("GET", f"/projects/{self.project['id']}/summary")
+
+        self.assertEqual(ops, [*AUTH, ("projects", "find_one")])
+
+    def testDeleteSprint(self):
+        ops = self.request("DELETE", f"/sprints/{self.sprint['id']}")
+
+        self.assertEqual(
+            ops,
+            [
+                *AUTH,
+                ("sprints", "find_one"),
+                ("sprints", "delete_one"),
+                ("tasks", "update_many"),
+                ("milestones", "update_many"),
+            ],
+        )
+
+    def testDeleteTask(self):
+        ops = self.request("DELETE", f"/tasks/{self.task['id']}")
+
+        self.assertEqual(
+            ops,
+            [
+                *AUTH,
+                ("tasks", "find_one_and_delete"),
+                ("milestones", "update_one"),
+                ("projects", "update_one"),
+                ("milestones", "update_many"),
+                ("tasks", "update_many"),
+            ],
+        )
+
+    def testNotFoundCostsOneMoreQuery(self):
+        self.counter.ops.clear()
+
+        response = self.client.get(
+            f"/tasks/{str(ObjectId())}", headers=self.userToHeader(self.user)
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(
+            self.counter.ops, [*AUTH, ("tasks", "find_one"), ("tasks", "find_one")]
+        )
+
+    def testDeleteProject(self):
+        ops = self.request("DELETE", f"/projects/{self.project['id']}")
+
+        self.assertEqual(
+            ops,
+            [
+                *AUTH,
+                ("projects", "find_one"),
+                ("projects", "delete_one"),
+                ("milestones", "delete_many"),
+                ("tasks", "delete_many"),
+                ("sprints", "delete_many"),
+                ("memberships", "find"),
+                ("memberships", "delete_many"),
+                ("users", "update_many"),
+            ],
+        )
+
+    def addToSprint(self):
+        self.mockDb.sprints.update_one(
+            {"_id": ObjectId(self.sprint["id"])},
+            {
+                "$set": {
+                    "tasks": [self.task["id"]],
+                    "milestones": [self.milestone["id"]],
+                }
+            },
+        )
+
+        for collection, document in (
+            ("tasks", self.task),
+            ("milestones", self.milestone),
+        ):
+            self.mockDb[collection].update_one(
+                {"_id": ObjectId(document["id"])},
+                {"$set": {"sprintId": self.sprint["id"]}},
+            )
+
+    def testGetProjectReusesLoadedDocuments(self):
+        self.addToSprint()
+
+        ops = self.request("GET", f"/projects/{self.project['id']}")
+
+        self.assertEqual(
+            ops,
+            [
+                *AUTH,
+                ("projects", "find_one"),
+                ("milestones", "find"),
+                ("tasks", "find"),
+                ("sprints", "find"),
+            ],
+        )
+
+        sprint = self.client.get(
+            f"/projects/{self.project['id']}", headers=self.userToHeader(self.user)
+        ).json()["sprints"][0]
+
+        self.assertEqual([task["id"] for task in sprint["tasks"]], [self.task["id"]])
+        self.assertEqual(
+            [milestone["id"] for milestone in sprint["milestones"]],
+            [self.milestone["id"]],
+        )
+
+    def testAddSprintTasks(self):
+        ops = self.request(
+            "POST",
+            f"/sprints/{self.sprint['id']}/tasks",
+            json={"ids": [self.task["id"]]},
+        )
+
+        self.assertEqual(
+            ops,
+            [
+                *AUTH,
+                ("sprints", "find_one"),
+                ("tasks", "find"),
+                ("tasks", "update_many"),
+                ("sprints", "find_one_and_update"),
+            ],
+        )
+
+    def testRemoveSprintTasks(self):
+        self.addToSprint()
+
+        ops = self.request(
+            "DELETE",
+            f"/sprints/{self.sprint['id']}/tasks",
+            json={"ids": [self.task["id"]]},
+        )
+
+        self.assertEqual(
+            ops,
+            [*AUTH, ("sprints", "find_one_and_update"), ("tasks", "update_many")],
+        )
+
+    def testGetSprintBatchesLookups(self):
+        self.addToSprint()
+
+        ops = self.request("GET", f"/sprints/{self.sprint['id']}")
+
+        self.assertEqual(
+            ops,
+            [*AUTH, ("sprints", "find_one"), ("tasks", "find"), ("milestones", "find")],
+        )
@@ -0,0 +1,145 @@
+from unittest.mock import patch
+
+from api.tests.util import TestBase
+from api.tokens import expiry
+
+
+class TestIdempotency(TestBase):
+    def setUp(self):
+        self.user = self.createUser("test")
+
+    def tearDown(self):
+        for collection in ["users", "memberships", "projects", "idempotencyKeys"]:
+            self.mockDb[collection].delete_many({})
+
+    def post(self, body: dict, key: str = "key", user=None):
+        return self.client.post(
+            "/projects/",
+            json=body,
+            headers={**self.userToHeader(user or self.user), "Idempotency-Key": key},
+        )
+
+    def testRetryReturnsStoredResponse(self):
+        body = {"name": "test", "description": "test"}
+
+        first = self.post(body)
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn("idempotent-replayed", first.headers)
+
+        # Both from this worker's cache and, once it is gone, from the database.
+        for clearCache in (False, True):
+            if clearCache:
+                self.client.app.middleware_stack = None
+
+            retry = self.post(body)
+
+            self.assertEqual(retry.status_code, 200)
+            self.assertEqual(retry.json(), first.json())
+            self.assertEqual(retry.headers["idempotent-replayed"], "true")
+
+        self.assertEqual(self.mockDb.projects.count_documents({}), 1)
+
+    def testKeyReusedForAnotherRequest(self):
+        self.post({"name": "test", "description": "test"})
+
+        response = self.post({"name": "other", "description": "test"})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.mockDb.projects.count_documents({}), 1)
+
+    def testKeyReusedWithOtherQueryParameters(self):
+        body = {"name": "test", "description": "test"}
+        self.post(body)
+
+        response = self.client.post(
+            "/projects/",
+            params={"other": "1"},
+            json=body,
+            headers={**self.userToHeader(self.user), "Idempotency-Key": "key"},
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn("idempotent-replayed", response.headers)
+        self.assertEqual(self.mockDb.projects.count_documents({}), 1)
+
+    def testOnlyCreateRoutesAreStored(self):
+        credentials = {"username": "test", "password": "test"}
+
+        for _ in range(2):
+            response = self.client.post(
+                "/users/login", json=credentials, headers={"Idempotency-Key": "key"}
+            )
+
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("idempotent-replayed", response.headers)
+
+        self.assertEqual(self.mockDb.idempotencyKeys.count_documents({}), 0)
+
+    def testCredentialsAreNotStored(self):
+        body = {"name": "test", "description": "test"}
+
+        with patch("api.tokens.STATELESS", True):
+            first = self.post(body)
+            self.client.app.middleware_stack = None
+            retry = self.post(body)
+
+        self.assertIn("token", first.json())
+        self.assertNotIn("token", retry.json())
+        self.assertEqual(retry.json()["id"], first.json()["id"])
+        self.assertNotIn(
+            first.json()["token"].encode(),
+            self.mockDb.idempotencyKeys.find_one()["body"],
+        )
+
+    def testKeysAreScopedToTheUser(self):
+        body = {"name": "test", "description": "test"}
+        other = self.createUser("other")
+
+        self.post(body)
+        response = self.post(body, user=other)
+
+        self.assertNotIn("idempotent-replayed", response.headers)
+        self.assertEqual(self.mockDb.projects.count_documents({}), 2)
+
+    def testRequestInProgress(self):
+        body = {"name": "test", "description": "test"}
+        self.post(body)
+
+        # As left by an attempt still running on another worker.
+        self.mockDb.idempotencyKeys.update_one({}, {"$unset": {"status": ""}})
+        self.client.app.middleware_stack = None
+
+        self.assertEqual(self.post(body).status_code, 409)
+
+    def testExpiredClaimIsTakenOver(self):
+        body = {"name": "test", "description": "test"}
+        self.post(body)
+
+        # An attempt that died on another worker, expired but not yet deleted by
+        # the TTL monitor.
+        self.mockDb.idempotencyKeys.update_one(
+            {},
+            {
+                "$unset": {"status": ""},
+                "$set": {"expiresAt": expiry(-1)},
+            },
+        )
+        self.client.app.middleware_stack = None
+
+        response = self.post(body)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("idempotent-replayed", response.headers)
+        self.assertEqual(self.mockDb.projects.count_documents({}), 2)
+        self.assertEqual(self.mockDb.idempotencyKeys.find_one()["status"], 200)
+
+    def testWithoutKey(self):
+        body = {"name": "test", "description": "test"}
+
+        for _ in range(2):
+            self.client.post(
+                "/projects/", json=body, headers=self.userToHeader(self.user)
+            )
+
+        self.assertEqual(self.mockDb.projects.count_documents({}), 2)
+        self.assertEqual(self.mockDb.idempotencyKeys.count_documents({}), 0)
@@ -0,0 +1,106 @@
+import unittest
+
+from bson import ObjectId
+from mongomock import MongoClient
+
+from api.jobs.counters import repairTaskCounts
+from api.jobs.indexes import planStages
+from api.jobs.sprints import repairSprintMembers
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.db = MongoClient().db
+
+    def testRepairTaskCounts(self):
+        projectId = self.db.projects.insert_one({"name": "test"}).inserted_id
+        milestoneId = self.db.milestones.insert_one(
+            {"projectId": str(projectId)}
+        ).inserted_id
+        emptyMilestoneId = self.db.milestones.insert_one(
+            {"projectId": str(projectId), "taskCounts": {"total": 5}}
+        ).inserted_id
+
+        self.db.tasks.insert_many(
+            [
+                {
+                    "projectId": str(projectId),
+                    "milestoneId": str(milestoneId),
+                    "status": status,
+                    "priority": "High",
+                }
+                for status in ["To Do", "Todo", "Completed"]
+            ]
+        )
+
+        repairTaskCounts(self.db)
+
+        expected = {
+            "total": 3,
+            "status": {"To Do": 2, "Completed": 1},
+            "priority": {"High": 3},
+        }
+
+        self.assertEqual(
+            self.db.projects.find_one({"_id": projectId})["taskCounts"], expected
+        )
+        self.assertEqual(
+            self.db.milestones.find_one({"_id": milestoneId})["taskCounts"], expected
+        )
+        self.assertEqual(
+            self.db.milestones.find_one({"_id": emptyMilestoneId})["taskCounts"],
+            {"total": 0, "status": {}, "priority": {}},
+        )
+
+    def testRepairSprintMembers(self):
+        taskId, otherTaskId = self.db.tasks.insert_many(
+            [{"projectId": "p", "sprintId": "gone"}, {"projectId": "p"}]
+        ).inserted_ids
+        milestoneId = self.db.milestones.insert_one({"projectId": "p"}).inserted_id
+        holderId, heldTaskId = ObjectId(), ObjectId()
+        self.db.tasks.insert_one(
+            {"_id": heldTaskId, "projectId": "p", "sprintId": str(holderId)}
+        )
+        self.db.sprints.insert_one(
+            {"_id": holderId, "projectId": "p", "tasks": [str(heldTaskId)]}
+        )
+        sprintId = self.db.sprints.insert_one(
+            {
+                "projectId": "p",
+                "tasks": [str(otherTaskId), str(ObjectId()), str(heldTaskId)],
+                "milestones": [str(milestoneId)],
+                "version": 0,
+            }
+        ).inserted_id
+
+        self.assertEqual(repairSprintMembers(self.db), 2)
+
+        sprint = self.db.sprints.find_one({"_id": sprintId})
+        self.assertEqual(sprint["tasks"], [str(otherTaskId)])
+        self.assertEqual(
+            self.db.tasks.find_one({"_id": heldTaskId})["sprintId"], str(holderId)
+        )
+        self.assertEqual(sprint["version"], 1)
+        self.assertNotIn("sprintId", self.db.tasks.find_one({"_id": taskId}))
+        self.assertEqual(
+            self.db.tasks.find_one({"_id": otherTaskId})["sprintId"], str(sprintId)
+        )
+        self.assertEqual(
+            self.db.milestones.find_one({"_id": milestoneId})["sprintId"],
+            str(sprintId),
+        )
+
+    def testPlanStages(self):
+        plan = {
+            "stage": "LIMIT",
+            "inputStage": {
+                "stage": "FETCH",
+                "inputStage": {"stage": "IXSCAN"},
+            },
+        }
+
+        self.assertEqual(planStages(plan), ["LIMIT", "FETCH", "IXSCAN"])
+        self.assertEqual(
+            planStages({"stage": "OR", "inputStages": [{"stage": "COLLSCAN"}]}),
+            ["OR", "COLLSCAN"],
+        )
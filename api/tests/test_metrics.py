@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter
+
+from api.metrics import OVERFLOW, Exposition, SeriesLimit
+from api.tests.util import TestBase
+
+
+class TestSeriesLimit(unittest.TestCase):
+    def testOverflow(self):
+        counter = Counter("limited", "test", ["endpoint"], registry=CollectorRegistry())
+        limited = SeriesLimit(counter, maxSeries=2)
+
+        for endpoint in ["/a", "/b", "/c", "/d", "/a"]:
+            limited.labels(endpoint).inc()
+
+        self.assertEqual(counter.labels("/a")._value.get(), 2)
+        self.assertEqual(counter.labels(OVERFLOW)._value.get(), 2)
+        self.assertEqual(
+            REGISTRY.get_sample_value(
+                "metrics_series_overflow_total", {"metric": "limited"}
+            ),
+            2,
+        )
+
+
+class TestExposition(unittest.TestCase):
+    @patch("api.metrics.time.monotonic")
+    @patch("api.metrics.generate_latest", return_value=b"metrics")
+    def testServesLastRendering(self, generate, monotonic):
+        exposition = Exposition(interval=5)
+
+        monotonic.return_value = 0
+        self.assertEqual(exposition.latest(), b"metrics")
+
+        monotonic.return_value = 9
+        exposition.latest()
+        self.assertEqual(generate.call_count, 1)
+
+        # The timer stopped rendering while nothing scraped.
+        monotonic.return_value = 11
+        exposition.latest()
+        self.assertEqual(generate.call_count, 2)
+
+
+    @patch("api.metrics.generate_latest", return_value=b"merged")
+    def testMultiprocessRendersOncePerInterval(self, generate):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+            workers = [Exposition(interval=5) for _ in range(3)]
+
+            self.assertEqual([worker.latest() for worker in workers], [b"merged"] * 3)
+            self.assertEqual(generate.call_count, 1)
+
+            # Once the shared rendering is older than the interval, the next
+            # scrape on any worker renders it again.
+            path = os.path.join(directory, Exposition.FILE)
+            os.utime(path, (time.time() - 6, time.time() - 6))
+            generate.return_value = b"later"
+
+            self.assertEqual(workers[1].latest(), b"later")
+            self.assertEqual(workers[2].latest(), b"later")
+            self.assertEqual(generate.call_count, 2)
+
+
+class TestMetricsEndpoint(TestBase):
+    def testEndpointsCountedByRoute(self):
+        self.client.get("/tasks/000000000000000000000000")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'endpoint="/tasks/{id}"', response.content)
+        self.assertNotIn(b"000000000000000000000000", response.content)
+        self.assertIn(
+            b'metrics_overhead_seconds_count{stage="endpoint_counter"}',
+            response.content,
+        )
@@ -0,0 +1,131 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+from bson import ObjectId
+from mongomock import MongoClient
+
+from api.migrations.runner import Throttle, findMigrations, runMigration
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.db = MongoClient().db
+
+    def testFindMigrations(self):
+        self.assertEqual(findMigrations()[:3], ["001", "002", "003"])
+
+    def testCreatedAtFromObjectId(self):
+        id = ObjectId.from_datetime(datetime.datetime(2020, 1, 1))
+        self.db.milestones.insert_one({"_id": id, "createdAt": datetime.datetime.now()})
+
+        self.assertTrue(runMigration(self.db, "001"))
+
+        self.assertEqual(
+            self.db.milestones.find_one({"_id": id})["createdAt"],
+            id.generation_time.astimezone().replace(tzinfo=None),
+        )
+        self.assertIn("appliedAt", self.db.migrations.find_one({"_id": "001"}))
+
+    def testAppliedMigrationIsSkipped(self):
+        runMigration(self.db, "002")
+        self.db.tasks.insert_one({"status": "Todo"})
+
+        self.assertFalse(runMigration(self.db, "002"))
+        self.assertEqual(self.db.tasks.find_one()["status"], "Todo")
+
+    def testBatchesAndCheckpoints(self):
+        self.db.tasks.insert_many(
+            [{"status": "Todo", "qaTask": {"status": "Todo"}} for _ in range(5)]
+        )
+
+        runMigration(self.db, "002", batchSize=2)
+
+        self.assertEqual(self.db.tasks.count_documents({"status": "To Do"}), 5)
+        self.assertEqual(self.db.tasks.count_documents({"qaTask.status": "To Do"}), 5)
+
+        record = self.db.migrations.find_one({"_id": "002"})
+        self.assertNotIn("checkpoint", record)
+        self.assertEqual(record["documents"], 10)
+        self.assertEqual(record["writes"], 10)
+
+    def testResumesFromCheckpoint(self):
+        ids = self.db.tasks.insert_many(
+            [{"status": "Todo", "qaTask": {"status": "Todo"}} for _ in range(4)]
+        ).inserted_ids
+
+        # Interrupted during the second step, after its first two tasks.
+        self.db.migrations.insert_one(
+            {"_id": "002", "checkpoint": {"step": 1, "lastId": ids[1]}}
+        )
+
+        runMigration(self.db, "002")
+
+        self.assertEqual(self.db.tasks.count_documents({"status": "Todo"}), 4)
+        self.assertEqual(
+            [task["_id"] for task in self.db.tasks.find({"qaTask.status": "Todo"})],
+            ids[:2],
+        )
+
+    def testDryRun(self):
+        self.db.tasks.insert_one({"status": "Todo"})
+
+        self.assertTrue(runMigration(self.db, "002", dryRun=True))
+
+        self.assertEqual(self.db.tasks.find_one()["status"], "Todo")
+        self.assertIsNone(self.db.migrations.find_one({"_id": "002"}))
+
+    def testMembershipsFromUserArrays(self):
+        userId = self.db.users.insert_one(
+            {"ownedProjects": ["a"], "joinedProjects": ["a", "b"]}
+        ).inserted_id
+
+        runMigration(self.db, "003")
+
+        self.assertEqual(
+            {
+                (membership["projectId"], membership["role"])
+                for membership in self.db.memberships.find({"userId": str(userId)})
+            },
+            {("a", "owner"), ("b", "member")},
+        )
+        self.assertEqual(
+            self.db.users.find_one(), {"_id": userId, "membershipsVersion": 1}
+        )
+
+    def testSprintIdsFromSprintLists(self):
+        taskId = self.db.tasks.insert_one({"projectId": "p"}).inserted_id
+        otherTaskId = self.db.tasks.insert_one({"projectId": "other"}).inserted_id
+        milestoneId = self.db.milestones.insert_one({"projectId": "p"}).inserted_id
+        sprintId, laterSprintId = self.db.sprints.insert_many(
+            [
+                {
+                    "projectId": "p",
+                    "tasks": [str(taskId), "missing", str(otherTaskId)],
+                    "milestones": [str(milestoneId)],
+                },
+                {"projectId": "p", "tasks": [str(taskId)]},
+            ]
+        ).inserted_ids
+
+        runMigration(self.db, "004")
+
+        for collection, id in (("tasks", taskId), ("milestones", milestoneId)):
+            self.assertEqual(
+                self.db[collection].find_one({"_id": id})["sprintId"], str(sprintId)
+            )
+
+        self.assertNotIn("sprintId", self.db.tasks.find_one({"_id": otherTaskId}))
+        self.assertEqual(self.db.sprints.find_one({"_id": laterSprintId})["tasks"], [])
+
+    @patch("api.migrations.runner.time")
+    def testThrottle(self, time):
+        time.monotonic.return_value = 0
+        throttle = Throttle(100)
+
+        throttle.wait(50)
+        time.sleep.assert_called_once_with(0.5)
+
+        time.monotonic.return_value = 2
+        throttle.wait(50)
+        time.sleep.assert_called_once()
@@ -29,6 +29,7 @@ class TestMilestones(TestBase):
 
     def tearDown(self) -> None:
         self.mockDb.users.delete_many({})
+        self.mockDb.memberships.delete_many({})
         self.mockDb.projects.delete_many({})
         self.mockDb.milestones.delete_many({})
 
@@ -154,6 +155,72 @@ class TestMilestones(TestBase):
 
         self.assertEqual(milestoneResponse.status_code, status.HTTP_403_FORBIDDEN)
 
+    def testGetMilestoneSummary(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], **self.testMilestone
+        ).json()
+
+        qaTask = {"name": "qa", "description": "qa", "dueDate": "2001-10-01T00:00:00"}
+        for priority in ["High", "Low"]:
+            self.createTask(
+                user,
+                project["id"],
+                milestone["id"],
+                "test",
+                "test",
+                "2001-10-01T00:00:00",
+                qaTask,
+                args={"priority": priority},
+            )
+
+        summaryResponse = self.client.get(
+            f"/milestones/{milestone['id']}/summary",
+            headers=self.userToHeader(user),
+        )
+
+        self.assertEqual(summaryResponse.status_code, status.HTTP_200_OK)
+
+        summary = summaryResponse.json()
+
+        self.assertEqual(summary["id"], milestone["id"])
+        self.assertEqual(summary["projectId"], project["id"])
+        self.assertEqual(summary["taskCounts"]["total"], 2)
+        self.assertEqual(
+            summary["taskCounts"]["status"],
+            {"To Do": 2, "In Progress": 0, "Completed": 0},
+        )
+        self.assertEqual(
+            summary["taskCounts"]["priority"], {"Low": 1, "Medium": 0, "High": 1}
+        )
+
+    def testGetMilestoneSummaryNotFound(self):
+        user = self.createUser("test")
+
+        summaryResponse = self.client.get(
+            f"/milestones/{str(ObjectId())}/summary",
+            headers=self.userToHeader(user),
+        )
+
+        self.assertEqual(summaryResponse.status_code, status.HTTP_404_NOT_FOUND)
+
+    def testGetMilestoneSummaryUserNoAccess(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], **self.testMilestone
+        ).json()
+
+        otherUser = self.createUser("other")
+
+        summaryResponse = self.client.get(
+            f"/milestones/{milestone['id']}/summary",
+            headers=self.userToHeader(otherUser),
+        )
+
+        self.assertEqual(summaryResponse.status_code, status.HTTP_403_FORBIDDEN)
+
     def testUpdateMilestone(self):
         user = self.createUser("test")
         project = self.createProject(user, "test", "test").json()
@@ -191,6 +258,30 @@ class TestMilestones(TestBase):
         for v in milestone.values():
             self.assertIsNotNone(v)
 
+    def testUpdateMilestoneIfMatch(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+
+        milestone = self.createMilestone(
+            user, project["id"], **self.testMilestone
+        ).json()
+
+        for ifMatch, expected in [
+            ('"0"', status.HTTP_200_OK),
+            ('"0"', status.HTTP_412_PRECONDITION_FAILED),
+            ('W/"1"', status.HTTP_200_OK),
+            ("*", status.HTTP_200_OK),
+        ]:
+            updateMilestoneResponse = self.client.patch(
+                f"/milestones/{milestone['id']}",
+                json={"name": "test2"},
+                headers={**self.userToHeader(user), "If-Match": ifMatch},
+            )
+
+            self.assertEqual(updateMilestoneResponse.status_code, expected)
+
+        self.assertEqual(updateMilestoneResponse.json()["version"], 3)
+
     def testUpdateMilestoneNotFound(self):
         user = self.createUser("test")
         project = self.createProject(user, "test", "test").json()
@@ -302,6 +393,47 @@ class TestMilestones(TestBase):
 
         self.assertEqual(milestone2Response.json()["dependentMilestones"], [])
 
+    def testDeleteMilestoneTaskCounts(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        project2 = self.createProject(user, "test2", "test2").json()
+        milestone = self.createMilestone(
+            user, project["id"], **self.testMilestone
+        ).json()
+
+        tasks = [
+            self.createTask(
+                user,
+                project["id"],
+                milestone["id"],
+                "test",
+                "test",
+                "2001-10-01T00:00:00",
+                {"name": "qa", "description": "qa", "dueDate": "2022-01-01T00:00:00"},
+            ).json()
+            for _ in range(2)
+        ]
+
+        # Moved to another project, the task keeps its milestone.
+        self.client.patch(
+            f"/tasks/{tasks[1]['id']}",
+            json={"projectId": project2["id"]},
+            headers=self.userToHeader(user),
+        )
+
+        self.client.delete(
+            f"/milestones/{milestone['id']}", headers=self.userToHeader(user)
+        )
+
+        for id in (project["id"], project2["id"]):
+            summary = self.client.get(
+                f"/projects/{id}/summary", headers=self.userToHeader(user)
+            ).json()
+
+            self.assertEqual(summary["taskCounts"]["total"], 0)
+
+        self.assertEqual(self.mockDb.tasks.count_documents({}), 0)
+
     def testDeleteMilestoneNotFound(self):
         user = self.createUser("test")
         project = self.createProject(user, "test", "test").json()
@@ -4,6 +4,7 @@ from unittest.mock import Mock
 from bson import ObjectId
 from fastapi import status
 
+from api.pagination import encodeCursor
 from api.schemas import UserView
 from api.tests.util import TestBase
 
@@ -25,13 +26,19 @@ class TestProjects(TestBase):
         cls.mockDb.tasks.delete_many = Mock(wraps=cls.mockDb.tasks.delete_many)
         cls.mockDb.sprints.delete_many = Mock(wraps=cls.mockDb.sprints.delete_many)
 
-        cls.mockDb.users.find_one_and_update = Mock(
-            wraps=cls.mockDb.users.find_one_and_update
+        cls.mockDb.memberships.update_one = Mock(
+            wraps=cls.mockDb.memberships.update_one
+        )
+        cls.mockDb.memberships.delete_one = Mock(
+            wraps=cls.mockDb.memberships.delete_one
+        )
+        cls.mockDb.memberships.delete_many = Mock(
+            wraps=cls.mockDb.memberships.delete_many
         )
-        cls.mockDb.users.update_many = Mock(wraps=cls.mockDb.users.update_many)
 
     def tearDown(self) -> None:
         self.mockDb.users.delete_many({})
+        self.mockDb.memberships.delete_many({})
         self.mockDb.projects.delete_many({})
 
         opts = {
@@ -47,8 +54,9 @@ class TestProjects(TestBase):
         self.mockDb.tasks.delete_many.reset_mock(**opts)
         self.mockDb.sprints.delete_many.reset_mock(**opts)
 
-        self.mockDb.users.find_one_and_update.reset_mock(**opts)
-        self.mockDb.users.update_many.reset_mock(**opts)
+        self.mockDb.memberships.update_one.reset_mock(**opts)
+        self.mockDb.memberships.delete_one.reset_mock(**opts)
+        self.mockDb.memberships.delete_many.reset_mock(**opts)
 
     def testCreateProject(self):
         projectName = "test"
@@ -84,10 +92,10 @@ class TestProjects(TestBase):
 
         self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def testCreateProjectUserFailure(self):
+    def testCreateProjectMembershipFailure(self):
         user = self.createUser("test")
 
-        self.mockDb.users.find_one_and_update.return_value = None
+        self.mockDb.memberships.update_one.return_value.acknowledged = False
 
         response = self.createProject(user, "test", "test")
 
@@ -183,6 +191,241 @@ class TestProjects(TestBase):
 
         self.assertEqual(getResponse.status_code, status.HTTP_403_FORBIDDEN)
 
+    def testGetProjectSummary(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+
+        summaryResponse = self.client.get(
+            f"/projects/{project['id']}/summary", headers=self.userToHeader(user)
+        )
+
+        self.assertEqual(summaryResponse.status_code, status.HTTP_200_OK)
+        self.assertEqual(summaryResponse.json()["taskCounts"]["total"], 0)
+
+        for _ in range(2):
+            milestone = self.createMilestone(
+                user, project["id"], "test", "test", "2022-01-01T00:00:00"
+            ).json()
+            self.createTask(
+                user,
+                project["id"],
+                milestone["id"],
+                "test",
+                "test",
+                "2022-01-01T00:00:00",
+                {
+                    "name": "qatest",
+                    "description": "qatest",
+                    "dueDate": "2022-01-01T00:00:00",
+                },
+                args={"status": "Completed"},
+            )
+
+        summaryResponse = self.client.get(
+            f"/projects/{project['id']}/summary", headers=self.userToHeader(user)
+        )
+
+        self.assertEqual(summaryResponse.status_code, status.HTTP_200_OK)
+
+        summary = summaryResponse.json()
+
+        self.assertEqual(summary["id"], project["id"])
+        self.assertEqual(summary["name"], project["name"])
+        self.assertEqual(summary["taskCounts"]["total"], 2)
+        self.assertEqual(summary["taskCounts"]["status"]["Completed"], 2)
+        self.assertEqual(summary["taskCounts"]["priority"]["Medium"], 2)
+
+    def testGetProjectSummaryNotFound(self):
+        user = self.createUser("test")
+
+        summaryResponse = self.client.get(
+            f"/projects/{str(ObjectId())}/summary", headers=self.userToHeader(user)
+        )
+
+        self.assertEqual(summaryResponse.status_code, status.HTTP_404_NOT_FOUND)
+
+    def testGetProjectSummaryForbidden(self):
+        user = self.createUser("test")
+        user2 = self.createUser("test2")
+        project = self.createProject(user, "test", "test").json()
+
+        summaryResponse = self.client.get(
+            f"/projects/{project['id']}/summary", headers=self.userToHeader(user2)
+        )
+
+        self.assertEqual(summaryResponse.status_code, status.HTTP_403_FORBIDDEN)
+
+    def createTasks(self, user, projectId, tasks):
+        milestone = self.createMilestone(
+            user, projectId, "test", "test", "2022-01-01T00:00:00"
+        ).json()
+
+        return [
+            self.createTask(
+                user,
+                projectId,
+                milestone["id"],
+                "test",
+                "test",
+                dueDate,
+                {
+                    "name": "qatest",
+                    "description": "qatest",
+                    "dueDate": dueDate,
+                },
+                args=args,
+            ).json()
+            for dueDate, args in tasks
+        ]
+
+    def getProjectTasks(self, user, projectId, params={}):
+        return self.client.get(
+            f"/projects/{projectId}/tasks",
+            params=params,
+            headers=self.userToHeader(user),
+        )
+
+    def testGetProjectTasks(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+
+        tasks = self.createTasks(
+            user,
+            project["id"],
+            [
+                ("2022-01-03T00:00:00", {"status": "Completed"}),
+                ("2022-01-01T00:00:00", {"assignedTo": "test"}),
+                ("2022-01-02T00:00:00", {"priority": "High"}),
+            ],
+        )
+
+        response = self.getProjectTasks(user, project["id"])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [task["id"] for task in response.json()["tasks"]],
+            [tasks[1]["id"], tasks[2]["id"], tasks[0]["id"]],
+        )
+        self.assertIsNone(response.json()["nextCursor"])
+
+        for params, expected in [
+            ({"status": "Completed"}, [tasks[0]]),
+            ({"assignedTo": "test"}, [tasks[1]]),
+            ({"priority": "High"}, [tasks[2]]),
+            ({"qaTask.assignedTo": "test"}, []),
+            ({"milestoneId": tasks[0]["milestoneId"]}, [tasks[1], tasks[2], tasks[0]]),
+            ({"dueAfter": "2022-01-02T00:00:00"}, [tasks[2], tasks[0]]),
+            ({"dueBefore": "2022-01-02T00:00:00"}, [tasks[1]]),
+        ]:
+            response = self.getProjectTasks(user, project["id"], params)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()["tasks"], expected)
+
+    def testGetProjectTasksPagination(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+
+        tasks = self.createTasks(
+            user,
+            project["id"],
+            [(f"2022-01-0{day}T00:00:00", {}) for day in [1, 2, 2, 3, 4]],
+        )
+
+        seen = []
+        params = {"limit": 2, "order": "desc"}
+
+        while True:
+            response = self.getProjectTasks(user, project["id"], params).json()
+            seen += [task["id"] for task in response["tasks"]]
+
+            if not (cursor := response["nextCursor"]):
+                break
+
+            params["cursor"] = cursor
+
+        self.assertEqual(len(seen), len(tasks))
+        self.assertEqual(seen[0], tasks[4]["id"])
+        self.assertEqual(set(seen[1:3]), {tasks[2]["id"], tasks[3]["id"]})
+        self.assertEqual(seen[-1], tasks[0]["id"])
+
+    def testGetProjectTasksSortPriority(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+
+        tasks = self.createTasks(
+            user,
+            project["id"],
+            [
+                ("2022-01-01T00:00:00", {"priority": priority})
+                for priority in ["Medium", "High", "Low", "High"]
+            ],
+        )
+
+        seen = []
+        params = {"sort": "priority", "order": "desc", "limit": 1}
+
+        while True:
+            response = self.getProjectTasks(user, project["id"], params).json()
+            seen += [task["priority"] for task in response["tasks"]]
+
+            if not (cursor := response["nextCursor"]):
+                break
+
+            params["cursor"] = cursor
+
+        self.assertEqual(seen, ["High", "High", "Medium", "Low"])
+
+        response = self.getProjectTasks(
+            user, project["id"], {"sort": "priority", "limit": 4}
+        ).json()
+
+        self.assertEqual(
+            [task["id"] for task in response["tasks"]],
+            [tasks[2]["id"], tasks[0]["id"], tasks[1]["id"], tasks[3]["id"]],
+        )
+
+    def testGetProjectTasksInvalidCursor(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+
+        response = self.getProjectTasks(user, project["id"], {"cursor": "invalid"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def testGetProjectTasksCraftedCursor(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+
+        for sort, values in (
+            ("dueDate", [{"$ne": None}, ObjectId()]),
+            ("dueDate", [datetime.datetime(2022, 1, 1), {"$gt": None}]),
+            ("createdAt", ["2022-01-01", ObjectId()]),
+            ("priority", ["High", {"$ne": None}]),
+            ("priority", [{"$in": ["High"]}, ObjectId()]),
+        ):
+            response = self.getProjectTasks(
+                user, project["id"], {"sort": sort, "cursor": encodeCursor(values)}
+            )
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def testGetProjectTasksNotFound(self):
+        user = self.createUser("test")
+
+        response = self.getProjectTasks(user, str(ObjectId()))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def testGetProjectTasksForbidden(self):
+        user = self.createUser("test")
+        user2 = self.createUser("test2")
+        project = self.createProject(user, "test", "test").json()
+
+        response = self.getProjectTasks(user2, project["id"])
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def testDeleteProject(self):
         user = self.createUser("test")
 
@@ -328,25 +571,11 @@ class TestProjects(TestBase):
             deleteResponse.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-    def testDeleteProjectUserFailure(self):
-        user = self.createUser("test")
-        project = self.createProject(user, "test", "test")
-
-        self.mockDb.users.find_one_and_update.return_value = None
-
-        deleteResponse = self.client.delete(
-            f"/projects/{project.json()['id']}", headers=self.userToHeader(user)
-        )
-
-        self.assertEqual(
-            deleteResponse.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
-
-    def testDeleteProjectUserUpdateFailure(self):
+    def testDeleteProjectMembershipFailure(self):
         user = self.createUser("test")
         project = self.createProject(user, "test", "test")
 
-        self.mockDb.users.update_many.return_value.acknowledged = False
+        self.mockDb.memberships.delete_many.return_value.acknowledged = False
 
         deleteResponse = self.client.delete(
             f"/projects/{project.json()['id']}", headers=self.userToHeader(user)
@@ -445,6 +674,36 @@ class TestProjects(TestBase):
         self.assertEqual(userResponse.status_code, status.HTTP_200_OK)
         self.assertEqual(userResponse.json()["joinedProjects"], [projectId])
 
+    def testJoinProjectTwice(self):
+        user = self.createUser("test")
+        user2 = self.createUser("test2")
+
+        projectId = self.createProject(user, "test", "test").json()["id"]
+
+        for _ in range(2):
+            joinResponse = self.client.post(
+                f"/projects/{projectId}/join", headers=self.userToHeader(user2)
+            )
+
+            self.assertEqual(joinResponse.status_code, status.HTTP_200_OK)
+            self.assertEqual(joinResponse.json()["joinedProjects"], [projectId])
+
+    def testJoinOwnProject(self):
+        user = self.createUser("test")
+
+        projectId = self.createProject(user, "test", "test").json()["id"]
+
+        joinResponse = self.client.post(
+            f"/projects/{projectId}/join", headers=self.userToHeader(user)
+        )
+
+        self.assertEqual(joinResponse.status_code, status.HTTP_200_OK)
+        self.assertEqual(joinResponse.json()["ownedProjects"], [projectId])
+        self.assertEqual(joinResponse.json()["joinedProjects"], [])
+        self.assertEqual(
+            self.mockDb.memberships.count_documents({"projectId": projectId}), 1
+        )
+
     def testJoinProjectNotFound(self):
         user = self.createUser("test")
 
@@ -456,13 +715,14 @@ class TestProjects(TestBase):
 
     def testJoinProjectFailure(self):
         user = self.createUser("test")
+        user2 = self.createUser("test2")
 
         project = self.createProject(user, "test", "test")
 
-        self.mockDb.users.find_one_and_update.return_value = None
+        self.mockDb.memberships.update_one.return_value.acknowledged = False
 
         joinResponse = self.client.post(
-            f"/projects/{project.json()['id']}/join", headers=self.userToHeader(user)
+            f"/projects/{project.json()['id']}/join", headers=self.userToHeader(user2)
         )
 
         self.assertEqual(
@@ -510,7 +770,7 @@ class TestProjects(TestBase):
 
         project = self.createProject(user, "test", "test")
 
-        self.mockDb.users.find_one_and_update.return_value = None
+        self.mockDb.memberships.delete_one.return_value.acknowledged = False
 
         leaveResponse = self.client.delete(
             f"/projects/{project.json()['id']}/leave", headers=self.userToHeader(user)
@@ -559,8 +819,6 @@ class TestProjects(TestBase):
 
         project = self.createProject(user, "test", "test")
 
-        self.mockDb.users.find_one_and_update.return_value = None
-
         addUserResponse = self.client.post(
             f"/projects/{project.json()['id']}/users",
             headers=self.userToHeader(user),
@@ -637,8 +895,6 @@ class TestProjects(TestBase):
 
         project = self.createProject(user, "test", "test")
 
-        self.mockDb.users.find_one_and_update.return_value = None
-
         removeUserResponse = self.client.delete(
             f"/projects/{project.json()['id']}/users",
             headers=self.userToHeader(user),
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import JSONResponse
+
+from api.main import app
+from api.ratelimit import MemoryBackend, MongoBackend, RateLimitMiddleware
+from api.routers.users import createToken
+
+
+def limitedApp(**kwargs) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/tasks/{id}")
+    def getTask(id: str):
+        return {"id": id}
+
+    @app.get("/projects/{id}")
+    def getProject(id: str):
+        return {"id": id}
+
+    @app.get("/hidden", include_in_schema=False)
+    def hidden():
+        return {}
+
+    app.add_middleware(RateLimitMiddleware, backend=MemoryBackend(), **kwargs)
+
+    return app
+
+
+def headers(id: str) -> dict:
+    return {"Authorization": f"Bearer {createToken(id)}"}
+
+
+class TestRateLimit(unittest.TestCase):
+    @patch("api.ratelimit.time")
+    def testMemoryBackend(self, time):
+        backend = MemoryBackend()
+        time.monotonic.return_value = 0
+
+        self.assertEqual(backend.take("a", 1, 1, 2), 0)
+        self.assertEqual(backend.take("a", 1, 1, 2), 0)
+        self.assertEqual(backend.take("a", 1, 1, 2), 1)
+        self.assertEqual(backend.take("b", 2, 1, 2), 0)
+
+        time.monotonic.return_value = 0.5
+        self.assertEqual(backend.take("a", 1, 1, 2), 0.5)
+
+        time.monotonic.return_value = 1
+        self.assertEqual(backend.take("a", 1, 1, 2), 0)
+
+    def testMemoryBackendDropsOldBuckets(self):
+        backend = MemoryBackend(maxKeys=2)
+
+        for key in ["a", "b", "c"]:
+            backend.take(key, 1, 1, 1)
+
+        self.assertEqual(list(backend.buckets), ["b", "c"])
+
+    def testMongoBackend(self):
+        db = MagicMock()
+        db.rateLimits.find_one_and_update.side_effect = [
+            {"allowed": True, "tokens": 1},
+            {"allowed": False, "tokens": 0.5},
+        ]
+        backend = MongoBackend(lambda: db)
+
+        self.assertEqual(backend.take("a", 1, 2, 2), 0)
+        self.assertEqual(backend.take("a", 1, 2, 2), 0.25)
+        self.assertEqual(
+            db.rateLimits.find_one_and_update.call_args.args[0], {"_id": "a"}
+        )
+
+    def testLimitsByUserAndRoute(self):
+        client = TestClient(
+            limitedApp(rate=0.001, burst=2, costs={"GET /projects/{id}": 2})
+        )
+
+        for id in ["1", "2"]:
+            self.assertEqual(
+                client.get(f"/tasks/{id}", headers=headers("a")).status_code, 200
+            )
+
+        response = client.get("/tasks/3", headers=headers("a"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {"detail": "Too many requests"})
+        self.assertGreater(int(response.headers["Retry-After"]), 0)
+
+        self.assertEqual(client.get("/tasks/1", headers=headers("b")).status_code, 200)
+
+        # getProject costs the whole burst.
+        self.assertEqual(
+            client.get("/projects/1", headers=headers("a")).status_code, 200
+        )
+        self.assertEqual(
+            client.get("/projects/1", headers=headers("a")).status_code, 429
+        )
+
+        for _ in range(3):
+            self.assertEqual(
+                client.get("/hidden", headers=headers("a")).status_code, 200
+            )
+
+    def testInvalidTokensAreLimitedByAddress(self):
+        client = TestClient(limitedApp(rate=0.001, burst=1))
+
+        self.assertEqual(client.get("/tasks/1", headers=headers("a")).status_code, 200)
+        self.assertEqual(
+            client.get("/tasks/1", headers={"Authorization": "Bearer x"}).status_code,
+            200,
+        )
+        self.assertEqual(client.get("/tasks/1").status_code, 429)
+
+    def testConcurrency(self):
+        release = asyncio.Event()
+
+        async def slow(scope, receive, send):
+            await release.wait()
+            await JSONResponse({})(scope, receive, send)
+
+        app = RateLimitMiddleware(slow, rate=0, concurrency=1)
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/tasks/1",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"authorization", f"Bearer {createToken('a')}".encode())],
+            "app": limitedApp(),
+        }
+
+        async def request():
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            await app(scope, None, send)
+            return messages[0]["status"]
+
+        async def run():
+            first = asyncio.create_task(request())
+            await asyncio.sleep(0)
+
+            second = await request()
+            release.set()
+
+            return await first, second, await request()
+
+        self.assertEqual(asyncio.run(run()), (200, 429, 200))
+        self.assertEqual(app.inFlight, {})
+
+    @patch.dict(os.environ, {"RATE_LIMIT_RATE": "0.001", "RATE_LIMIT_BURST": "1"})
+    def testRejectionsCarryCorsHeaders(self):
+        app.middleware_stack = None
+        self.addCleanup(setattr, app, "middleware_stack", None)
+
+        client = TestClient(app)
+        origin = {"Origin": "http://localhost:3000", **headers("a")}
+
+        client.get("/users/me", headers=origin)
+        response = client.get("/users/me", headers=origin)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["access-control-allow-origin"], "*")
+        self.assertIn("Retry-After", response.headers)
+
+    def testMiddlewareOrder(self):
+        self.assertEqual(
+            [middleware.cls.__name__ for middleware in app.user_middleware],
+            [
+                "PrometheusInstrumentatorMiddleware",
+                "CORSMiddleware",
+                "RateLimitMiddleware",
+                "CompressionMiddleware",
+                "IdempotencyMiddleware",
+                "CausalTimeMiddleware",
+            ],
+        )
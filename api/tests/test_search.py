@@ -0,0 +1,156 @@
+import os
+from unittest.mock import patch
+
+from bson import ObjectId
+from fastapi import status
+
+from api.database import textSearchEnabled
+from api.routers.search import TYPES, rankedDocuments
+from api.schemas import User
+from api.search import InvertedIndex, highlight
+from api.tests.util import TestBase
+
+
+class TestSearch(TestBase):
+    def tearDown(self) -> None:
+        self.mockDb.users.delete_many({})
+        self.mockDb.memberships.delete_many({})
+        self.mockDb.projects.delete_many({})
+        self.mockDb.milestones.delete_many({})
+        self.mockDb.tasks.delete_many({})
+
+    def search(self, user, params):
+        return self.client.get(
+            "/search", params=params, headers=self.userToHeader(user)
+        )
+
+    def testSearch(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "Website", "Marketing login pages").json()
+        milestone = self.createMilestone(
+            user, project["id"], "Login", "Release", "2022-01-01T00:00:00"
+        ).json()
+        task = self.createTask(
+            user,
+            project["id"],
+            milestone["id"],
+            "Fix login button",
+            "The login button is misaligned",
+            "2022-01-01T00:00:00",
+            {"name": "qa", "description": "qa", "dueDate": "2022-01-01T00:00:00"},
+        ).json()
+
+        response = self.search(user, {"q": "login"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        results = response.json()["results"]
+
+        self.assertEqual(
+            [(result["type"], result["id"]) for result in results],
+            [
+                ("task", task["id"]),
+                ("milestone", milestone["id"]),
+                ("project", project["id"]),
+            ],
+        )
+        self.assertTrue(all(result["projectId"] == project["id"] for result in results))
+        self.assertEqual(
+            results[0]["highlights"]["name"], "Fix <mark>login</mark> button"
+        )
+        self.assertIsNone(response.json()["nextPage"])
+
+    def testSearchPagination(self):
+        user = self.createUser("test")
+
+        for i in range(3):
+            self.createProject(user, f"Project {i}", "roadmap")
+
+        seen = []
+        params = {"q": "roadmap", "limit": 2}
+
+        while True:
+            response = self.search(user, params).json()
+            seen += [result["id"] for result in response["results"]]
+
+            if not (page := response["nextPage"]):
+                break
+
+            params["page"] = page
+
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(len(set(seen)), 3)
+
+    def testSearchScopedToUserProjects(self):
+        user = self.createUser("test")
+        user2 = self.createUser("test2")
+        self.createProject(user, "Secret", "roadmap")
+
+        response = self.search(user2, {"q": "secret"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["results"], [])
+
+    def testSearchEmptyQuery(self):
+        user = self.createUser("test")
+
+        response = self.search(user, {"q": ""})
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def testSearchMaxResults(self):
+        user = self.createUser("test")
+
+        for i in range(3):
+            self.createProject(user, f"Project {i}", "roadmap")
+
+        with patch("api.routers.search.SEARCH_MAX_RESULTS", 2):
+            response = self.search(user, {"q": "roadmap", "limit": 2}).json()
+            self.assertEqual(len(response["results"]), 2)
+            self.assertIsNone(response["nextPage"])
+
+            response = self.search(user, {"q": "roadmap", "page": 2, "limit": 2})
+            self.assertEqual(response.json()["results"], [])
+
+    def testTextSearchQueriesEachCollectionOnce(self):
+        projects = [str(ObjectId()) for _ in range(3)]
+        user = User(
+            username="test",
+            password="",
+            email="test@test.com",
+            joinedProjects=projects,
+        )
+
+        def textSearch(db, collection, q, filter, limit):
+            rank = list(TYPES).index(collection)
+            return [{"_id": ObjectId(), "score": rank + i} for i in range(limit)]
+
+        with patch("api.routers.search.textSearch", side_effect=textSearch) as mock:
+            results = rankedDocuments(self.mockDb, "test", user, 4, True)
+
+        self.assertEqual(mock.call_count, len(TYPES))
+        self.assertEqual(
+            mock.call_args_list[2].args[3], {"projectId": {"$in": projects}}
+        )
+        self.assertEqual([score for _, _, score in results], [5, 4, 4, 3])
+
+    def testSearchBackend(self):
+        self.assertTrue(textSearchEnabled())
+
+        with patch.dict(os.environ, {"SEARCH_BACKEND": "index"}):
+            self.assertFalse(textSearchEnabled())
+
+    def testInvertedIndex(self):
+        index = InvertedIndex()
+        index.add("a", {"name": "Deploy", "description": "deploy the tasks service"})
+        index.add("b", {"name": "Tasks", "description": "write tasks"})
+        index.add("c", {"name": "Other", "description": None})
+
+        self.assertEqual([key for key, _ in index.search("task")], ["b", "a"])
+        self.assertEqual(index.search("missing"), [])
+
+    def testHighlight(self):
+        self.assertEqual(
+            highlight("<b>Tasks</b> & task", "task"),
+            "&lt;b&gt;<mark>Tasks</mark>&lt;/b&gt; &amp; <mark>task</mark>",
+        )
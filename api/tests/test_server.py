@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from api.server import Worker, childExit, options, prepareMultiprocDir
+
+
+class TestServer(unittest.TestCase):
+    def testOptions(self):
+        with patch.dict(os.environ, {"PORT": "8080", "WEB_CONCURRENCY": "3"}):
+            opts = options()
+
+        self.assertEqual(opts["bind"], "0.0.0.0:8080")
+        self.assertEqual(opts["workers"], 3)
+        self.assertEqual(opts["worker_class"], "api.server.Worker")
+        self.assertFalse(opts["preload_app"])
+        self.assertNotIn("keyfile", opts)
+        self.assertEqual(Worker.CONFIG_KWARGS, {"loop": "uvloop", "http": "httptools"})
+
+    def testOptionsSSL(self):
+        with patch.dict(os.environ, {"SSL_KEYFILE": "key", "SSL_CERTFILE": "cert"}):
+            opts = options()
+
+        self.assertEqual(opts["keyfile"], "key")
+        self.assertEqual(opts["certfile"], "cert")
+
+    def testPrepareMultiprocDir(self):
+        with tempfile.TemporaryDirectory() as path:
+            stale = os.path.join(path, "counter_1.db")
+            open(stale, "w").close()
+
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": path}):
+                self.assertEqual(prepareMultiprocDir(), path)
+
+            self.assertFalse(os.path.exists(stale))
+
+    @patch("prometheus_client.multiprocess.mark_process_dead")
+    def testChildExit(self, markProcessDead):
+        childExit(Mock(), Mock(pid=42))
+
+        markProcessDead.assert_called_once_with(42)
@@ -1,4 +1,4 @@
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from bson import ObjectId
 from fastapi import status
@@ -26,8 +26,11 @@ class TestSprints(TestBase):
 
     def tearDown(self) -> None:
         self.mockDb.users.delete_many({})
+        self.mockDb.memberships.delete_many({})
         self.mockDb.projects.delete_many({})
         self.mockDb.sprints.delete_many({})
+        self.mockDb.milestones.delete_many({})
+        self.mockDb.tasks.delete_many({})
 
         opts = {
             "return_value": True,
@@ -187,6 +190,30 @@ class TestSprints(TestBase):
         for v in sprint.values():
             self.assertIsNotNone(v)
 
+    def testUpdateSprintIfMatch(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        sprint = self.createSprint(user, project["id"], **self.testSprint).json()
+
+        updateSprintResponse = self.client.patch(
+            f"/sprints/{sprint['id']}",
+            json={"name": "test2"},
+            headers={**self.userToHeader(user), "If-Match": '"0"'},
+        )
+
+        self.assertEqual(updateSprintResponse.status_code, status.HTTP_200_OK)
+        self.assertEqual(updateSprintResponse.headers["ETag"], '"1"')
+
+        updateSprintResponse = self.client.patch(
+            f"/sprints/{sprint['id']}",
+            json={"name": "test3"},
+            headers={**self.userToHeader(user), "If-Match": '"0"'},
+        )
+
+        self.assertEqual(
+            updateSprintResponse.status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
+
     def testUpdateSprintNotFound(self):
         user = self.createUser("test")
 
@@ -316,3 +343,257 @@ class TestSprints(TestBase):
         self.assertEqual(
             deleteSprintResponse.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+    def testSprintMembers(self):
+        user = self.createUser("test")
+        headers = self.userToHeader(user)
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        first, second = [
+            self.createTask(
+                user,
+                project["id"],
+                milestone["id"],
+                name,
+                "test",
+                "2022-01-01T00:00:00",
+                {"name": "qa", "description": "qa", "dueDate": "2022-01-01T00:00:00"},
+            ).json()
+            for name in ("first", "second")
+        ]
+        sprint, other = [
+            self.createSprint(user, project["id"], **self.testSprint).json()
+            for _ in range(2)
+        ]
+
+        def members(sprint):
+            view = self.client.get(f"/sprints/{sprint['id']}", headers=headers).json()
+            return (
+                sorted(task["id"] for task in view["tasks"]),
+                [milestone["id"] for milestone in view["milestones"]],
+            )
+
+        self.client.patch(
+            f"/sprints/{sprint['id']}",
+            headers=headers,
+            json={
+                "tasks": [first["id"], second["id"]],
+                "milestones": [milestone["id"]],
+            },
+        )
+        self.assertEqual(
+            members(sprint),
+            (sorted([first["id"], second["id"]]), [milestone["id"]]),
+        )
+
+        # A task is in one sprint at a time, the other sprint is left as it was.
+        response = self.client.patch(
+            f"/sprints/{other['id']}",
+            headers=headers,
+            json={"tasks": [second["id"]], "name": "other"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn(second["id"], response.json()["detail"])
+        self.assertEqual(
+            self.mockDb.sprints.find_one({"_id": ObjectId(other["id"])})["name"],
+            self.testSprint["name"],
+        )
+
+        self.client.patch(
+            f"/sprints/{sprint['id']}", headers=headers, json={"tasks": [first["id"]]}
+        )
+        self.client.patch(
+            f"/sprints/{other['id']}", headers=headers, json={"tasks": [second["id"]]}
+        )
+        self.assertEqual(members(sprint), ([first["id"]], [milestone["id"]]))
+        self.assertEqual(members(other), ([second["id"]], []))
+
+        self.client.delete(f"/tasks/{first['id']}", headers=headers)
+        self.assertEqual(
+            self.mockDb.sprints.find_one({"_id": ObjectId(sprint["id"])})["tasks"], []
+        )
+
+        self.client.delete(f"/sprints/{other['id']}", headers=headers)
+        self.assertNotIn(
+            "sprintId", self.mockDb.tasks.find_one({"_id": ObjectId(second["id"])})
+        )
+
+    def getMilestoneVersion(self, user, milestone):
+        return self.client.get(
+            f"/milestones/{milestone['id']}", headers=self.userToHeader(user)
+        ).json()["version"]
+
+    def testAddAndRemoveSprintMembers(self):
+        user = self.createUser("test")
+        headers = self.userToHeader(user)
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        sprint = self.createSprint(user, project["id"], **self.testSprint).json()
+
+        otherProject = self.createProject(user, "other", "other").json()
+        otherMilestone = self.createMilestone(
+            user, otherProject["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+
+        path = f"/sprints/{sprint['id']}/milestones"
+
+        response = self.client.post(
+            path, headers=headers, json={"ids": [milestone["id"], milestone["id"]]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["milestones"], [milestone["id"]])
+        self.assertEqual(response.json()["version"], 1)
+        self.assertEqual(
+            self.mockDb.milestones.find_one({"_id": ObjectId(milestone["id"])})[
+                "sprintId"
+            ],
+            sprint["id"],
+        )
+        self.assertEqual(self.getMilestoneVersion(user, milestone), 1)
+
+        response = self.client.post(
+            path, headers=headers, json={"ids": [otherMilestone["id"]]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(otherMilestone["id"], response.json()["detail"])
+
+        response = self.client.post(path, headers=headers, json={"ids": ["invalid"]})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        response = self.client.request(
+            "DELETE", path, headers=headers, json={"ids": [milestone["id"]]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["milestones"], [])
+        self.assertNotIn(
+            "sprintId",
+            self.mockDb.milestones.find_one({"_id": ObjectId(milestone["id"])}),
+        )
+        self.assertEqual(self.getMilestoneVersion(user, milestone), 2)
+
+    def testAddSprintMembersInAnotherSprint(self):
+        user = self.createUser("test")
+        headers = self.userToHeader(user)
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        sprint, other = [
+            self.createSprint(user, project["id"], **self.testSprint).json()
+            for _ in range(2)
+        ]
+
+        self.client.post(
+            f"/sprints/{sprint['id']}/milestones",
+            headers=headers,
+            json={"ids": [milestone["id"]]},
+        )
+
+        response = self.client.post(
+            f"/sprints/{other['id']}/milestones",
+            headers=headers,
+            json={"ids": [milestone["id"]]},
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn(milestone["id"], response.json()["detail"])
+
+        # Claimed by the first sprint between the check and the claim.
+        with patch(
+            "api.routers.sprints.findSprintIds",
+            return_value={milestone["id"]: ""},
+        ):
+            response = self.client.post(
+                f"/sprints/{other['id']}/milestones",
+                headers=headers,
+                json={"ids": [milestone["id"]]},
+            )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.assertEqual(
+            self.mockDb.sprints.find_one({"_id": ObjectId(other["id"])})["milestones"],
+            [],
+        )
+        self.assertEqual(
+            self.mockDb.milestones.find_one({"_id": ObjectId(milestone["id"])})[
+                "sprintId"
+            ],
+            sprint["id"],
+        )
+
+    def testAddSprintMembersNotAuthorized(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        sprint = self.createSprint(user, project["id"], **self.testSprint).json()
+
+        response = self.client.post(
+            f"/sprints/{sprint['id']}/tasks",
+            headers=self.userToHeader(self.createUser("other")),
+            json={"ids": [str(ObjectId())]},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def testMoveSprintTaskToAnotherProject(self):
+        user = self.createUser("test")
+        headers = self.userToHeader(user)
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        task = self.createTask(
+            user,
+            project["id"],
+            milestone["id"],
+            "test",
+            "test",
+            "2022-01-01T00:00:00",
+            {"name": "qa", "description": "qa", "dueDate": "2022-01-01T00:00:00"},
+        ).json()
+        sprint = self.createSprint(user, project["id"], **self.testSprint).json()
+
+        self.client.post(
+            f"/sprints/{sprint['id']}/tasks", headers=headers, json={"ids": [task["id"]]}
+        )
+
+        # A member of the old project only, who must not see the moved task.
+        member = self.createUser("member")
+        self.client.post(
+            f"/projects/{project['id']}/join", headers=self.userToHeader(member)
+        )
+
+        newProject = self.createProject(user, "new", "new").json()
+        newMilestone = self.createMilestone(
+            user, newProject["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+
+        response = self.client.patch(
+            f"/tasks/{task['id']}",
+            headers=headers,
+            json={"projectId": newProject["id"], "milestoneId": newMilestone["id"]},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(
+            "sprintId", self.mockDb.tasks.find_one({"_id": ObjectId(task["id"])})
+        )
+        self.assertEqual(
+            self.mockDb.sprints.find_one({"_id": ObjectId(sprint["id"])})["tasks"], []
+        )
+
+        view = self.client.get(
+            f"/sprints/{sprint['id']}", headers=self.userToHeader(member)
+        )
+        self.assertEqual(view.status_code, status.HTTP_200_OK)
+        self.assertEqual(view.json()["tasks"], [])
+
+        # A back-reference left behind is not followed into another project.
+        self.mockDb.tasks.update_one(
+            {"_id": ObjectId(task["id"])}, {"$set": {"sprintId": sprint["id"]}}
+        )
+        view = self.client.get(
+            f"/sprints/{sprint['id']}", headers=self.userToHeader(member)
+        )
+        self.assertEqual(view.json()["tasks"], [])
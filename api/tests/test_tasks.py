@@ -26,7 +26,9 @@ class TestTasks(TestBase):
         cls.mockDb.tasks.find_one_and_update = Mock(
             wraps=cls.mockDb.tasks.find_one_and_update
         )
-        cls.mockDb.tasks.delete_one = Mock(wraps=cls.mockDb.tasks.delete_one)
+        cls.mockDb.tasks.find_one_and_delete = Mock(
+            wraps=cls.mockDb.tasks.find_one_and_delete
+        )
         cls.mockDb.milestones.update_many = Mock(
             wraps=cls.mockDb.milestones.update_many
         )
@@ -34,6 +36,7 @@ class TestTasks(TestBase):
 
     def tearDown(self) -> None:
         self.mockDb.users.delete_many({})
+        self.mockDb.memberships.delete_many({})
         self.mockDb.projects.delete_many({})
         self.mockDb.milestones.delete_many({})
         self.mockDb.tasks.delete_many({})
@@ -44,7 +47,7 @@ class TestTasks(TestBase):
         }
         self.mockDb.tasks.insert_one.reset_mock(**opts)
         self.mockDb.tasks.find_one_and_update.reset_mock(**opts)
-        self.mockDb.tasks.delete_one.reset_mock(**opts)
+        self.mockDb.tasks.find_one_and_delete.reset_mock(**opts)
         self.mockDb.milestones.update_many.reset_mock(**opts)
         self.mockDb.tasks.update_many.reset_mock(**opts)
 
@@ -282,6 +285,92 @@ class TestTasks(TestBase):
         for v in task.values():
             self.assertIsNotNone(v)
 
+    def testUpdateTaskReturnsStoredTask(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        task = self.createTask(user, project["id"], milestone["id"], **self.testTask)
+
+        for update in (
+            {"dueDate": "2024-01-01T00:00:00.123456+02:00"},
+            {"dueDate": "2024-01-01T00:00:00.123456+02:00", "status": "Completed"},
+        ):
+            response = self.client.patch(
+                f"/tasks/{task.json()['id']}",
+                json=update,
+                headers=self.userToHeader(user),
+            )
+
+            stored = self.client.get(
+                f"/tasks/{task.json()['id']}", headers=self.userToHeader(user)
+            )
+
+            self.assertEqual(response.json(), stored.json())
+            self.assertEqual(response.headers["ETag"], stored.headers["ETag"])
+
+    def testUpdateTaskIfMatch(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+
+        task = self.createTask(
+            user,
+            project["id"],
+            milestone["id"],
+            **self.testTask,
+        ).json()
+
+        self.assertEqual(task["version"], 0)
+
+        getTaskResponse = self.client.get(
+            f"/tasks/{task['id']}", headers=self.userToHeader(user)
+        )
+        etag = getTaskResponse.headers["ETag"]
+
+        self.assertEqual(etag, '"0"')
+
+        updateTaskResponse = self.client.patch(
+            f"/tasks/{task['id']}",
+            json={"status": "In Progress"},
+            headers={**self.userToHeader(user), "If-Match": etag},
+        )
+
+        self.assertEqual(updateTaskResponse.status_code, status.HTTP_200_OK)
+        self.assertEqual(updateTaskResponse.json()["version"], 1)
+        self.assertEqual(updateTaskResponse.headers["ETag"], '"1"')
+
+        staleUpdateResponse = self.client.patch(
+            f"/tasks/{task['id']}",
+            json={"status": "Completed"},
+            headers={**self.userToHeader(user), "If-Match": etag},
+        )
+
+        self.assertEqual(
+            staleUpdateResponse.status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
+
+        getTaskResponse = self.client.get(
+            f"/tasks/{task['id']}", headers=self.userToHeader(user)
+        )
+
+        self.assertEqual(getTaskResponse.json()["status"], "In Progress")
+        self.assertEqual(getTaskResponse.headers["ETag"], '"1"')
+
+    def testUpdateTaskInvalidIfMatch(self):
+        user = self.createUser("test")
+
+        updateTaskResponse = self.client.patch(
+            f"/tasks/{str(ObjectId())}",
+            json={},
+            headers={**self.userToHeader(user), "If-Match": "abc"},
+        )
+
+        self.assertEqual(updateTaskResponse.status_code, status.HTTP_400_BAD_REQUEST)
+
     def testUpdateTaskProjectAndMilestone(self):
         user = self.createUser("test")
         project = self.createProject(user, "test", "test").json()
@@ -447,6 +536,55 @@ class TestTasks(TestBase):
             updateTaskResponse.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+    def testTaskCounts(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        milestone2 = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+
+        task = self.createTask(
+            user,
+            project["id"],
+            milestone["id"],
+            **self.testTask,
+        ).json()
+
+        def counts(path):
+            return self.client.get(path, headers=self.userToHeader(user)).json()[
+                "taskCounts"
+            ]
+
+        self.assertEqual(counts(f"/milestones/{milestone['id']}/summary")["total"], 1)
+        self.assertEqual(
+            counts(f"/projects/{project['id']}/summary")["status"]["To Do"], 1
+        )
+
+        self.client.patch(
+            f"/tasks/{task['id']}",
+            json={"status": "Completed", "milestoneId": milestone2["id"]},
+            headers=self.userToHeader(user),
+        )
+
+        self.assertEqual(counts(f"/milestones/{milestone['id']}/summary")["total"], 0)
+        self.assertEqual(
+            counts(f"/milestones/{milestone2['id']}/summary")["status"]["Completed"],
+            1,
+        )
+
+        projectCounts = counts(f"/projects/{project['id']}/summary")
+        self.assertEqual(projectCounts["total"], 1)
+        self.assertEqual(projectCounts["status"]["To Do"], 0)
+        self.assertEqual(projectCounts["status"]["Completed"], 1)
+
+        self.client.delete(f"/tasks/{task['id']}", headers=self.userToHeader(user))
+
+        self.assertEqual(counts(f"/milestones/{milestone2['id']}/summary")["total"], 0)
+        self.assertEqual(counts(f"/projects/{project['id']}/summary")["total"], 0)
+
     def testDeleteTask(self):
         user = self.createUser("test")
         project = self.createProject(user, "test", "test").json()
@@ -488,8 +626,22 @@ class TestTasks(TestBase):
         )
         self.assertEqual(getTaskResponse.status_code, status.HTTP_200_OK)
 
-        task2 = getTaskResponse.json()
-        self.assertEqual(task2["dependentTasks"], [])
+        self.assertEqual(getTaskResponse.json()["dependentTasks"], [])
+        self.assertEqual(getTaskResponse.json()["version"], task2["version"] + 1)
+
+        # A client still holding the task from before the dependency was pulled
+        # can't overwrite it.
+        staleUpdateResponse = self.client.patch(
+            f"/tasks/{task2['id']}",
+            json={"dependentTasks": [task["id"]]},
+            headers={
+                **self.userToHeader(user),
+                "If-Match": f'"{task2["version"]}"',
+            },
+        )
+        self.assertEqual(
+            staleUpdateResponse.status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
 
     def testDeleteTaskNotFound(self):
         user = self.createUser("test")
@@ -537,7 +689,7 @@ class TestTasks(TestBase):
 
         task = task.json()
 
-        self.mockDb.tasks.delete_one.return_value.deleted_count = 0
+        self.mockDb.tasks.find_one_and_delete.return_value = None
 
         deleteTaskResponse = self.client.delete(
             f"/tasks/{task['id']}", headers=self.userToHeader(user)
@@ -0,0 +1,141 @@
+from unittest.mock import patch
+
+from api.database import getDb
+from api.main import app
+from api.tests.util import OpCounter, TestBase
+from api.tokens import Revocations
+
+
+class TestTokens(TestBase):
+    def setUp(self):
+        self.patches = [
+            patch("api.tokens.STATELESS", True),
+            patch("api.tokens.revocations", Revocations(10)),
+        ]
+        for p in self.patches:
+            p.start()
+
+        self.user = self.createUser("test")
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+        app.dependency_overrides[getDb] = lambda: self.mockDb
+
+        for collection in [
+            "users",
+            "memberships",
+            "projects",
+            "refreshTokens",
+            "revocations",
+        ]:
+            self.mockDb[collection].delete_many({})
+
+    def me(self, token: str):
+        return self.client.get(
+            "/users/me", headers={"Authorization": f"Bearer {token}"}
+        )
+
+    def refresh(self, refreshToken: str):
+        return self.client.post("/users/refresh", json={"refreshToken": refreshToken})
+
+    def testLoginReturnsTokens(self):
+        response = self.client.post("/users/login?username=test&password=test")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()["refreshToken"])
+        self.assertEqual(self.me(response.json()["token"]).json()["username"], "test")
+
+    def testAccessTokenNeedsNoLookups(self):
+        counter = OpCounter(self.mockDb)
+        app.dependency_overrides[getDb] = lambda: counter
+
+        self.me(self.user["token"])
+        counter.clear()
+
+        response = self.me(self.user["token"])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["email"], "test@test.com")
+        self.assertEqual(counter.ops, [])
+
+    def testRefreshTokensAreSingleUse(self):
+        response = self.refresh(self.user["refreshToken"])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()["refreshToken"], self.user["refreshToken"])
+        self.assertEqual(self.me(response.json()["token"]).status_code, 200)
+
+        self.assertEqual(self.refresh(self.user["refreshToken"]).status_code, 401)
+        self.assertEqual(self.refresh(response.json()["refreshToken"]).status_code, 200)
+
+    def testRefreshTokenNotReadFromQuery(self):
+        response = self.client.post(
+            f"/users/refresh?refreshToken={self.user['refreshToken']}"
+        )
+
+        self.assertEqual(response.status_code, 422)
+
+    def testCreateProjectReturnsNewToken(self):
+        project = self.createProject(self.user, "test", "test").json()
+
+        self.assertEqual(self.me(self.user["token"]).status_code, 401)
+        self.assertEqual(
+            self.client.get(
+                f"/projects/{project['id']}/summary",
+                headers={"Authorization": f"Bearer {project['token']}"},
+            ).status_code,
+            200,
+        )
+
+    def testMembershipChangesRevokeAccessTokens(self):
+        owner = self.createUser("owner")
+        project = self.createProject(owner, "test", "test").json()
+
+        joined = self.client.post(
+            f"/projects/{project['id']}/join", headers=self.userToHeader(self.user)
+        )
+
+        self.assertEqual(joined.json()["joinedProjects"], [project["id"]])
+        self.assertEqual(self.me(self.user["token"]).status_code, 401)
+        self.assertEqual(
+            self.client.get(
+                f"/projects/{project['id']}/summary",
+                headers=self.userToHeader(joined.json()),
+            ).status_code,
+            200,
+        )
+
+        # The owner's token predates the project and has to be refreshed too.
+        self.assertEqual(self.me(owner["token"]).status_code, 401)
+        refreshed = self.refresh(owner["refreshToken"]).json()
+        self.assertEqual(refreshed["ownedProjects"], [project["id"]])
+
+    def testPasswordResetRevokesRefreshTokens(self):
+        response = self.client.patch(
+            "/users/password/reset?newPassword=new",
+            headers=self.userToHeader(self.user),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.me(self.user["token"]).status_code, 401)
+        self.assertEqual(self.refresh(self.user["refreshToken"]).status_code, 401)
+        self.assertEqual(self.me(response.json()["token"]).status_code, 200)
+        self.assertEqual(self.refresh(response.json()["refreshToken"]).status_code, 200)
+
+    def testExpiredAccessToken(self):
+        with patch("api.tokens.ACCESS_TOKEN_TTL", -10):
+            user = self.client.post("/users/login?username=test&password=test").json()
+
+        self.assertEqual(self.me(user["token"]).status_code, 401)
+
+    def testStoredTokensStillWork(self):
+        token = self.mockDb.users.find_one({"username": "test"})["token"]
+
+        self.assertEqual(self.me(token).status_code, 200)
+
+    def testAccessTokensRejectedInSessionMode(self):
+        with patch("api.tokens.STATELESS", False):
+            self.assertEqual(self.me(self.user["token"]).status_code, 401)
+            self.assertEqual(self.refresh(self.user["refreshToken"]).status_code, 401)
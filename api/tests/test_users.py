@@ -1,7 +1,9 @@
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
+from bson import ObjectId
 from fastapi import status
 
+from api.passwords import hashPassword
 from api.schemas import User
 from api.tests.util import TestBase
 
@@ -24,6 +26,10 @@ class TestUsers(TestBase):
 
     def tearDown(self) -> None:
         self.mockDb.users.delete_many({})
+        self.mockDb.memberships.delete_many({})
+        self.mockDb.projects.delete_many({})
+        self.mockDb.milestones.delete_many({})
+        self.mockDb.tasks.delete_many({})
 
         opts = {
             "return_value": True,
@@ -33,6 +39,26 @@ class TestUsers(TestBase):
         self.mockDb.users.find_one_and_update.reset_mock(**opts)
         self.mockDb.users.find_one.reset_mock(**opts)
 
+    def testUserProjects(self):
+        owned, joined = str(ObjectId()), str(ObjectId())
+        user = User(
+            username="test",
+            password="test",
+            email="test@test.com",
+            ownedProjects=[owned],
+            joinedProjects=[joined, owned, joined],
+        )
+
+        self.assertEqual(user.projects(), [owned, joined])
+        self.assertEqual(user.projectOids(), [ObjectId(owned), ObjectId(joined)])
+        self.assertIs(user.projects(), user.projects())
+        self.assertTrue(user.canAccess(owned))
+        self.assertTrue(user.canAccess(joined))
+        self.assertFalse(user.canAccess(str(ObjectId())))
+        self.assertTrue(user.isAdmin(owned))
+        self.assertFalse(user.isAdmin(joined))
+        self.assertNotIn("projectSet", user.model_dump())
+
     def registerUser(self):
         return self.client.post(
             "/users/register",
@@ -93,6 +119,17 @@ class TestUsers(TestBase):
         response = self.registerUser()
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def testRegisterUnassigned(self):
+        response = self.client.post(
+            "/users/register",
+            json={
+                "username": "Unassigned",
+                "password": self.testUser.password,
+                "email": self.testUser.email,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def testRegisterExistingEmail(self):
         response = self.registerUser()
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -137,6 +174,54 @@ class TestUsers(TestBase):
         )
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def testLoginBody(self):
+        registerResponse = self.registerUser()
+        credentials = {
+            "username": self.testUser.username,
+            "password": self.testUser.password,
+        }
+
+        for response in (
+            self.client.post("/users/login", json=credentials),
+            self.client.post("/users/login", data=credentials),
+        ):
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertDictEqual(response.json(), registerResponse.json())
+
+        response = self.client.post(
+            "/users/login", json={"username": self.testUser.username}
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def testLoginAfterRegisteringOnAnotherWorker(self):
+        self.assertEqual(self.loginUser().status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Written straight to the database, as by a register on another worker.
+        self.mockDb.users.insert_one(
+            {
+                "username": self.testUser.username,
+                "password": hashPassword(self.testUser.password),
+                "email": self.testUser.email,
+            }
+        )
+
+        self.assertEqual(self.loginUser().status_code, status.HTTP_200_OK)
+
+    def testLoginRehashesPassword(self):
+        self.registerUser()
+        self.assertTrue(
+            self.mockDb.users.find_one({})["password"].startswith("$2b$12$")
+        )
+
+        with patch("api.passwords.BCRYPT_ROUNDS", 4):
+            self.assertEqual(self.loginUser().status_code, status.HTTP_200_OK)
+
+            password = self.mockDb.users.find_one({})["password"]
+            self.assertTrue(password.startswith("$2b$04$"))
+
+            self.assertEqual(self.loginUser().status_code, status.HTTP_200_OK)
+            self.assertEqual(self.mockDb.users.find_one({})["password"], password)
+
     def testGetCurrentUser(self):
         registerResponse = self.registerUser()
         self.assertEqual(registerResponse.status_code, status.HTTP_201_CREATED)
@@ -156,6 +241,48 @@ class TestUsers(TestBase):
 
         self.assertDictEqual(json, registerResponse.json())
 
+    def testGetCurrentUserLegacyMemberships(self):
+        user = self.createUser("test")
+        owner = self.createUser("owner")
+        owned = str(ObjectId())
+        joined = self.createProject(owner, "test", "test").json()["id"]
+
+        # As left for users migration 003 has not reached yet.
+        self.mockDb.users.update_one(
+            {"username": "test"},
+            {"$set": {"ownedProjects": [owned], "joinedProjects": [joined]}},
+        )
+
+        me = self.client.get("/users/me", headers=self.userToHeader(user)).json()
+
+        self.assertEqual(me["ownedProjects"], [owned])
+        self.assertEqual(me["joinedProjects"], [joined])
+
+        self.client.delete(f"/projects/{joined}/leave", headers=self.userToHeader(user))
+
+        me = self.client.get("/users/me", headers=self.userToHeader(user)).json()
+        self.assertEqual(me["joinedProjects"], [])
+
+    def testGetCurrentUserMembershipsCached(self):
+        user = self.createUser("test")
+        headers = self.userToHeader(user)
+        projectId = str(ObjectId())
+
+        self.client.get("/users/me", headers=headers)
+
+        self.mockDb.memberships.insert_one(
+            {"projectId": projectId, "userId": user["id"], "role": "member"}
+        )
+        me = self.client.get("/users/me", headers=headers).json()
+        self.assertEqual(me["joinedProjects"], [])
+
+        # As after a membership change made on another worker.
+        self.mockDb.users.update_one(
+            {"username": "test"}, {"$inc": {"membershipsVersion": 1}}
+        )
+        me = self.client.get("/users/me", headers=headers).json()
+        self.assertEqual(me["joinedProjects"], [projectId])
+
     def testGetCurrentUserInvalid(self):
         response = self.client.get(
             "/users/me",
@@ -177,6 +304,65 @@ class TestUsers(TestBase):
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def testGetMyTasks(self):
+        user = self.createUser("test")
+        other = self.createUser("other")
+
+        tasks = []
+        for owner, dueDate, args in [
+            (user, "2022-01-03T00:00:00", {"assignedTo": "test"}),
+            (user, "2022-01-01T00:00:00", {"qaTask": {"assignedTo": "test"}}),
+            (user, "2022-01-02T00:00:00", {"assignedTo": "other"}),
+            (other, "2022-01-02T00:00:00", {"assignedTo": "test"}),
+            (user, "2022-01-04T00:00:00", {"assignedTo": "test"}),
+        ]:
+            project = self.createProject(owner, "test", "test").json()
+            milestone = self.createMilestone(
+                owner, project["id"], "test", "test", dueDate
+            ).json()
+            qaTask = {"name": "qa", "description": "qa", "dueDate": dueDate}
+            qaTask.update(args.pop("qaTask", {}))
+
+            tasks.append(
+                self.createTask(
+                    owner,
+                    project["id"],
+                    milestone["id"],
+                    "test",
+                    "test",
+                    dueDate,
+                    qaTask,
+                    args=args,
+                ).json()
+            )
+
+        response = self.client.get("/users/me/tasks", headers=self.userToHeader(user))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [task["id"] for task in response.json()["tasks"]],
+            [tasks[1]["id"], tasks[0]["id"], tasks[4]["id"]],
+        )
+
+        response = self.client.get(
+            "/users/me/tasks",
+            params={"order": "desc", "limit": 2},
+            headers=self.userToHeader(user),
+        ).json()
+
+        self.assertEqual(
+            [task["id"] for task in response["tasks"]], [tasks[4]["id"], tasks[0]["id"]]
+        )
+
+        response = self.client.get(
+            "/users/me/tasks",
+            params={"order": "desc", "limit": 2, "cursor": response["nextCursor"]},
+            headers=self.userToHeader(user),
+        ).json()
+
+        self.assertEqual([task["id"] for task in response["tasks"]], [tasks[1]["id"]])
+        self.assertIsNone(response["nextCursor"])
+
     def testChangePassword(self):
         registerResponse = self.registerUser()
         self.assertEqual(registerResponse.status_code, status.HTTP_201_CREATED)
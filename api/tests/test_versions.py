@@ -0,0 +1,146 @@
+import datetime
+
+from bson import ObjectId
+from mongomock import MongoClient
+from pymongo import UpdateOne
+
+from api.tests.util import TestBase
+from api.versions import SCHEMA_VERSIONS, WriteBack, upgrade, writeBack
+
+
+class TestVersions(TestBase):
+    def setUp(self):
+        writeBack.flush(MongoClient().db)
+
+    def tearDown(self):
+        for collection in ["users", "memberships", "projects", "milestones", "tasks"]:
+            self.mockDb[collection].delete_many({})
+
+    def testCurrentDocumentIsUntouched(self):
+        task = {"status": "Todo", "schemaVersion": SCHEMA_VERSIONS["tasks"]}
+
+        self.assertIs(upgrade("tasks", task), task)
+        self.assertEqual(task["status"], "Todo")
+        self.assertEqual(writeBack.size, 0)
+
+    def testUpgradeAndWriteBack(self):
+        db = MongoClient().db
+        id = db.tasks.insert_one(
+            {"status": "Todo", "qaTask": {"name": "qa", "status": "Todo"}}
+        ).inserted_id
+
+        task = upgrade("tasks", db.tasks.find_one({"_id": id}))
+
+        self.assertEqual(task["status"], "To Do")
+        self.assertEqual(task["qaTask"], {"name": "qa", "status": "To Do"})
+
+        writeBack.flush(db)
+
+        self.assertEqual(db.tasks.find_one({"_id": id}), {"_id": id, **task})
+        self.assertEqual(db.tasks.find_one()["schemaVersion"], SCHEMA_VERSIONS["tasks"])
+
+    def testWriteBackKeepsConcurrentUpdates(self):
+        db = MongoClient().db
+        id = db.tasks.insert_one({"status": "Todo"}).inserted_id
+
+        upgrade("tasks", db.tasks.find_one({"_id": id}))
+        db.tasks.update_one({"_id": id}, {"$set": {"status": "Completed"}})
+        writeBack.flush(db)
+
+        self.assertEqual(
+            db.tasks.find_one({"_id": id}), {"_id": id, "status": "Completed"}
+        )
+
+    def testMilestoneCreatedAtFromId(self):
+        id = ObjectId.from_datetime(datetime.datetime(2020, 1, 1))
+
+        milestone = upgrade("milestones", {"_id": id, "status": "To Do"})
+
+        self.assertEqual(
+            milestone["createdAt"], id.generation_time.astimezone().replace(tzinfo=None)
+        )
+
+    def testMaxPending(self):
+        queue = WriteBack(10, 1)
+        first, second = ObjectId(), ObjectId()
+
+        queue.add("tasks", first, UpdateOne({"_id": first}, {}))
+        queue.add("tasks", second, UpdateOne({"_id": second}, {}))
+        queue.add("tasks", first, UpdateOne({"_id": first}, {"$set": {"a": 1}}))
+
+        self.assertEqual(list(queue.pending["tasks"]), [first])
+        self.assertEqual(queue.size, 1)
+
+    def testGetTaskUpgradesOnRead(self):
+        user = self.createUser("test")
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        task = self.createTask(
+            user,
+            project["id"],
+            milestone["id"],
+            "test",
+            "test",
+            "2022-01-01T00:00:00",
+            {"name": "qa", "description": "qa", "dueDate": "2022-01-01T00:00:00"},
+        ).json()
+
+        id = ObjectId(task["id"])
+        self.assertEqual(
+            self.mockDb.tasks.find_one({"_id": id})["schemaVersion"],
+            SCHEMA_VERSIONS["tasks"],
+        )
+
+        self.mockDb.tasks.update_one(
+            {"_id": id}, {"$set": {"status": "Todo"}, "$unset": {"schemaVersion": ""}}
+        )
+
+        response = self.client.get(
+            f"/tasks/{task['id']}", headers=self.userToHeader(user)
+        )
+
+        self.assertEqual(response.json()["status"], "To Do")
+        self.assertEqual(self.mockDb.tasks.find_one({"_id": id})["status"], "Todo")
+
+        writeBack.flush(self.mockDb)
+
+        self.assertEqual(self.mockDb.tasks.find_one({"_id": id})["status"], "To Do")
+
+    def testUpdateLegacyTaskCounts(self):
+        user = self.createUser("test")
+        headers = self.userToHeader(user)
+        project = self.createProject(user, "test", "test").json()
+        milestone = self.createMilestone(
+            user, project["id"], "test", "test", "2022-01-01T00:00:00"
+        ).json()
+        task = self.createTask(
+            user,
+            project["id"],
+            milestone["id"],
+            "test",
+            "test",
+            "2022-01-01T00:00:00",
+            {"name": "qa", "description": "qa", "dueDate": "2022-01-01T00:00:00"},
+        ).json()
+
+        self.mockDb.tasks.update_one(
+            {"_id": ObjectId(task["id"])},
+            {"$set": {"status": "Todo"}, "$unset": {"schemaVersion": ""}},
+        )
+
+        response = self.client.patch(
+            f"/tasks/{task['id']}", headers=headers, json={"status": "Completed"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        for path in (
+            f"/projects/{project['id']}/summary",
+            f"/milestones/{milestone['id']}/summary",
+        ):
+            response = self.client.get(path, headers=headers)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["taskCounts"]["status"]["To Do"], 0)
+            self.assertEqual(response.json()["taskCounts"]["status"]["Completed"], 1)
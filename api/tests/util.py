@@ -3,16 +3,82 @@ import unittest
 from fastapi.testclient import TestClient
 from mongomock import MongoClient
 
-from api.database import getDb
+from api.database import getDb, textSearchEnabled
 from api.main import app
 
 
+class CountingCollection:
+    OPERATIONS = {
+        "aggregate",
+        "bulk_write",
+        "count_documents",
+        "delete_many",
+        "delete_one",
+        "find",
+        "find_one",
+        "find_one_and_delete",
+        "find_one_and_update",
+        "insert_many",
+        "insert_one",
+        "update_many",
+        "update_one",
+    }
+
+    def __init__(self, counter, collection):
+        self.counter = counter
+        self.collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+
+        if name not in self.OPERATIONS:
+            return attr
+
+        def operation(*args, **kwargs):
+            self.counter.ops.append((self.collection.name, name))
+            result = attr(*args, **kwargs)
+
+            if (matched := getattr(result, "matched_count", None)) is not None:
+                self.counter.written += matched
+            elif (deleted := getattr(result, "deleted_count", None)) is not None:
+                self.counter.written += deleted
+
+            return result
+
+        return operation
+
+
+# Wraps a database and records every collection operation issued through it, so
+# tests can assert how many round trips a route makes. `written` adds up the
+# documents matched by updates and deletes.
+class OpCounter:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+        self.written = 0
+
+    def clear(self):
+        self.ops.clear()
+        self.written = 0
+
+    def __getattr__(self, name):
+        return CountingCollection(self, getattr(self.db, name))
+
+    def __getitem__(self, name):
+        return CountingCollection(self, self.db[name])
+
+    def get_collection(self, name, **kwargs):
+        return CountingCollection(self, self.db.get_collection(name, **kwargs))
+
+
 class TestBase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         cls.client = TestClient(app)
         cls.mockDb = MongoClient().db
         app.dependency_overrides[getDb] = lambda: cls.mockDb
+        # mongomock implements neither $text nor sorting on textScore.
+        app.dependency_overrides[textSearchEnabled] = lambda: False
 
     def createUser(self, keyword: str):
         return self.client.post(
@@ -79,3 +145,20 @@ class TestBase(unittest.TestCase):
                 "endDate": endDate,
             },
         )
+
+
+# Routes of these tests get an OpCounter in place of the database, the data they
+# set up is cleared after every test.
+class CountingTestBase(TestBase):
+    COLLECTIONS = ("users", "memberships", "projects", "milestones", "tasks", "sprints")
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.counter = OpCounter(cls.mockDb)
+        app.dependency_overrides[getDb] = lambda: cls.counter
+
+    def tearDown(self):
+        for collection in self.COLLECTIONS:
+            self.mockDb[collection].delete_many({})
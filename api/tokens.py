@@ -0,0 +1,186 @@
+import datetime
+import hashlib
+import os
+import secrets
+import threading
+import time
+from typing import Optional
+
+from fastapi import HTTPException, status
+from jose import jwt
+from pymongo.database import Database
+
+from api.schemas import User
+
+# With AUTH_MODE=stateless, login hands out a short lived access token carrying
+# the user's project memberships, so authenticating a request is a signature
+# check instead of a user and memberships lookup, and an opaque refresh token
+# stored server side to get a new one. Access tokens issued to a user before a
+# revocation, i.e. a password reset or a membership change, are rejected, which
+# makes the client refresh and pick up the new memberships. Tokens from
+# createToken keep working through the database in both modes.
+JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "kraken")
+STATELESS = os.environ.get("AUTH_MODE", "session") == "stateless"
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL_SECONDS", 15 * 60))
+REFRESH_TOKEN_TTL = int(os.environ.get("REFRESH_TOKEN_TTL_SECONDS", 30 * 24 * 60 * 60))
+REVOCATIONS_REFRESH_INTERVAL = float(os.environ.get("REVOCATIONS_REFRESH_SECONDS", 10))
+
+
+def expiry(seconds: float) -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds)
+
+
+# Revocations only matter while the access tokens they cover can still be valid,
+# so they expire with them and the whole list stays small enough to keep in
+# memory. Every worker reloads it at most every REVOCATIONS_REFRESH_INTERVAL and
+# applies its own revocations immediately.
+class Revocations:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.revokedAt = {}
+        self.loadedAt = None
+        self.lock = threading.Lock()
+
+    def load(self, db: Database):
+        revokedAt = {
+            revocation["_id"]: revocation["revokedAt"]
+            for revocation in db.revocations.find({}, {"revokedAt": 1})
+        }
+
+        with self.lock:
+            self.revokedAt = revokedAt
+            self.loadedAt = time.monotonic()
+
+    def isRevoked(self, db: Database, userId: str, issuedAt: float) -> bool:
+        if self.loadedAt is None or time.monotonic() - self.loadedAt > self.interval:
+            self.load(db)
+
+        return issuedAt <= self.revokedAt.get(userId, 0)
+
+    def revoke(self, db: Database, userId: str):
+        revokedAt = time.time()
+
+        db.revocations.update_one(
+            {"_id": userId},
+            {"$set": {"revokedAt": revokedAt, "expiresAt": expiry(ACCESS_TOKEN_TTL)}},
+            upsert=True,
+        )
+
+        with self.lock:
+            self.revokedAt[userId] = revokedAt
+
+
+revocations = Revocations(REVOCATIONS_REFRESH_INTERVAL)
+
+
+def createAccessToken(user: User) -> str:
+    now = time.time()
+
+    return jwt.encode(
+        {
+            "sub": user.id,
+            "typ": "access",
+            "iat": now,
+            "exp": int(now + ACCESS_TOKEN_TTL),
+            "username": user.username,
+            "email": user.email,
+            "owned": user.ownedProjects,
+            "joined": user.joinedProjects,
+        },
+        JWT_SECRET_KEY,
+        algorithm="HS256",
+    )
+
+
+def hashRefreshToken(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# Returns the user with a new access token and refresh token.
+def issueTokens(db: Database, user: User) -> User:
+    refreshToken = secrets.token_urlsafe(32)
+
+    db.refreshTokens.insert_one(
+        {
+            "_id": hashRefreshToken(refreshToken),
+            "userId": user.id,
+            "expiresAt": expiry(REFRESH_TOKEN_TTL),
+        }
+    )
+
+    return User(
+        **{
+            **user.model_dump(),
+            "token": createAccessToken(user),
+            "refreshToken": refreshToken,
+        }
+    )
+
+
+# Refresh tokens are single use, each refresh swaps it for a new one.
+def useRefreshToken(db: Database, refreshToken: str) -> Optional[str]:
+    if not STATELESS:
+        return None
+
+    if stored := db.refreshTokens.find_one_and_delete(
+        {
+            "_id": hashRefreshToken(refreshToken),
+            "expiresAt": {"$gt": datetime.datetime.utcnow()},
+        }
+    ):
+        return stored["userId"]
+
+    return None
+
+
+# Access tokens have to be swapped for new ones after a user's memberships or
+# password change, in stateless mode.
+def revokeTokens(db: Database, userId: str, refreshTokens: bool = False):
+    if not STATELESS:
+        return
+
+    revocations.revoke(db, userId)
+
+    if refreshTokens:
+        db.refreshTokens.delete_many({"userId": userId})
+
+
+# A user with an access token for its current memberships, in stateless mode.
+def withAccessToken(user: User) -> User:
+    if not STATELESS:
+        return user
+
+    return User(**{**user.model_dump(), "token": createAccessToken(user)})
+
+
+# The access token replacing the ones just revoked, in stateless mode.
+def renewedToken(user: User) -> Optional[str]:
+    return createAccessToken(user) if STATELESS else None
+
+
+# Login and register hand out access and refresh tokens in stateless mode, the
+# stored token otherwise.
+def signIn(db: Database, user: User) -> User:
+    return issueTokens(db, user) if STATELESS else user
+
+
+def userFromAccessToken(db: Database, token: str, claims: dict) -> User:
+    if not STATELESS:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
+        )
+
+    if revocations.isRevoked(db, claims["sub"], claims["iat"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked"
+        )
+
+    return User(
+        id=claims["sub"],
+        username=claims["username"],
+        email=claims["email"],
+        password="",
+        ownedProjects=claims["owned"],
+        joinedProjects=claims["joined"],
+        token=token,
+    )
@@ -0,0 +1,154 @@
+import asyncio
+import copy
+import os
+import threading
+
+from prometheus_client import Counter
+from pymongo import UpdateOne
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+
+# Documents carry the schemaVersion they were written with. A document read with
+# an older version is upgraded in memory before it reaches the schemas, and the
+# upgraded fields are queued to be written back in batches off the request path.
+# A schema change is rolled out by appending an upgrade below instead of
+# rewriting a whole collection in one go.
+
+SCHEMA_UPGRADES = Counter(
+    "schema_upgrades",
+    "Documents upgraded to the current schema on read",
+    ["collection"],
+)
+SCHEMA_WRITE_BACKS = Counter(
+    "schema_write_backs",
+    "Upgraded documents written back",
+    ["collection"],
+)
+SCHEMA_WRITE_BACK_FAILURES = Counter(
+    "schema_write_back_failures",
+    "Batches of upgraded documents that failed to be written back",
+    ["collection"],
+)
+
+
+def todoStatus(document: dict):
+    if document.get("status") == "Todo":
+        document["status"] = "To Do"
+
+    if (qaTask := document.get("qaTask")) and qaTask.get("status") == "Todo":
+        document["qaTask"] = {**qaTask, "status": "To Do"}
+
+
+def createdAtFromId(document: dict):
+    if "createdAt" not in document and "_id" in document:
+        document["createdAt"] = (
+            document["_id"].generation_time.astimezone().replace(tzinfo=None)
+        )
+
+
+# Upgrades by collection, the one at index i takes a document from version i to
+# i + 1. Documents without a schemaVersion are at version 0.
+UPGRADES = {
+    "tasks": [todoStatus],
+    "milestones": [todoStatus, createdAtFromId],
+    "sprints": [],
+}
+SCHEMA_VERSIONS = {collection: len(steps) for collection, steps in UPGRADES.items()}
+
+
+# The upgraded fields are only written if they still hold what was read, so a
+# write back never overwrites a concurrent update.
+def writeBackOperation(before: dict, after: dict, version: int) -> UpdateOne:
+    filter = {"_id": after["_id"], "schemaVersion": {"$not": {"$gte": version}}}
+    update = {"$set": {"schemaVersion": version}}
+
+    for field, value in after.items():
+        if field != "schemaVersion" and before.get(field, ...) != value:
+            filter[field] = before[field] if field in before else {"$exists": False}
+            update["$set"][field] = value
+
+    return UpdateOne(filter, update)
+
+
+class WriteBack:
+    def __init__(self, batchSize: int, maxPending: int):
+        self.batchSize = batchSize
+        self.maxPending = maxPending
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.size = 0
+
+    # Queued documents over maxPending are dropped, they get upgraded again when
+    # next read.
+    def add(self, collection: str, id, operation: UpdateOne):
+        with self.lock:
+            operations = self.pending.setdefault(collection, {})
+            if id not in operations and self.size >= self.maxPending:
+                return
+
+            self.size += id not in operations
+            operations[id] = operation
+
+    def flush(self, db: Database):
+        with self.lock:
+            pending, self.pending, self.size = self.pending, {}, 0
+
+        for collection, operations in pending.items():
+            operations = list(operations.values())
+
+            for start in range(0, len(operations), self.batchSize):
+                try:
+                    result = db[collection].bulk_write(
+                        operations[start : start + self.batchSize], ordered=False
+                    )
+                except PyMongoError:
+                    SCHEMA_WRITE_BACK_FAILURES.labels(collection).inc()
+                    continue
+
+                SCHEMA_WRITE_BACKS.labels(collection).inc(result.modified_count)
+
+
+writeBack = WriteBack(
+    int(os.environ.get("SCHEMA_WRITE_BACK_BATCH_SIZE", 500)),
+    int(os.environ.get("SCHEMA_WRITE_BACK_MAX_PENDING", 10000)),
+)
+
+
+def upgrade(collection: str, document: dict) -> dict:
+    version = SCHEMA_VERSIONS[collection]
+    start = document.get("schemaVersion", 0)
+    if start >= version:
+        return document
+
+    before = copy.deepcopy(document)
+    for step in UPGRADES[collection][start:]:
+        step(document)
+    document["schemaVersion"] = version
+
+    SCHEMA_UPGRADES.labels(collection).inc()
+    if "_id" in document:
+        writeBack.add(
+            collection,
+            document["_id"],
+            writeBackOperation(before, document, version),
+        )
+
+    return document
+
+
+# An upgraded copy of a document that is not written back, for documents read
+# with a projection whose other fields were never upgraded.
+def upgraded(collection: str, document: dict) -> dict:
+    document = copy.deepcopy(document)
+    for step in UPGRADES[collection][document.get("schemaVersion", 0) :]:
+        step(document)
+
+    return document
+
+
+async def writeBackLoop(db: Database):
+    interval = float(os.environ.get("SCHEMA_WRITE_BACK_INTERVAL", 5))
+
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(writeBack.flush, db)
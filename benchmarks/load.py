@@ -0,0 +1,381 @@
+# Drives a traffic mix against a running API seeded by benchmarks.seed.
+#
+# Every worker thread repeatedly picks a scenario by weight, builds its request
+# from the manifest and times it. Throughput and p50/p95/p99 latencies per route
+# are written to JSON. Given a previous report, routes whose p95 regressed by more
+# than --tolerance fail the run, so two releases can be compared on the same data.
+#
+#   python -m benchmarks.load --base-url http://localhost --duration 60 \
+#       --concurrency 16 --output results.json --compare previous.json
+#
+# The mix is scriptable: --mix takes a JSON object of scenario name to weight,
+# scenarios left out are not run.
+
+import argparse
+import datetime
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from benchmarks.search import WORDS, sentence
+
+
+class Org:
+    def __init__(self, manifest: dict):
+        self.password = manifest["password"]
+        self.users = {user["id"]: user for user in manifest["users"]}
+        self.projects = manifest["projects"]
+        self.created = []
+        self.lock = threading.Lock()
+
+    def project(self) -> dict:
+        return random.choice(self.projects)
+
+    # A member of the project, the owner included.
+    def member(self, project: dict) -> dict:
+        return self.users[random.choice([project["owner"]] + project["members"])]
+
+    def headers(self, user: dict) -> dict:
+        return {"Authorization": f"Bearer {user['token']}"}
+
+    def addCreated(self, project: dict, user: dict, id: str):
+        with self.lock:
+            self.created.append((project, user, id))
+
+    def popCreated(self):
+        with self.lock:
+            if self.created:
+                return self.created.pop(random.randrange(len(self.created)))
+
+
+def taskBody(project: dict) -> dict:
+    dueDate = f"2024-0{random.randint(1, 9)}-1{random.randint(0, 9)}T00:00:00"
+    return {
+        "projectId": project["id"],
+        "milestoneId": random.choice(project["milestones"]),
+        "name": sentence(4),
+        "description": sentence(20),
+        "dueDate": dueDate,
+        "qaTask": {"name": sentence(2), "description": sentence(8), "dueDate": dueDate},
+    }
+
+
+# Each scenario returns (route, method, path, request kwargs, on success callback).
+def login(org: Org):
+    user = random.choice(list(org.users.values()))
+    body = {"username": user["username"], "password": org.password}
+    return "POST /users/login", "POST", "/users/login", {"json": body}, None
+
+
+def me(org: Org):
+    user = random.choice(list(org.users.values()))
+    return "GET /users/me", "GET", "/users/me", {"headers": org.headers(user)}, None
+
+
+def myTasks(org: Org):
+    user = random.choice(list(org.users.values()))
+    kwargs = {"headers": org.headers(user)}
+    return "GET /users/me/tasks", "GET", "/users/me/tasks", kwargs, None
+
+
+def getProjects(org: Org):
+    project = org.project()
+    kwargs = {"headers": org.headers(org.member(project))}
+    return "GET /projects/", "GET", "/projects/", kwargs, None
+
+
+def getProject(org: Org):
+    project = org.project()
+    kwargs = {"headers": org.headers(org.member(project))}
+    return "GET /projects/{id}", "GET", f"/projects/{project['id']}", kwargs, None
+
+
+def getProjectSummary(org: Org):
+    project = org.project()
+    path = f"/projects/{project['id']}/summary"
+    kwargs = {"headers": org.headers(org.member(project))}
+    return "GET /projects/{id}/summary", "GET", path, kwargs, None
+
+
+def getProjectTasks(org: Org):
+    project = org.project()
+    path = f"/projects/{project['id']}/tasks"
+    kwargs = {
+        "headers": org.headers(org.member(project)),
+        "params": {"sort": random.choice(["dueDate", "createdAt", "priority"])},
+    }
+    return "GET /projects/{id}/tasks", "GET", path, kwargs, None
+
+
+def getProjectUsers(org: Org):
+    project = org.project()
+    path = f"/projects/{project['id']}/users"
+    kwargs = {"headers": org.headers(org.member(project))}
+    return "GET /projects/{id}/users", "GET", path, kwargs, None
+
+
+def getMilestone(org: Org):
+    project = org.project()
+    path = f"/milestones/{random.choice(project['milestones'])}"
+    kwargs = {"headers": org.headers(org.member(project))}
+    return "GET /milestones/{id}", "GET", path, kwargs, None
+
+
+def updateMilestone(org: Org):
+    project = org.project()
+    path = f"/milestones/{random.choice(project['milestones'])}"
+    kwargs = {
+        "headers": org.headers(org.member(project)),
+        "json": {"description": sentence(10)},
+    }
+    return "PATCH /milestones/{id}", "PATCH", path, kwargs, None
+
+
+def getTask(org: Org):
+    project = org.project()
+    path = f"/tasks/{random.choice(project['tasks'])}"
+    kwargs = {"headers": org.headers(org.member(project))}
+    return "GET /tasks/{id}", "GET", path, kwargs, None
+
+
+def createTask(org: Org):
+    project = org.project()
+    user = org.member(project)
+    kwargs = {"headers": org.headers(user), "json": taskBody(project)}
+
+    def created(response):
+        org.addCreated(project, user, response.json()["id"])
+
+    return "POST /tasks/", "POST", "/tasks/", kwargs, created
+
+
+def updateTask(org: Org):
+    project = org.project()
+    path = f"/tasks/{random.choice(project['tasks'])}"
+    kwargs = {
+        "headers": org.headers(org.member(project)),
+        "json": {"status": random.choice(["To Do", "In Progress", "Completed"])},
+    }
+    return "PATCH /tasks/{id}", "PATCH", path, kwargs, None
+
+
+# Deletes tasks made by createTask so the dataset stays the same size.
+def deleteTask(org: Org):
+    if not (created := org.popCreated()):
+        return createTask(org)
+
+    project, user, id = created
+    kwargs = {"headers": org.headers(user)}
+    return "DELETE /tasks/{id}", "DELETE", f"/tasks/{id}", kwargs, None
+
+
+def getSprint(org: Org):
+    project = org.project()
+    if not project["sprints"]:
+        return getProject(org)
+
+    path = f"/sprints/{random.choice(project['sprints'])}"
+    kwargs = {"headers": org.headers(org.member(project))}
+    return "GET /sprints/{id}", "GET", path, kwargs, None
+
+
+def search(org: Org):
+    project = org.project()
+    kwargs = {
+        "headers": org.headers(org.member(project)),
+        "params": {"q": " ".join(random.sample(WORDS, random.randint(1, 2)))},
+    }
+    return "GET /search", "GET", "/search", kwargs, None
+
+
+# Read heavy, roughly what the board and task views of the frontend issue.
+MIX = {
+    "login": 1,
+    "me": 10,
+    "myTasks": 5,
+    "getProjects": 5,
+    "getProject": 10,
+    "getProjectSummary": 5,
+    "getProjectTasks": 10,
+    "getProjectUsers": 2,
+    "getMilestone": 5,
+    "updateMilestone": 1,
+    "getTask": 10,
+    "createTask": 3,
+    "updateTask": 5,
+    "deleteTask": 3,
+    "getSprint": 5,
+    "search": 5,
+}
+SCENARIOS = {
+    scenario.__name__: scenario
+    for scenario in (
+        login,
+        me,
+        myTasks,
+        getProjects,
+        getProject,
+        getProjectSummary,
+        getProjectTasks,
+        getProjectUsers,
+        getMilestone,
+        updateMilestone,
+        getTask,
+        createTask,
+        updateTask,
+        deleteTask,
+        getSprint,
+        search,
+    )
+}
+
+
+def worker(baseUrl: str, org: Org, mix: dict, deadline: float, timings: dict):
+    names, weights = list(mix), list(mix.values())
+
+    with httpx.Client(base_url=baseUrl, timeout=30, verify=False) as client:
+        while time.perf_counter() < deadline:
+            scenario = SCENARIOS[random.choices(names, weights)[0]]
+            route, method, path, kwargs, onSuccess = scenario(org)
+
+            started = time.perf_counter()
+            try:
+                response = client.request(method, path, **kwargs)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+
+            timings.setdefault(route, ([], [0]))
+            latencies, errors = timings[route]
+            latencies.append(elapsed)
+            if not ok:
+                errors[0] += 1
+            elif onSuccess:
+                onSuccess(response)
+
+
+def percentiles(latencies: list[float]) -> dict:
+    if len(latencies) < 2:
+        value = latencies[0] if latencies else 0
+        return {"p50": value, "p95": value, "p99": value}
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {"p50": quantiles[49], "p95": quantiles[94], "p99": quantiles[98]}
+
+
+def report(perWorker: list[dict], duration: float, args) -> dict:
+    routes = {}
+    for timings in perWorker:
+        for route, (latencies, errors) in timings.items():
+            merged = routes.setdefault(route, ([], [0]))
+            merged[0].extend(latencies)
+            merged[1][0] += errors[0]
+
+    allLatencies = [
+        latency for latencies, _ in routes.values() for latency in latencies
+    ]
+
+    return {
+        "startedAt": datetime.datetime.now().isoformat(timespec="seconds"),
+        "baseUrl": args.base_url,
+        "duration": duration,
+        "concurrency": args.concurrency,
+        "total": {
+            "requests": len(allLatencies),
+            "errors": sum(errors[0] for _, errors in routes.values()),
+            "throughput": len(allLatencies) / duration,
+            **percentiles(allLatencies),
+        },
+        "routes": {
+            route: {
+                "requests": len(latencies),
+                "errors": errors[0],
+                "throughput": len(latencies) / duration,
+                **percentiles(latencies),
+            }
+            for route, (latencies, errors) in sorted(routes.items())
+        },
+    }
+
+
+def regressions(current: dict, previous: dict, tolerance: float) -> list[str]:
+    failures = []
+
+    for route, stats in current["routes"].items():
+        if not (before := previous["routes"].get(route)):
+            continue
+
+        if stats["p95"] > before["p95"] * (1 + tolerance):
+            failures.append(
+                f"{route}: p95 {before['p95']:.1f}ms -> {stats['p95']:.1f}ms"
+            )
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost")
+    parser.add_argument("--manifest", default="org.json")
+    parser.add_argument("--mix", help="JSON file of scenario name to weight")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", default="results.json")
+    parser.add_argument("--compare", help="previous results to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.manifest) as file:
+        org = Org(json.load(file))
+
+    mix = MIX
+    if args.mix:
+        with open(args.mix) as file:
+            mix = json.load(file)
+
+    if unknown := set(mix) - set(SCENARIOS):
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    perWorker = [{} for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        futures = [
+            executor.submit(worker, args.base_url, org, mix, deadline, timings)
+            for timings in perWorker
+        ]
+        for future in futures:
+            future.result()
+
+    results = report(perWorker, time.perf_counter() - started, args)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    total = results["total"]
+    print(
+        f"{total['requests']} requests, {total['errors']} errors, "
+        f"{total['throughput']:.0f} req/s, p50={total['p50']:.1f}ms "
+        f"p95={total['p95']:.1f}ms p99={total['p99']:.1f}ms"
+    )
+
+    if args.compare:
+        with open(args.compare) as file:
+            failures = regressions(results, json.load(file), args.tolerance)
+
+        for failure in failures:
+            print(failure)
+
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
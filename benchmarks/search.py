@@ -0,0 +1,134 @@
+# Benchmarks GET /search's query path against a real mongod.
+#
+# Seeds a throwaway database with synthetic projects, milestones and tasks, builds
+# the text indexes and then times rankedDocuments for users that belong to each
+# of the --member-of project counts. Exits non-zero when a p95 latency is over
+# budget.
+#
+#   python -m benchmarks.search --tasks 1000000 --member-of 5 20 100 500
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from api.database import createIndexes
+from api.routers.search import rankedDocuments
+from api.schemas import User
+
+WORDS = [
+    "login", "signup", "button", "page", "api", "deploy", "release", "billing",
+    "invoice", "search", "index", "cache", "mobile", "android", "ios", "layout",
+    "email", "report", "export", "import", "dashboard", "chart", "filter", "sort",
+    "bug", "crash", "timeout", "latency", "database", "migration", "schema", "auth",
+]  # fmt: skip
+
+
+def sentence(length: int) -> str:
+    # Zipf-ish: earlier words are far more common, like a real backlog.
+    return " ".join(
+        WORDS[min(int(random.paretovariate(1.2)) - 1, len(WORDS) - 1)]
+        for _ in range(length)
+    )
+
+
+def seed(db, projects: int, tasks: int, batch: int = 10_000) -> list[str]:
+    for name in ("projects", "milestones", "tasks"):
+        db[name].drop()
+
+    projectIds = [ObjectId() for _ in range(projects)]
+    db.projects.insert_many(
+        [
+            {"_id": id, "name": sentence(2), "description": sentence(8)}
+            for id in projectIds
+        ]
+    )
+
+    milestoneIds = {}
+    for id in projectIds:
+        milestoneIds[str(id)] = [ObjectId() for _ in range(5)]
+        db.milestones.insert_many(
+            [
+                {
+                    "_id": milestoneId,
+                    "projectId": str(id),
+                    "name": sentence(3),
+                    "description": sentence(10),
+                }
+                for milestoneId in milestoneIds[str(id)]
+            ]
+        )
+
+    for start in range(0, tasks, batch):
+        documents = []
+        for _ in range(min(batch, tasks - start)):
+            projectId = str(random.choice(projectIds))
+            documents.append(
+                {
+                    "projectId": projectId,
+                    "milestoneId": str(random.choice(milestoneIds[projectId])),
+                    "name": sentence(4),
+                    "description": sentence(20),
+                }
+            )
+        db.tasks.insert_many(documents, ordered=False)
+
+    createIndexes(db)
+
+    return [str(id) for id in projectIds]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mongo-url", default="localhost")
+    parser.add_argument("--database", default="kraken_bench")
+    parser.add_argument("--projects", type=int, default=1000)
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--member-of", type=int, nargs="+", default=[20])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=50)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_url, 27017)[args.database]
+
+    if args.skip_seed:
+        projectIds = [str(p["_id"]) for p in db.projects.find({}, {"_id": 1})]
+    else:
+        started = time.perf_counter()
+        projectIds = seed(db, args.projects, args.tasks)
+        print(f"seeded {args.tasks} tasks in {time.perf_counter() - started:.1f}s")
+
+    overBudget = False
+    for memberOf in args.member_of:
+        user = User(
+            username="bench",
+            password="",
+            email="bench@bench.com",
+            joinedProjects=random.sample(projectIds, memberOf),
+        )
+
+        timings = []
+        for _ in range(args.queries):
+            query = " ".join(random.sample(WORDS, random.randint(1, 2)))
+
+            started = time.perf_counter()
+            rankedDocuments(db, query, user, args.limit, useTextSearch=True)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        quantiles = statistics.quantiles(timings, n=100)
+        p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+        print(f"member of {memberOf}: p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms")
+
+        overBudget |= p95 > args.budget_ms
+
+    sys.exit(1 if overBudget else 0)
+
+
+if __name__ == "__main__":
+    main()
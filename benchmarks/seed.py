@@ -0,0 +1,253 @@
+# Seeds a database with synthetic organisations for the load generator.
+#
+# Each org has users and projects owned by one of them and joined by some of the
+# others, with milestones, tasks with dependency graphs and sprints. Documents
+# are built from the api schemas so they match what the routers write, counters
+# are recomputed by the repair job and the indexes are created as on startup.
+# The ids and tokens the load generator needs are written to a JSON manifest.
+#
+#   python -m benchmarks.seed --orgs 10 --tasks-per-milestone 50 --output org.json
+
+import argparse
+import datetime
+import json
+import random
+import time
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from api.database import createIndexes
+from api.jobs.counters import repairTaskCounts
+from api.routers.users import createToken, hashPassword
+from api.schemas import (
+    BaseCreateableTask,
+    Milestone,
+    Priority,
+    Project,
+    Role,
+    Sprint,
+    Status,
+    Task,
+    User,
+)
+from api.versions import SCHEMA_VERSIONS
+from benchmarks.search import sentence
+
+PASSWORD = "bench"
+COLLECTIONS = ("users", "memberships", "projects", "milestones", "tasks", "sprints")
+
+
+def day(offset: int) -> datetime.datetime:
+    return datetime.datetime(2024, 1, 1) + datetime.timedelta(days=offset)
+
+
+def version(collection: str) -> dict:
+    return {"schemaVersion": SCHEMA_VERSIONS[collection]}
+
+
+def insert(collection, documents: list[dict], batch: int = 10_000):
+    for start in range(0, len(documents), batch):
+        collection.insert_many(documents[start : start + batch], ordered=False)
+
+
+def seedUsers(db, org: int, count: int, passwordHash: str) -> list[dict]:
+    users = []
+
+    for i in range(count):
+        id = ObjectId()
+        user = User(
+            username=f"org{org}-user{i}",
+            password=passwordHash,
+            email=f"org{org}-user{i}@bench.com",
+            token=createToken(str(id)),
+        ).model_dump(exclude={"id", "ownedProjects", "joinedProjects", "refreshToken"})
+        users.append({"_id": id, **user})
+
+    insert(db.users, users)
+
+    return users
+
+
+# Tasks only depend on earlier tasks of the same project, so the graph is a DAG
+# with `dependencies` edges per task on average.
+def seedProject(db, args, owner: dict, members: list[dict]) -> dict:
+    projectId = ObjectId()
+    project = Project(name=sentence(2), description=sentence(8))
+    db.projects.insert_one({"_id": projectId, **project.model_dump(exclude={"id"})})
+
+    db.memberships.insert_many(
+        [
+            {
+                "projectId": str(projectId),
+                "userId": str(owner["_id"]),
+                "role": Role.owner.value,
+            }
+        ]
+        + [
+            {
+                "projectId": str(projectId),
+                "userId": str(member["_id"]),
+                "role": Role.member.value,
+            }
+            for member in members
+        ]
+    )
+
+    usernames = [owner["username"]] + [member["username"] for member in members]
+    milestones, tasks = [], []
+
+    for m in range(args.milestones_per_project):
+        milestoneId = ObjectId()
+        milestoneTasks = []
+
+        for _ in range(args.tasks_per_milestone):
+            taskId = ObjectId()
+            dueDate = day(m * 14 + random.randint(0, 13))
+            dependencies = random.sample(
+                tasks, min(len(tasks), random.randint(0, args.dependencies * 2))
+            )
+            task = Task(
+                name=sentence(4),
+                description=sentence(20),
+                dueDate=dueDate,
+                priority=random.choice(list(Priority)),
+                status=random.choice(list(Status)),
+                assignedTo=random.choice(usernames),
+                projectId=str(projectId),
+                milestoneId=str(milestoneId),
+                dependentTasks=[str(dependency["_id"]) for dependency in dependencies],
+                qaTask=BaseCreateableTask(
+                    name=sentence(2),
+                    description=sentence(8),
+                    dueDate=dueDate,
+                    assignedTo=random.choice(usernames),
+                ),
+            )
+            tasks.append(
+                {"_id": taskId, **task.model_dump(exclude={"id"}), **version("tasks")}
+            )
+            milestoneTasks.append(str(taskId))
+
+        milestone = Milestone(
+            name=sentence(3),
+            description=sentence(10),
+            dueDate=day(m * 14 + 13),
+            projectId=str(projectId),
+            tasks=milestoneTasks,
+            dependentMilestones=[str(milestones[-1]["_id"])] if milestones else [],
+        )
+        milestones.append(
+            {
+                "_id": milestoneId,
+                **milestone.model_dump(exclude={"id"}),
+                **version("milestones"),
+            }
+        )
+
+    sprints = []
+    documents = {str(document["_id"]): document for document in milestones + tasks}
+    for s in range(args.sprints_per_project):
+        sprintMilestones = milestones[s :: args.sprints_per_project]
+        sprint = Sprint(
+            name=f"Sprint {s + 1}",
+            description=sentence(6),
+            startDate=day(s * 14),
+            endDate=day(s * 14 + 13),
+            projectId=str(projectId),
+            milestones=[str(milestone["_id"]) for milestone in sprintMilestones],
+            tasks=[
+                task
+                for milestone in sprintMilestones
+                for task in milestone["tasks"][: args.tasks_per_milestone // 2]
+            ],
+        )
+        sprintId = ObjectId()
+        sprints.append(
+            {
+                "_id": sprintId,
+                **sprint.model_dump(exclude={"id"}),
+                **version("sprints"),
+            }
+        )
+
+        for member in sprint.milestones + sprint.tasks:
+            documents[member]["sprintId"] = str(sprintId)
+
+    insert(db.milestones, milestones)
+    insert(db.tasks, tasks)
+    insert(db.sprints, sprints)
+
+    return {
+        "id": str(projectId),
+        "owner": str(owner["_id"]),
+        "members": [str(member["_id"]) for member in members],
+        "milestones": [str(milestone["_id"]) for milestone in milestones],
+        "tasks": [str(task["_id"]) for task in tasks],
+        "sprints": [str(sprint["_id"]) for sprint in sprints],
+    }
+
+
+def seed(db, args) -> dict:
+    for name in COLLECTIONS:
+        db[name].drop()
+
+    # bcrypt is slow on purpose, every synthetic user shares one hash.
+    passwordHash = hashPassword(PASSWORD)
+    manifest = {"password": PASSWORD, "users": [], "projects": []}
+
+    for org in range(args.orgs):
+        users = seedUsers(db, org, args.users_per_org, passwordHash)
+        manifest["users"] += [
+            {"id": str(u["_id"]), "username": u["username"], "token": u["token"]}
+            for u in users
+        ]
+
+        for _ in range(args.projects_per_org):
+            owner = random.choice(users)
+            members = random.sample(
+                [u for u in users if u is not owner],
+                min(args.members_per_project, len(users) - 1),
+            )
+            manifest["projects"].append(seedProject(db, args, owner, members))
+
+    repairTaskCounts(db)
+    createIndexes(db)
+
+    return manifest
+
+
+def addArguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--orgs", type=int, default=10)
+    parser.add_argument("--users-per-org", type=int, default=20)
+    parser.add_argument("--projects-per-org", type=int, default=5)
+    parser.add_argument("--members-per-project", type=int, default=8)
+    parser.add_argument("--milestones-per-project", type=int, default=6)
+    parser.add_argument("--tasks-per-milestone", type=int, default=50)
+    parser.add_argument("--sprints-per-project", type=int, default=3)
+    parser.add_argument("--dependencies", type=int, default=2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-url", default="localhost")
+    parser.add_argument("--database", default="kraken_bench")
+    parser.add_argument("--output", default="org.json")
+    addArguments(parser)
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_url, 27017)[args.database]
+
+    started = time.perf_counter()
+    manifest = seed(db, args)
+    print(
+        f"seeded {len(manifest['users'])} users and {len(manifest['projects'])} "
+        f"projects in {time.perf_counter() - started:.1f}s"
+    )
+
+    with open(args.output, "w") as file:
+        json.dump(manifest, file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Benchmarks how quickly a fresh worker can serve traffic.
+#
+# Every run starts a new interpreter, like a worker spun up by an autoscaler, and
+# times importing api.main and then the first authenticated request (lifespan
+# included) against mongomock. Exits non-zero when the median of either is over
+# budget.
+#
+#   python -m benchmarks.startup --runs 10 --import-budget-ms 2000
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+WORKER = """
+import json, time
+
+import mongomock
+
+started = time.perf_counter()
+
+from api.database import getDb
+from api.main import app
+
+imported = time.perf_counter()
+
+# The user is seeded straight into the database and left out of the timings, so
+# the timed request is the first one the worker serves.
+from api.routers.users import createToken
+
+db = mongomock.MongoClient().db
+id = db.users.insert_one(
+    {"username": "bench", "email": "bench@bench.com", "password": ""}
+).inserted_id
+token = createToken(str(id))
+db.users.update_one({"_id": id}, {"$set": {"token": token}})
+
+seeded = time.perf_counter()
+
+from fastapi.testclient import TestClient
+
+app.dependency_overrides[getDb] = lambda: db
+with TestClient(app) as client:
+    response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+
+served = time.perf_counter()
+
+print(json.dumps({
+    "import": (imported - started) * 1000,
+    "firstRequest": (imported - started + served - seeded) * 1000,
+}))
+"""
+
+
+def run() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER], capture_output=True, check=True, text=True
+    ).stdout
+
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--import-budget-ms", type=float, default=2000)
+    parser.add_argument("--first-request-budget-ms", type=float, default=2500)
+    args = parser.parse_args()
+
+    runs = [run() for _ in range(args.runs)]
+
+    importMs = statistics.median(run["import"] for run in runs)
+    firstRequestMs = statistics.median(run["firstRequest"] for run in runs)
+    print(f"import={importMs:.0f}ms first request={firstRequestMs:.0f}ms")
+
+    if importMs > args.import_budget_ms:
+        print(f"import is over the {args.import_budget_ms:.0f}ms budget")
+        sys.exit(1)
+
+    if firstRequestMs > args.first_request_budget_ms:
+        print(f"first request is over the {args.first_request_budget_ms:.0f}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Micro-benchmarks the User membership checks that run on every request.
+#
+# Each iteration builds a User, as getCurrentUser does per request, then makes a
+# number of access checks. "previous" concatenates ownedProjects + joinedProjects
+# and scans it on every check, "cached" uses the frozenset views on User.
+#
+#   python -m benchmarks.user --projects 500 --checks 20
+
+import argparse
+import timeit
+
+from bson import ObjectId
+
+from api.schemas import User
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--projects", type=int, default=500)
+    parser.add_argument("--checks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    owned = [str(ObjectId()) for _ in range(args.projects // 10)]
+    joined = [str(ObjectId()) for _ in range(args.projects - len(owned))]
+    # Half hits at the end of the list, half misses: the worst cases for a scan.
+    checks = joined[len(joined) - args.checks // 2 :] + [
+        str(ObjectId()) for _ in range(args.checks - args.checks // 2)
+    ]
+
+    def user():
+        return User(
+            username="bench",
+            password="",
+            email="bench@bench.com",
+            ownedProjects=owned,
+            joinedProjects=joined,
+        )
+
+    def previous():
+        u = user()
+        for id in checks:
+            id in u.ownedProjects + u.joinedProjects
+        u.ownedProjects + u.joinedProjects
+
+    def cached():
+        u = user()
+        for id in checks:
+            u.canAccess(id)
+        u.projects()
+
+    for name, fn in [("previous", previous), ("cached", cached)]:
+        seconds = timeit.timeit(fn, number=args.repeat)
+        print(f"{name:>8}: {seconds / args.repeat * 1e6:8.1f}us per request")
+
+
+if __name__ == "__main__":
+    main()